@@ -1,20 +1,28 @@
+from typing import AsyncGenerator, Optional
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from app.factory import chat_service
 from app.logic.chat_service import ChatService
 from app.logs.logger import get_logger
+from app.logs.tracing import Trace, Tracer
 from app.models.data_structures import ChatRequest
+from app.startup.documents.indexing_status import IndexingStatus
 
 logger = get_logger(__name__)
 
 
 class ChatRouter:
     def __init__(self, 
-                 chat_service: ChatService = Depends(chat_service)
+                 chat_service: ChatService = Depends(chat_service),
+                 indexing_status: Optional[IndexingStatus] = None,
+                 tracer: Optional[Tracer] = None
                  ):
         self.router = APIRouter()
         self.chat_service = chat_service
+        self.indexing_status = indexing_status or IndexingStatus()
+        # Samples chats for tracing; None disables tracing
+        self.tracer = tracer
         self.add_routes()
 
     async def _home(self):
@@ -25,23 +33,60 @@ class ChatRouter:
         """Health check endpoint"""
         return {"status": "healthy"}
 
+    async def _readiness_check(self) -> JSONResponse:
+        """Readiness endpoint, 503 until a consistent document index is available"""
+        status = self.indexing_status.to_dict()
+        return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
     async def _chat(self, chat_request: ChatRequest) -> StreamingResponse:
         """Chat endpoint that streams responses"""
+        trace = None
         try:
-            response = StreamingResponse(
-                self.chat_service.stream_chat(chat_request),
-                media_type="text/event-stream"
+            if self.tracer is not None:
+                trace = self.tracer.start_trace("chat", session_id=chat_request.session_id,
+                                                message_chars=len(chat_request.message))
+            if trace is None:
+                return StreamingResponse(
+                    self.chat_service.stream_chat(chat_request),
+                    media_type="text/event-stream"
+                )
+
+            # Run the pre-stream phases before sending headers, so their timings fit in Server-Timing
+            stream = self.chat_service.stream_chat(chat_request)
+            first = await anext(stream, None)
+            return StreamingResponse(
+                self._traced_stream(trace, first, stream),
+                media_type="text/event-stream",
+                headers={"Server-Timing": self._server_timing(trace)}
             )
-            return response
 
         except Exception:
+            if trace is not None:
+                trace.finish()
             logger.exception("Unexpected error during chat")
             raise HTTPException(
                 status_code=500,
                 detail="An internal server error occurred."
             )
 
+    async def _traced_stream(self, trace: Trace, first: Optional[str],
+                             stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Stream the response, finishing the trace once the last chunk is sent"""
+        try:
+            if first is not None:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+        finally:
+            trace.finish()
+
+    def _server_timing(self, trace: Trace) -> str:
+        phases = trace.server_timing()
+        elapsed = trace.root.elapsed_ms()
+        return f'{phases + ", " if phases else ""}prestream;dur={elapsed:.1f}, trace;desc="{trace.trace_id}"'
+
     def add_routes(self):
         self.router.add_api_route("/", self._home, methods=["GET"])
         self.router.add_api_route("/health", self._health_check, methods=["GET"])
+        self.router.add_api_route("/ready", self._readiness_check, methods=["GET"])
         self.router.add_api_route("/chat", self._chat, methods=["POST"])
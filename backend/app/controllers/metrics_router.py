@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from app.logs.metrics import render_metrics
+
+
+class MetricsRouter:
+    """Serves the Prometheus metrics; the rate limiter exempts this path so scrapes are never throttled"""
+
+    def __init__(self):
+        self.router = APIRouter()
+        self.add_routes()
+
+    async def _metrics(self) -> Response:
+        """Metrics endpoint in the Prometheus text format"""
+        return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+    def add_routes(self):
+        self.router.add_api_route("/metrics", self._metrics, methods=["GET"], include_in_schema=False)
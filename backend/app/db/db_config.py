@@ -1,5 +1,37 @@
+from typing import Literal
 from urllib.parse import quote_plus
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+
+class VectorIndexConfig(BaseModel):
+    """ANN index settings for documentchunk.embedding"""
+    index_type: Literal["hnsw", "ivfflat", "none"] = "hnsw"
+    distance: Literal["cosine", "inner_product", "l2"] = "cosine"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    ef_search: int = 40  # HNSW candidate list size per query
+    lists: int = 100  # IVFFlat clusters, roughly rows / 1000
+    probes: int = 10  # IVFFlat clusters scanned per query
+
+    @property
+    def operator(self) -> str:
+        """Distance operator the query orders by; must match the index operator class"""
+        return {"cosine": "<=>", "inner_product": "<#>", "l2": "<->"}[self.distance]
+
+    @property
+    def operator_class(self) -> str:
+        return {"cosine": "vector_cosine_ops", "inner_product": "vector_ip_ops", "l2": "vector_l2_ops"}[self.distance]
+
+    @property
+    def index_name(self) -> str:
+        return f"documentchunk_embedding_{self.index_type}_{self.distance}_idx"
+
+    def similarity_sql(self, distance_sql: str) -> str:
+        """Turn the operator's distance into a higher-is-better similarity score"""
+        if self.distance == "cosine":
+            return f"1 - ({distance_sql})"
+        # <#> returns the negative inner product, <-> a plain distance
+        return f"-({distance_sql})"
 
 
 class PostgresConfig(BaseModel):
@@ -8,7 +40,19 @@ class PostgresConfig(BaseModel):
     db_name: str
     user: str
     password: str
+    # Run queries on an asyncpg-backed engine instead of the blocking psycopg2 pool
+    async_engine: bool = True
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: int = 30  # seconds to wait for a free pooled connection
+    pool_recycle: int = 1800  # seconds before a pooled connection is replaced
+    connect_timeout: int = 10  # seconds to wait when opening a new connection
+    vector_index: VectorIndexConfig = Field(default_factory=VectorIndexConfig)
 
     def get_connection_url(self) -> str:
         encoded_password = quote_plus(self.password)
-        return f"postgresql://{self.user}:{encoded_password}@{self.server}:{self.port}/{self.db_name}"
\ No newline at end of file
+        return f"postgresql://{self.user}:{encoded_password}@{self.server}:{self.port}/{self.db_name}"
+
+    def get_async_connection_url(self) -> str:
+        encoded_password = quote_plus(self.password)
+        return f"postgresql+asyncpg://{self.user}:{encoded_password}@{self.server}:{self.port}/{self.db_name}"
@@ -1,29 +1,81 @@
-from typing import List
-from sqlmodel import Session, SQLModel, create_engine
-from contextlib import contextmanager
-from datetime import datetime
+import json
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from sqlmodel import Session, SQLModel, create_engine, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
 from app.db.db_config import PostgresConfig
-from app.models.data_structures import ChatLog, DocumentChunk
+from app.models.data_structures import ChatLog, Document, DocumentChunk
 from app.logs.logger import get_logger
-from sqlalchemy import text
+from app.logs.tracing import span
+from sqlalchemy import bindparam, event, insert, or_, text
+from pgvector.sqlalchemy import Vector
+from pgvector.utils import Vector as VectorValue
 import numpy as np
 
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
+# Created as timestamp without time zone by earlier versions; the app writes timezone-aware
+# datetimes, which asyncpg only binds to timestamptz
+TIMESTAMPTZ_COLUMNS = (
+    ("chatlog", "timestamp"), ("chatlog", "created_at"),
+    ("documentchunk", "created_at"), ("document", "updated_at"),
+)
+
+
+def _encode_vector(value) -> bytes:
+    """Binary vector encoder that also accepts the text form SQLAlchemy's Vector type binds"""
+    if isinstance(value, str):
+        value = VectorValue.from_text(value)
+    return VectorValue._to_db_binary(value)
+
+
+def _register_vector_codec(dbapi_connection, connection_record) -> None:
+    """Send and receive vectors in binary on asyncpg connections, which COPY requires"""
+    dbapi_connection.run_async(lambda connection: connection.set_type_codec(
+        'vector',
+        encoder=_encode_vector,
+        decoder=VectorValue._from_db_binary,
+        format='binary'
+    ))
+
+
 class DatabaseHandler:
     def __init__(self, db_config: PostgresConfig):
         self.config = db_config
+        # The sync engine runs the startup DDL, and every query when async mode is off
         self.engine = create_engine(
             self.config.get_connection_url(),
-            pool_size=5,
-            max_overflow=10,
-            pool_timeout=30,
-            pool_recycle=1800,
+            pool_size=self.config.pool_size,
+            max_overflow=self.config.max_overflow,
+            pool_timeout=self.config.pool_timeout,
+            pool_recycle=self.config.pool_recycle,
             echo=False,
             pool_pre_ping=True,
+            connect_args={"connect_timeout": self.config.connect_timeout},
         )
+        self.async_engine = None
+        if self.config.async_engine:
+            self.async_engine = create_async_engine(
+                self.config.get_async_connection_url(),
+                pool_size=self.config.pool_size,
+                max_overflow=self.config.max_overflow,
+                pool_timeout=self.config.pool_timeout,
+                pool_recycle=self.config.pool_recycle,
+                echo=False,
+                pool_pre_ping=True,
+                connect_args={"timeout": self.config.connect_timeout},
+            )
+            event.listen(self.async_engine.sync_engine, "connect", _register_vector_codec)
         self.__setup_vector_extension()
         self.__setup_database()
+        self.__setup_vector_index()
+        if self.async_engine is not None:
+            # Queries go through the async pool from here on, release the setup connection
+            self.engine.dispose()
 
     def __setup_vector_extension(self):
         """Create the vector extension if it doesn't exist"""
@@ -38,10 +90,88 @@ class DatabaseHandler:
     def __setup_database(self):
         try:
             SQLModel.metadata.create_all(self.engine)
+            # create_all does not add columns to tables created by earlier versions
+            with self.engine.begin() as connection:
+                connection.execute(text('ALTER TABLE documentchunk ADD COLUMN IF NOT EXISTS chunk_hash VARCHAR'))
+                connection.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_documentchunk_chunk_hash ON documentchunk (chunk_hash)'
+                ))
+                connection.execute(text(
+                    'ALTER TABLE documentchunk ADD COLUMN IF NOT EXISTS document_id INTEGER '
+                    'REFERENCES document (id) ON DELETE CASCADE'
+                ))
+                connection.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_documentchunk_document_id ON documentchunk (document_id)'
+                ))
+                # Chunks are still replaced and deleted by source, including rows from before the manifest
+                connection.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_documentchunk_source ON documentchunk ((doc_metadata->>'source'))"
+                ))
+                for table, column in TIMESTAMPTZ_COLUMNS:
+                    # Stored values are UTC; only naive columns are rewritten, so this runs once
+                    connection.execute(text(f"""
+                        DO $$ BEGIN
+                            IF EXISTS (
+                                SELECT 1 FROM information_schema.columns
+                                WHERE table_schema = current_schema() AND table_name = '{table}'
+                                  AND column_name = '{column}' AND data_type = 'timestamp without time zone'
+                            ) THEN
+                                ALTER TABLE {table} ALTER COLUMN "{column}" TYPE TIMESTAMPTZ
+                                    USING "{column}" AT TIME ZONE 'UTC';
+                            END IF;
+                        END $$;
+                    """))
         except Exception as e:
             logger.error(f"Failed to initialize database: {str(e)}")
             raise RuntimeError(f"Failed to initialize database: {str(e)}")
 
+    def __setup_vector_index(self):
+        """
+        Create the configured ANN index on documentchunk.embedding and drop any
+        embedding index left over from a different index type or distance.
+        """
+        index_config = self.config.vector_index
+        try:
+            with self.get_session() as session:
+                existing = session.exec(text("""
+                    SELECT indexname FROM pg_indexes
+                    WHERE tablename = 'documentchunk' AND indexname LIKE 'documentchunk_embedding_%_idx';
+                """)).all()
+                for (index_name,) in existing:
+                    if index_name != index_config.index_name:
+                        logger.info(f"Dropping stale vector index {index_name}")
+                        session.exec(text(f'DROP INDEX IF EXISTS "{index_name}"'))
+
+                if index_config.index_type == "hnsw":
+                    session.exec(text(f"""
+                        CREATE INDEX IF NOT EXISTS {index_config.index_name}
+                        ON documentchunk USING hnsw (embedding {index_config.operator_class})
+                        WITH (m = {int(index_config.hnsw_m)}, ef_construction = {int(index_config.hnsw_ef_construction)});
+                    """))
+                elif index_config.index_type == "ivfflat":
+                    session.exec(text(f"""
+                        CREATE INDEX IF NOT EXISTS {index_config.index_name}
+                        ON documentchunk USING ivfflat (embedding {index_config.operator_class})
+                        WITH (lists = {int(index_config.lists)});
+                    """))
+        except Exception as e:
+            # Search still works without the index, only slower
+            logger.error(f"Failed to create vector index: {str(e)}")
+
+    async def refresh_vector_index(self) -> None:
+        """
+        Rebuild an IVFFlat index after the corpus changed. IVFFlat centroids are
+        computed at build time, so an index built on an empty table recalls poorly.
+        HNSW indexes are maintained incrementally and need no refresh.
+        """
+        index_config = self.config.vector_index
+        if index_config.index_type != "ivfflat":
+            return
+        try:
+            await self._run(lambda session: session.exec(text(f"REINDEX INDEX {index_config.index_name}")))
+        except Exception as e:
+            logger.error(f"Failed to rebuild vector index: {str(e)}")
+
     @contextmanager
     def get_session(self):
         session = Session(self.engine)
@@ -54,6 +184,37 @@ class DatabaseHandler:
         finally:
             session.close()
 
+    @asynccontextmanager
+    async def get_async_session(self):
+        session = AsyncSession(self.async_engine, expire_on_commit=False)
+        try:
+            yield session
+            await session.commit()
+        except Exception as e:
+            await session.rollback()
+            raise e
+        finally:
+            await session.close()
+
+    async def _run(self, operation: Callable[[Session], T]) -> T:
+        """
+        Run a session-bound operation without blocking the event loop in async mode.
+        The async session drives the operation through its greenlet bridge, so the same
+        sync-style code talks to asyncpg; with async mode off it runs on the sync pool.
+        """
+        if self.async_engine is None:
+            with self.get_session() as session:
+                return operation(session)
+
+        async with self.get_async_session() as session:
+            return await session.run_sync(operation)
+
+    async def close(self) -> None:
+        """Dispose of the connection pools"""
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        self.engine.dispose()
+
     async def log_chat(self, user_message: str, assistant_message: str, session_id: str, timestamp: datetime) -> None:
         """
         Logs chat interactions to the database with session ID
@@ -66,12 +227,22 @@ class DatabaseHandler:
         )
         
         try:
-            with self.get_session() as session:
-                session.add(chat_log)
+            with span("db.log_chat"):
+                await self._run(lambda session: session.add(chat_log))
         except Exception as e:
             logger.error(f"Failed to log chat to database: {str(e)}")
             raise RuntimeError(f"Failed to log chat to database: {str(e)}")
 
+    async def log_chats(self, chat_logs: List[ChatLog]) -> None:
+        """Write a batch of chat logs with one multi-row INSERT and a single commit"""
+        if not chat_logs:
+            return
+        rows = [chat_log.model_dump(exclude={'id'}) for chat_log in chat_logs]
+        try:
+            await self._run(lambda session: session.execute(insert(ChatLog.__table__), rows))
+        except Exception as e:
+            logger.error(f"Failed to log chats to database: {str(e)}")
+            raise RuntimeError(f"Failed to log chats to database: {str(e)}")
 
     async def store_document_chunk(self, content: str, embedding: List[float], metadata: dict):
         """Store a document chunk using the DocumentChunk ORM object."""
@@ -81,50 +252,248 @@ class DatabaseHandler:
             doc_metadata=metadata
         )
         
-        with self.get_session() as session:
-            session.add(chunk)
+        await self._run(lambda session: session.add(chunk))
     
+    async def replace_document_chunks(self, file_path: str, chunks: List[dict], document: Optional[dict] = None) -> None:
+        """
+        Bring a document's stored chunks in line with `chunks` in a single transaction, so
+        readers never see a half-indexed document. Each chunk is a dict with content,
+        chunk_hash, embedding and metadata. Rows whose chunk_hash is still present are kept,
+        rows for removed chunks are deleted and only new chunks are written. On asyncpg the
+        new rows are written with a binary COPY, otherwise with a multi-row INSERT.
+        When `document` holds the file's size, mtime, content_hash and embedding_model,
+        its manifest row is upserted in the same transaction and the chunks point at it.
+        If the manifest records another embedding model, no rows are kept: every chunk is
+        written with its new embedding, so one document never mixes two embedding spaces.
+        """
+        new_hashes = list({chunk['chunk_hash'] for chunk in chunks})
+        metadata = chunks[0]['metadata'] if chunks else {}
+        existing_query = text("""
+            SELECT chunk_hash FROM documentchunk
+            WHERE doc_metadata->>'source' = :file_path
+            FOR UPDATE;
+        """)
+        model_query = text("""
+            SELECT embedding_model FROM document
+            WHERE source = :file_path
+            FOR UPDATE;
+        """)
+        upsert_document_query = text("""
+            INSERT INTO document (source, size, mtime, content_hash, chunk_count, embedding_model, updated_at)
+            VALUES (:file_path, :size, :mtime, :content_hash, :chunk_count, :embedding_model, :updated_at)
+            ON CONFLICT (source) DO UPDATE SET
+                size = EXCLUDED.size,
+                mtime = EXCLUDED.mtime,
+                content_hash = EXCLUDED.content_hash,
+                chunk_count = EXCLUDED.chunk_count,
+                embedding_model = EXCLUDED.embedding_model,
+                updated_at = EXCLUDED.updated_at
+            RETURNING id;
+        """)
+        delete_query = text("""
+            DELETE FROM documentchunk 
+            WHERE doc_metadata->>'source' = :file_path
+              AND (chunk_hash IS NULL OR NOT (chunk_hash = ANY(:hashes)));
+        """)
+        update_query = text("""
+            UPDATE documentchunk
+            SET doc_metadata = CAST(:metadata AS jsonb), document_id = COALESCE(:document_id, document_id)
+            WHERE doc_metadata->>'source' = :file_path;
+        """)
+        created_at = datetime.now(timezone.utc)
+
+        def replace(session: Session) -> None:
+            existing = {row[0] for row in session.exec(existing_query, params={'file_path': file_path}).all()}
+            keep_hashes = new_hashes
+            document_id = None
+            if document is not None:
+                stored = session.exec(model_query, params={'file_path': file_path}).first()
+                if stored is not None and stored[0] != document.get('embedding_model'):
+                    # Re-embedded with another model: the stored vectors are in the old space
+                    existing, keep_hashes = set(), []
+                document_id = session.exec(upsert_document_query, params={
+                    'file_path': file_path,
+                    'size': document['size'],
+                    'mtime': document['mtime'],
+                    'content_hash': document['content_hash'],
+                    'chunk_count': len(chunks),
+                    'embedding_model': document.get('embedding_model'),
+                    'updated_at': created_at
+                }).one()[0]
+            session.exec(delete_query, params={'file_path': file_path, 'hashes': keep_hashes})
+            if not chunks:
+                return
+            # Kept rows pick up the new document-level metadata, e.g. the content hash
+            session.exec(update_query, params={
+                'file_path': file_path, 'metadata': json.dumps(metadata), 'document_id': document_id
+            })
+
+            new_chunks, seen = [], set(existing)
+            for chunk in chunks:
+                if chunk['chunk_hash'] not in seen:
+                    seen.add(chunk['chunk_hash'])
+                    new_chunks.append(chunk)
+            if not new_chunks:
+                return
+
+            if self.async_engine is not None:
+                records = [(
+                    document_id,
+                    chunk['content'],
+                    np.asarray(chunk['embedding'], dtype=np.float32),
+                    chunk['chunk_hash'],
+                    json.dumps(chunk['metadata']),
+                    created_at
+                ) for chunk in new_chunks]
+                # The COPY shares the connection, and so the transaction, of the DELETE
+                session.connection().connection.dbapi_connection.run_async(
+                    lambda connection: connection.copy_records_to_table(
+                        'documentchunk',
+                        records=records,
+                        columns=['document_id', 'content', 'embedding', 'chunk_hash', 'doc_metadata', 'created_at']
+                    )
+                )
+            else:
+                session.execute(insert(DocumentChunk.__table__), [{
+                    'document_id': document_id,
+                    'content': chunk['content'],
+                    'embedding': chunk['embedding'],
+                    'chunk_hash': chunk['chunk_hash'],
+                    'doc_metadata': chunk['metadata'],
+                    'created_at': created_at
+                } for chunk in new_chunks])
+
+        try:
+            await self._run(replace)
+        except Exception as e:
+            logger.error(f"Failed to replace document chunks: {str(e)}")
+            raise RuntimeError(f"Failed to replace document chunks: {str(e)}")
+
+    async def get_embeddings_by_hash(self, chunk_hashes: List[str],
+                                     embedding_model: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Look up stored embeddings for chunk texts that were embedded before, in any document.
+        With `embedding_model`, chunks of documents indexed with another model are ignored.
+        """
+        if not chunk_hashes:
+            return {}
+        query = (
+            select(DocumentChunk.chunk_hash, DocumentChunk.embedding)
+            .where(DocumentChunk.chunk_hash.in_(chunk_hashes))
+            .distinct(DocumentChunk.chunk_hash)
+        )
+        if embedding_model is not None:
+            query = query.outerjoin(Document, DocumentChunk.document_id == Document.id).where(
+                or_(Document.embedding_model == embedding_model, DocumentChunk.document_id.is_(None))
+            )
+        try:
+            rows = await self._run(lambda session: session.exec(query).all())
+            return {chunk_hash: embedding for chunk_hash, embedding in rows}
+        except Exception as e:
+            logger.error(f"Failed to look up stored embeddings: {str(e)}")
+            return {}
+
     async def search_similar_chunks(self, query_embedding: List[float], limit: int) -> List[DocumentChunk]:
-        """Find the top similar document chunks using cosine similarity without filtering by threshold."""
-        query = text("""
+        """
+        Find the top similar document chunks without filtering by threshold.
+        Orders by the bare distance operator of the configured index so that
+        Postgres can answer the ORDER BY ... LIMIT with an index scan.
+        """
+        index_config = self.config.vector_index
+        distance = f"embedding {index_config.operator} CAST(:embedding AS vector)"
+        query = text(f"""
             SELECT 
                 content, 
                 doc_metadata,
-                1 - (embedding <#> CAST(:embedding AS vector)) as similarity
+                {index_config.similarity_sql(distance)} as similarity
             FROM documentchunk
-            ORDER BY similarity DESC
+            ORDER BY {distance}
             LIMIT :limit;
-        """)
+        """).bindparams(bindparam('embedding', type_=Vector()))
+
+        def search(session: Session):
+            # Search tunables only apply to this transaction
+            if index_config.index_type == "hnsw":
+                session.exec(text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                             params={'value': str(index_config.ef_search)})
+            elif index_config.index_type == "ivfflat":
+                session.exec(text("SELECT set_config('ivfflat.probes', :value, true)"),
+                             params={'value': str(index_config.probes)})
+            return session.exec(
+                query,
+                params={
+                    'embedding': np.array(query_embedding).tolist(),
+                    'limit': limit
+                }
+            ).all()
 
         try:
-            with self.get_session() as session:
-                results = session.exec(
-                    query,
-                    params={
-                        'embedding': np.array(query_embedding).tolist(),
-                        'limit': limit
-                    }
-                )
-                return results.all()
-                
+            with span("db.search_similar_chunks", index_type=index_config.index_type, limit=limit) as search_span:
+                rows = await self._run(search)
+                search_span.set(rows=len(rows))
+            return rows
+
         except Exception as e:
             logger.exception("Error in search_similar_chunks")
             return []
 
+    async def get_all_chunks(self) -> List[Tuple[str, dict, np.ndarray]]:
+        """Fetch content, metadata and embedding of every chunk, e.g. to export an in-memory index."""
+        query = select(DocumentChunk.content, DocumentChunk.doc_metadata, DocumentChunk.embedding)
+        return [tuple(row) for row in await self._run(lambda session: session.exec(query).all())]
+
+    async def get_document_manifest(self) -> Dict[str, Document]:
+        """Fetch the manifest entry of every indexed document in one query, keyed by source."""
+        def load(session: Session) -> Dict[str, Document]:
+            documents = session.exec(select(Document)).all()
+            # Detach so the entries stay readable after the session commits
+            session.expunge_all()
+            return {document.source: document for document in documents}
+
+        try:
+            return await self._run(load)
+        except Exception as e:
+            logger.error(f"Failed to load document manifest: {str(e)}")
+            return {}
+
+    async def update_document_stat(self, file_path: str, size: int, mtime: float) -> None:
+        """Record a new size and mtime for a document whose content did not change, e.g. after a touch."""
+        query = text("""
+            UPDATE document SET size = :size, mtime = :mtime
+            WHERE source = :file_path;
+        """)
+        try:
+            await self._run(
+                lambda session: session.exec(query, params={'file_path': file_path, 'size': size, 'mtime': mtime})
+            )
+        except Exception as e:
+            logger.error(f"Failed to update document stat: {str(e)}")
+
+    async def has_chunks(self) -> bool:
+        """Check if any document chunk is stored, i.e. whether retrieval has anything to search."""
+        query = text("SELECT EXISTS (SELECT 1 FROM documentchunk);")
+
+        try:
+            result = await self._run(lambda session: session.exec(query).first())
+            return result[0] if result else False
+        except Exception as e:
+            logger.error(f"Failed to check for document chunks: {str(e)}")
+            return False
+
     async def document_exists(self, file_path: str) -> bool:
-        """Check if document chunks exist for a given file path."""
+        """Check if a document is in the manifest for a given file path."""
         query = text("""
             SELECT EXISTS (
-                SELECT 1 FROM documentchunk 
-                WHERE doc_metadata->>'source' = :file_path
-                LIMIT 1
+                SELECT 1 FROM document
+                WHERE source = :file_path
             );
         """)
         
         try:
-            with self.get_session() as session:
-                result = session.exec(query, params={'file_path': file_path}).first()
-                return result[0] if result else False
+            result = await self._run(
+                lambda session: session.exec(query, params={'file_path': file_path}).first()
+            )
+            return result[0] if result else False
         except Exception as e:
             logger.error(f"Failed to check document existence: {str(e)}")
             return False
@@ -132,32 +501,39 @@ class DatabaseHandler:
     async def get_document_hash(self, file_path: str) -> str:
         """Get the stored content hash for a document."""
         query = text("""
-            SELECT doc_metadata->>'content_hash'
-            FROM documentchunk 
-            WHERE doc_metadata->>'source' = :file_path
-            LIMIT 1;
+            SELECT content_hash
+            FROM document
+            WHERE source = :file_path;
         """)
         
         try:
-            with self.get_session() as session:
-                result = session.exec(query, params={'file_path': file_path}).first()
-                return result[0] if result else None
+            result = await self._run(
+                lambda session: session.exec(query, params={'file_path': file_path}).first()
+            )
+            return result[0] if result else None
         except Exception as e:
             logger.error(f"Failed to get document hash: {str(e)}")
             return None
 
     async def delete_document_chunks(self, file_path: str) -> bool:
-        """Delete all chunks for a given document."""
+        """Delete all chunks and the manifest entry for a given document."""
         query = text("""
             DELETE FROM documentchunk 
             WHERE doc_metadata->>'source' = :file_path;
         """)
+        document_query = text("""
+            DELETE FROM document
+            WHERE source = :file_path;
+        """)
         
+        def delete(session: Session) -> None:
+            session.exec(query, params={'file_path': file_path})
+            session.exec(document_query, params={'file_path': file_path})
+            session.commit()
+
         try:
-            with self.get_session() as session:
-                session.exec(query, params={'file_path': file_path})
-                session.commit()
-                return True
+            await self._run(delete)
+            return True
         except Exception as e:
             logger.error(f"Failed to delete document chunks: {str(e)}")
             return False
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import json
+import uuid
+import asyncio
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.db.db_handler import DatabaseHandler
+from app.logs.logger import get_logger
+from app.models.data_structures import RetrievedChunk
+
+logger = get_logger(__name__)
+
+
+class MemoryVectorIndex:
+    """
+    Read-only, memory-mapped copy of the chunk embeddings used as a retrieval backend.
+
+    Postgres stays the source of truth: export() snapshots every chunk into a float32
+    matrix file plus a JSON sidecar, then atomically swaps manifest.json to point at
+    the new generation. Each worker maps the matrix read-only, so the page cache is
+    shared between processes, and picks up a new generation on the next search.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, index_dir: str, fallback: Optional[DatabaseHandler] = None):
+        self.index_dir = Path(index_dir)
+        self.fallback = fallback
+        self._manifest_version: Optional[Tuple[int, int]] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._chunks: List[dict] = []
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.index_dir / self.MANIFEST
+
+    def exists(self) -> bool:
+        return self.manifest_path.exists()
+
+    async def search_similar_chunks(self, query_embedding: List[float], limit: int) -> List[RetrievedChunk]:
+        """Find the top chunks by cosine similarity with a vectorized top-k over the mapped matrix"""
+        try:
+            self._reload_if_changed()
+        except Exception as e:
+            logger.error(f"Failed to load memory vector index: {str(e)}")
+
+        if self._matrix is None:
+            if self.fallback is not None:
+                return await self.fallback.search_similar_chunks(query_embedding, limit)
+            return []
+
+        if not len(self._chunks) or limit <= 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self._matrix @ query
+        k = min(limit, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            RetrievedChunk(
+                content=self._chunks[i]["content"],
+                doc_metadata=self._chunks[i]["doc_metadata"],
+                similarity=float(scores[i])
+            )
+            for i in top
+        ]
+
+    def _reload_if_changed(self) -> None:
+        """Map the current generation if manifest.json has been swapped since the last load"""
+        try:
+            stat = self.manifest_path.stat()
+        except FileNotFoundError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._manifest_version:
+            return
+
+        manifest = json.loads(self.manifest_path.read_text())
+        rows, dims = manifest["rows"], manifest["dims"]
+        if rows:
+            matrix = np.memmap(self.index_dir / manifest["matrix"], dtype=np.float32, mode="r", shape=(rows, dims))
+        else:
+            matrix = np.empty((0, dims), dtype=np.float32)
+        chunks = json.loads((self.index_dir / manifest["chunks"]).read_text())
+
+        self._matrix, self._chunks, self._manifest_version = matrix, chunks, version
+        logger.info(f"Loaded memory vector index generation {manifest['generation']} with {rows} chunks")
+
+    async def export(self, db_handler: DatabaseHandler) -> None:
+        """Snapshot every chunk from Postgres into a new index generation"""
+        rows = await db_handler.get_all_chunks()
+        await asyncio.to_thread(self._write_generation, rows)
+
+    def _write_generation(self, rows: List[Tuple[str, dict, np.ndarray]]) -> None:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        generation = uuid.uuid4().hex
+        matrix_name, chunks_name = f"embeddings-{generation}.f32", f"chunks-{generation}.json"
+
+        matrix = np.asarray([embedding for _, _, embedding in rows], dtype=np.float32)
+        dims = matrix.shape[1] if matrix.ndim == 2 else 0
+        if dims:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.where(norms == 0, 1, norms)
+        matrix.tofile(self.index_dir / matrix_name)
+        (self.index_dir / chunks_name).write_text(json.dumps(
+            [{"content": content, "doc_metadata": metadata} for content, metadata, _ in rows]
+        ))
+
+        manifest = {
+            "generation": generation,
+            "rows": len(rows),
+            "dims": dims,
+            "matrix": matrix_name,
+            "chunks": chunks_name,
+        }
+        tmp_manifest = self.index_dir / f"{self.MANIFEST}.{generation}.tmp"
+        tmp_manifest.write_text(json.dumps(manifest))
+        os.replace(tmp_manifest, self.manifest_path)
+        logger.info(f"Exported {len(rows)} chunks to memory vector index generation {generation}")
+
+        # Workers still mapping an older generation keep their pages after the unlink
+        for path in self.index_dir.iterdir():
+            if path.name.startswith(("embeddings-", "chunks-")) and generation not in path.name:
+                path.unlink(missing_ok=True)
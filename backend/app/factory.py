@@ -1,14 +1,29 @@
 from functools import lru_cache
+from typing import Optional
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.db.db_handler import DatabaseHandler, PostgresConfig
-from openai import OpenAI
+from app.db.db_config import VectorIndexConfig
+from app.db.memory_index import MemoryVectorIndex
+from openai import AsyncOpenAI
 from app.logic.chat_service import ChatService
+from app.logs import metrics
+from app.logs.tracing import JsonlTraceExporter, OtlpHttpTraceExporter, Tracer
+from app.logic.chat_log_writer import ChatLogWriter
+from app.logic.prompt_assembler import PromptAssembler
 from langchain_openai import OpenAIEmbeddings
 from app.logic.document_indexer import DocumentIndexer
+from app.logic.embedding_cache import EmbeddingCache
+from app.logic.embedding_pipeline import EmbeddingPipeline
+from app.logic.embedding_store import EmbeddingStore
+from app.logic.response_cache import SemanticResponseCache
+from app.logic.session_store import LlmSummarizer, SessionStore, extractive_summarizer
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from app.startup.documents.indexing_status import IndexingStatus
 from app.middleware.rate_limiter import RateLimiter
+from app.middleware.local_rate_limit import LocalRateLimitTier
 from app.middleware.rate_limit_middleware import RateLimitMiddleware
 from slowapi import Limiter
 from slowapi.util import get_remote_address
@@ -39,13 +54,45 @@ def get_db_config() -> PostgresConfig:
         port=int(os.getenv("POSTGRES_PORT", "5432")),
         db_name=os.getenv("POSTGRES_DB"),
         user=os.getenv("POSTGRES_USER"),
-        password=os.getenv("POSTGRES_PASSWORD")
+        password=os.getenv("POSTGRES_PASSWORD"),
+        async_engine=os.getenv("POSTGRES_ASYNC_ENGINE", "true").lower() == "true",
+        pool_size=int(os.getenv("POSTGRES_POOL_SIZE", "5")),
+        max_overflow=int(os.getenv("POSTGRES_MAX_OVERFLOW", "10")),
+        pool_timeout=int(os.getenv("POSTGRES_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv("POSTGRES_POOL_RECYCLE", "1800")),
+        connect_timeout=int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "10")),
+        vector_index=get_vector_index_config()
+    )
+
+def get_vector_index_config() -> VectorIndexConfig:
+    """Creates ANN index configuration from environment variables"""
+    return VectorIndexConfig(
+        index_type=os.getenv("VECTOR_INDEX_TYPE", "hnsw"),
+        distance=os.getenv("VECTOR_DISTANCE", "cosine"),
+        hnsw_m=int(os.getenv("VECTOR_HNSW_M", "16")),
+        hnsw_ef_construction=int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64")),
+        ef_search=int(os.getenv("VECTOR_HNSW_EF_SEARCH", "40")),
+        lists=int(os.getenv("VECTOR_IVFFLAT_LISTS", "100")),
+        probes=int(os.getenv("VECTOR_IVFFLAT_PROBES", "10"))
     )
 
 @lru_cache()
 def database_handler() -> DatabaseHandler:
     """Creates and caches database handler instance"""
-    return DatabaseHandler(get_db_config())
+    handler = DatabaseHandler(get_db_config())
+    # Pool gauges follow whichever engine serves the queries
+    metrics.instrument_pool(handler.async_engine.sync_engine if handler.async_engine is not None else handler.engine)
+    return handler
+
+@lru_cache()
+def memory_index() -> Optional[MemoryVectorIndex]:
+    """Creates and caches the memory-mapped retrieval index, or None when retrieval uses Postgres"""
+    if os.getenv("RETRIEVAL_BACKEND", "postgres") != "memory":
+        return None
+    return MemoryVectorIndex(
+        index_dir=os.getenv("MEMORY_INDEX_DIR", "/tmp/portfolio-vector-index"),
+        fallback=database_handler()
+    )
 
 @lru_cache()
 def redis_client() -> Redis:
@@ -53,6 +100,12 @@ def redis_client() -> Redis:
     redis_url = os.getenv("REDIS_URL")
     return Redis.from_url(redis_url, decode_responses=True)
 
+@lru_cache()
+def async_redis_client() -> AsyncRedis:
+    """Creates and caches a binary-safe async Redis client instance"""
+    redis_url = os.getenv("REDIS_URL")
+    return AsyncRedis.from_url(redis_url)
+
 @lru_cache()
 def create_limiter(redis_client: Redis) -> Limiter:
     """Creates and caches Limiter instance"""
@@ -67,18 +120,30 @@ def create_limiter(redis_client: Redis) -> Limiter:
 @lru_cache()
 def rate_limiter() -> RateLimiter:
     """Creates and caches RateLimiter instance"""
-    redis = redis_client()
     return RateLimiter(
-        redis_client=redis,
-        limiter=create_limiter(redis),
+        redis_client=async_redis_client(),
+        limiter=create_limiter(redis_client()),
         global_rate=os.getenv("GLOBAL_RATE_LIMIT"),
-        chat_rate=os.getenv("CHAT_RATE_LIMIT")
+        chat_rate=os.getenv("CHAT_RATE_LIMIT"),
+        global_strategy=os.getenv("GLOBAL_RATE_LIMIT_STRATEGY", "fixed-window"),
+        chat_strategy=os.getenv("CHAT_RATE_LIMIT_STRATEGY", "fixed-window"),
+        local_tier=local_rate_limit_tier()
+    )
+
+@lru_cache()
+def local_rate_limit_tier() -> Optional[LocalRateLimitTier]:
+    """Creates and caches the in-process rate limit tier, or None when disabled"""
+    if os.getenv("RATE_LIMIT_LOCAL_TIER", "true").lower() != "true":
+        return None
+    return LocalRateLimitTier(
+        budget_fraction=float(os.getenv("RATE_LIMIT_LOCAL_FRACTION", "0.1")),
+        sync_interval=float(os.getenv("RATE_LIMIT_LOCAL_SYNC_INTERVAL", "1.0"))
     )
 
 @lru_cache()
-def openai_client() -> OpenAI:
-    """Creates OpenAI-compatible client instance"""
-    return OpenAI(
+def openai_client() -> AsyncOpenAI:
+    """Creates async OpenAI-compatible client instance"""
+    return AsyncOpenAI(
         base_url=os.getenv("LLM_ROUTER_URL"),
         api_key=os.getenv("LLM_ROUTER_API_KEY")
     )
@@ -88,7 +153,69 @@ def embeddings() -> OpenAIEmbeddings:
     """Creates and caches embeddings instance"""
     return OpenAIEmbeddings(
         model=os.getenv("EMBEDDING_MODEL"),
-        openai_api_key=os.getenv("OPENAI_API_KEY")
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        # Unset means the OpenAI API; point it at a local emulator for offline runs
+        openai_api_base=os.getenv("EMBEDDING_BASE_URL") or None,
+        # Checking the context length downloads the tiktoken encoding, so it can be turned off offline
+        check_embedding_ctx_length=os.getenv("EMBEDDING_CHECK_CTX_LENGTH", "true").lower() == "true"
+    )
+
+@lru_cache()
+def embedding_cache() -> EmbeddingCache:
+    """Creates and caches the query embedding cache instance"""
+    return EmbeddingCache(
+        embeddings=embeddings(),
+        redis_client=async_redis_client(),
+        model_name=os.getenv("EMBEDDING_MODEL"),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        ttl_seconds=int(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+    )
+
+@lru_cache()
+def response_cache() -> Optional[SemanticResponseCache]:
+    """Creates and caches the semantic response cache, or None when disabled"""
+    if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    return SemanticResponseCache(
+        redis_client=async_redis_client(),
+        similarity_threshold=float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95")),
+        ttl_seconds=int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    )
+
+@lru_cache()
+def chat_log_writer() -> ChatLogWriter:
+    """Creates and caches the write-behind chat log writer"""
+    return ChatLogWriter(
+        db_handler=database_handler(),
+        max_queue_size=int(os.getenv("CHAT_LOG_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("CHAT_LOG_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("CHAT_LOG_FLUSH_INTERVAL", "1.0"))
+    )
+
+@lru_cache()
+def tracer() -> Optional[Tracer]:
+    """Creates and caches the request tracer, None unless TRACE_SAMPLE_RATE is above 0"""
+    sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+    if sample_rate <= 0:
+        return None
+    if os.getenv("TRACE_EXPORTER", "jsonl").lower() == "otlp":
+        exporter = OtlpHttpTraceExporter(
+            endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"),
+            service_name=os.getenv("OTEL_SERVICE_NAME", "chat-backend")
+        )
+    else:
+        exporter = JsonlTraceExporter(os.getenv("TRACE_FILE", "logs/traces.jsonl"))
+    return Tracer(exporter, sample_rate=sample_rate)
+
+@lru_cache()
+def prompt_assembler() -> PromptAssembler:
+    """Creates and caches the token-budgeted prompt assembler"""
+    return PromptAssembler(
+        max_prompt_tokens=int(os.getenv("PROMPT_MAX_TOKENS", "8000")),
+        max_context_tokens=int(os.getenv("PROMPT_CONTEXT_TOKENS", "3000")),
+        max_history_tokens=int(os.getenv("PROMPT_HISTORY_TOKENS", "3000")),
+        max_message_tokens=int(os.getenv("PROMPT_MESSAGE_TOKENS", "2000")),
+        max_history_messages=int(os.getenv("PROMPT_HISTORY_MESSAGES", "10"))
     )
 
 @lru_cache()
@@ -98,12 +225,64 @@ def chat_service() -> ChatService:
         llm_client=openai_client(),
         db_handler=database_handler(),
         embeddings=embeddings(),
-        llm_model=os.getenv("LLM_MODEL")
+        llm_model=os.getenv("LLM_MODEL"),
+        max_concurrent_streams=int(os.getenv("LLM_MAX_CONCURRENT_STREAMS", "32")),
+        embedding_cache=embedding_cache(),
+        response_cache=response_cache(),
+        retriever=memory_index(),
+        chat_log_writer=chat_log_writer(),
+        prompt_assembler=prompt_assembler(),
+        prompt_layout=os.getenv("PROMPT_LAYOUT", "prefix"),
+        stream_usage=os.getenv("LLM_STREAM_USAGE", "true").lower() == "true",
+        session_store=session_store()
     )
 
+@lru_cache()
+def session_store() -> Optional[SessionStore]:
+    """Creates and caches the server-side conversation store, or None when disabled"""
+    if os.getenv("SESSION_STORE_ENABLED", "true").lower() != "true":
+        return None
+    summary_tokens = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+    llm_summary = os.getenv("SESSION_SUMMARIZER", "extractive").lower() == "llm"
+    if llm_summary:
+        summarizer = LlmSummarizer(openai_client(), os.getenv("LLM_MODEL"), max_tokens=summary_tokens)
+    else:
+        summarizer = extractive_summarizer(max_tokens=summary_tokens)
+    return SessionStore(
+        redis_client=async_redis_client(),
+        max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "20")),
+        ttl_seconds=int(os.getenv("SESSION_TTL", "86400")),
+        summarizer=summarizer,
+        # An upstream call per fold would otherwise hold up the end of every response
+        background_summary=llm_summary
+    )
+
+@lru_cache()
+def embedding_store() -> Optional[EmbeddingStore]:
+    """Creates and caches the on-disk document embedding store, or None when disabled"""
+    if os.getenv("EMBEDDING_STORE_ENABLED", "true").lower() != "true":
+        return None
+    return EmbeddingStore(
+        path=os.getenv("EMBEDDING_STORE_PATH", "data/embeddings.sqlite3"),
+        model_name=os.getenv("EMBEDDING_MODEL"),
+        max_bytes=int(os.getenv("EMBEDDING_STORE_MAX_MB", "512")) * 1024 * 1024
+    )
+
+@lru_cache()
+def indexing_status() -> IndexingStatus:
+    """Creates and caches the shared document indexing progress"""
+    return IndexingStatus()
+
 @lru_cache()
 def document_indexer() -> DocumentIndexer:
     """Creates and caches document indexer instance"""
     return DocumentIndexer(
-        embeddings=embeddings()
+        embeddings=embeddings(),
+        pipeline=EmbeddingPipeline(
+            embeddings=embeddings(),
+            max_batch_tokens=int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000")),
+            max_concurrency=int(os.getenv("EMBEDDING_CONCURRENCY", "4")),
+            max_retries=int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+        ),
+        embedding_store=embedding_store()
     )
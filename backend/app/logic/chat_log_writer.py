@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+from app.db.db_handler import DatabaseHandler
+from app.logs.logger import get_logger
+from app.logs.metrics import CHAT_LOGS
+from app.models.data_structures import ChatLog
+
+logger = get_logger(__name__)
+
+
+class ChatLogWriter:
+    """
+    Write-behind chat logger. Requests only enqueue a ChatLog; a background task
+    writes the queue to the database in multi-row batches, once batch_size records
+    are waiting or flush_interval seconds have passed. The queue is bounded, so a
+    slow or unavailable database drops logs instead of holding memory or failing chats.
+    """
+
+    def __init__(self, db_handler: DatabaseHandler, max_queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 1.0):
+        self.db_handler = db_handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.written = 0
+        self.overflowed = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Start the background flush task on the running event loop"""
+        self._closing = False
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, user_message: str, assistant_message: str, session_id: str, timestamp: datetime) -> None:
+        """Queue a chat log without waiting for the database"""
+        chat_log = ChatLog(
+            session_id=session_id,
+            user_message=user_message,
+            assistant_message=assistant_message,
+            timestamp=timestamp
+        )
+        try:
+            self.queue.put_nowait(chat_log)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            CHAT_LOGS.labels("overflowed").inc()
+            logger.warning(f"Chat log queue full, dropped log for session {session_id} ({self.overflowed} overflowed)")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while not (self._closing and self.queue.empty()):
+            batch = []
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self._closing:
+                    # Drain without waiting once shutdown has started
+                    if self.queue.empty():
+                        break
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    chat_log = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if chat_log is not None:
+                    batch.append(chat_log)
+            batch = [chat_log for chat_log in batch if chat_log is not None]
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: List[ChatLog]) -> None:
+        try:
+            await self.db_handler.log_chats(batch)
+            self.written += len(batch)
+            CHAT_LOGS.labels("written").inc(len(batch))
+        except Exception as e:
+            self.dropped += len(batch)
+            CHAT_LOGS.labels("dropped").inc(len(batch))
+            logger.error(f"Dropped {len(batch)} chat logs: {str(e)}")
+
+    async def stop(self) -> None:
+        """Flush everything still queued, then stop the background task"""
+        self._closing = True
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        else:
+            # Wake a flush loop that is waiting on an empty queue
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+        await self._task
+        logger.info(f"Chat log writer stopped: {self.written} written, "
+                    f"{self.overflowed} overflowed, {self.dropped} dropped")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "overflowed": self.overflowed,
+            "dropped": self.dropped,
+        }
@@ -1,11 +1,19 @@
 from langchain.text_splitter import MarkdownTextSplitter
 from langchain_openai import OpenAIEmbeddings
-from typing import List
+from typing import AsyncIterator, List, Optional
+import asyncio
 import hashlib
 
+from app.logic.embedding_pipeline import EmbeddingPipeline
+from app.logic.embedding_store import EmbeddingStore
+
 class DocumentIndexer:
-    def __init__(self, embeddings: OpenAIEmbeddings):
+    def __init__(self, embeddings: OpenAIEmbeddings, pipeline: Optional[EmbeddingPipeline] = None,
+                 embedding_store: Optional[EmbeddingStore] = None):
         self.embeddings = embeddings
+        self.embedding_model = getattr(embeddings, 'model', None)
+        self.pipeline = pipeline or EmbeddingPipeline(embeddings)
+        self.embedding_store = embedding_store
         self.text_splitter = MarkdownTextSplitter(
             chunk_size=1000,
             chunk_overlap=200
@@ -15,20 +23,51 @@ class DocumentIndexer:
         """Calculate MD5 hash of document content"""
         return hashlib.md5(content.encode('utf-8')).hexdigest()
 
-    def process_markdown(self, file_path: str) -> List[dict]:
-        """Process markdown file into chunks with embeddings"""
-        with open(file_path, 'r') as file:
-            content = file.read()
-            
+    def split_markdown(self, file_path: str, content: str) -> List[dict]:
+        """Split markdown content into chunks with metadata and per-chunk hashes, without embeddings"""
         content_hash = self.calculate_content_hash(content)
-        chunks = self.text_splitter.split_text(content)
-        embeddings = self.embeddings.embed_documents(chunks)
-        
         return [{
             'content': chunk,
-            'embedding': embedding,
+            'chunk_hash': self.calculate_content_hash(chunk),
             'metadata': {
                 'source': file_path,
                 'content_hash': content_hash
             }
-        } for chunk, embedding in zip(chunks, embeddings)] 
\ No newline at end of file
+        } for chunk in self.text_splitter.split_text(content)]
+
+    async def embed_chunks(self, chunks: List[dict]) -> AsyncIterator[List[dict]]:
+        """
+        Embed chunks from any number of documents, yielding batches as they complete.
+        Chunks found in the on-disk embedding store are yielded first without any API call.
+        """
+        if self.embedding_store is None:
+            async for batch in self.pipeline.run(chunks):
+                yield batch
+            return
+
+        stored = await asyncio.to_thread(self.embedding_store.get_many, [chunk['chunk_hash'] for chunk in chunks])
+        if stored:
+            yield [{**chunk, 'embedding': stored[chunk['chunk_hash']]} for chunk in chunks if chunk['chunk_hash'] in stored]
+
+        async for batch in self.pipeline.run([chunk for chunk in chunks if chunk['chunk_hash'] not in stored]):
+            await asyncio.to_thread(
+                self.embedding_store.put_many, {chunk['chunk_hash']: chunk['embedding'] for chunk in batch}
+            )
+            yield batch
+
+    def process_markdown(self, file_path: str) -> List[dict]:
+        """Process markdown file into chunks with embeddings"""
+        with open(file_path, 'r') as file:
+            content = file.read()
+
+        chunks = self.split_markdown(file_path, content)
+        stored = self.embedding_store.get_many([chunk['chunk_hash'] for chunk in chunks]) if self.embedding_store else {}
+        missing = [chunk for chunk in chunks if chunk['chunk_hash'] not in stored]
+        if missing:
+            embeddings = self.embeddings.embed_documents([chunk['content'] for chunk in missing])
+            new_embeddings = {chunk['chunk_hash']: embedding for chunk, embedding in zip(missing, embeddings)}
+            if self.embedding_store:
+                self.embedding_store.put_many(new_embeddings)
+            stored = {**stored, **new_embeddings}
+
+        return [{**chunk, 'embedding': stored[chunk['chunk_hash']]} for chunk in chunks]
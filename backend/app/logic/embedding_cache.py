@@ -0,0 +1,92 @@
+import time
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from redis.asyncio import Redis
+from langchain_openai import OpenAIEmbeddings
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings: a bounded in-process LRU in front of Redis.
+    Vectors are stored as raw float32 bytes and keyed by embedding model plus the
+    normalized query text, so repeated questions skip the embedding API round trip.
+    """
+
+    def __init__(self, embeddings: OpenAIEmbeddings, redis_client: Optional[Redis], model_name: str,
+                 max_entries: int = 1024, ttl_seconds: int = 86400, key_prefix: str = "embedding_cache"):
+        self.embeddings = embeddings
+        self.redis = redis_client
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.key_prefix = key_prefix
+        self._local: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Collapse whitespace and case so trivially different phrasings share an entry"""
+        return " ".join(text.split()).casefold()
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:{self.model_name}:{digest}"
+
+    async def embed_query(self, text: str) -> List[float]:
+        """Return the embedding for a query, computing it only on a miss in both tiers"""
+        key = self.cache_key(text)
+
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector.tolist()
+
+        vector = await self._get_remote(key)
+        if vector is None:
+            vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+            await self._set_remote(key, vector)
+
+        self._set_local(key, vector)
+        return vector.tolist()
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return vector
+
+    def _set_local(self, key: str, vector: np.ndarray) -> None:
+        self._local[key] = (time.monotonic() + self.ttl_seconds, vector)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _get_remote(self, key: str) -> Optional[np.ndarray]:
+        if self.redis is None:
+            return None
+        try:
+            payload = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {str(e)}")
+            return None
+        if not payload:
+            return None
+        return np.frombuffer(payload, dtype=np.float32)
+
+    async def _set_remote(self, key: str, vector: np.ndarray) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, vector.tobytes(), ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Embedding cache write failed: {str(e)}")
@@ -0,0 +1,75 @@
+import random
+import asyncio
+from typing import AsyncIterator, List
+
+from openai import RateLimitError
+from langchain_openai import OpenAIEmbeddings
+
+from app.logic.tokenizer import count_tokens
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingPipeline:
+    """
+    Embeds chunks from any number of documents in token-bounded batches.
+    Batches run concurrently up to max_concurrency, retry with exponential backoff
+    when the API rate limits us, and are yielded as soon as each one completes.
+    """
+
+    def __init__(self, embeddings: OpenAIEmbeddings, max_batch_tokens: int = 50000, max_batch_size: int = 512,
+                 max_concurrency: int = 4, max_retries: int = 5, base_delay: float = 1.0):
+        self.embeddings = embeddings
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    def make_batches(self, chunks: List[dict]) -> List[List[dict]]:
+        """Group chunks so that no batch exceeds the token or input-count bound"""
+        batches, batch, batch_tokens = [], [], 0
+        for chunk in chunks:
+            tokens = count_tokens(chunk['content'])
+            if batch and (batch_tokens + tokens > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(chunk)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def run(self, chunks: List[dict]) -> AsyncIterator[List[dict]]:
+        """Yield batches of chunks, each with an 'embedding' key, in completion order"""
+        batches = self.make_batches(chunks)
+        if not batches:
+            return
+        logger.info(f"Embedding {len(chunks)} chunks in {len(batches)} batches")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(batch: List[dict]) -> List[dict]:
+            async with semaphore:
+                vectors = await self._embed_with_retry([chunk['content'] for chunk in batch])
+            return [{**chunk, 'embedding': vector} for chunk, vector in zip(batch, vectors)]
+
+        tasks = [asyncio.create_task(embed(batch)) for batch in batches]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self.embeddings.aembed_documents(texts)
+            except RateLimitError:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.base_delay * 2 ** attempt * (1 + random.random())
+                logger.warning(f"Embedding rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+                await asyncio.sleep(delay)
@@ -0,0 +1,129 @@
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class EmbeddingStore:
+    """
+    Persistent on-disk cache of document embeddings keyed by (model, chunk-text hash).
+
+    Vectors are stored as float32 blobs in a local SQLite file, so a fresh database
+    can be re-indexed without calling the embedding API for text embedded before.
+    When the stored vectors exceed max_bytes, the least recently used rows are evicted.
+    """
+
+    def __init__(self, path: str, model_name: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = Path(path)
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, chunk_hash)
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+
+    def get_many(self, chunk_hashes: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return the stored embeddings for the given hashes and mark them as recently used"""
+        chunk_hashes = list(dict.fromkeys(chunk_hashes))
+        found = {}
+        with self._lock:
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(chunk_hashes), 500):
+                batch = chunk_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                found.update({chunk_hash: np.frombuffer(vector, dtype=np.float32) for chunk_hash, vector in rows})
+            if found:
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND chunk_hash = ?",
+                    [(time.time(), self.model_name, chunk_hash) for chunk_hash in found]
+                )
+                self._connection.commit()
+        return found
+
+    def put_many(self, embeddings: Dict[str, List[float]]) -> None:
+        """Store embeddings by chunk hash, then evict old rows if the store is over its size bound"""
+        if not embeddings:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model_name, chunk_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                 for chunk_hash, vector in embeddings.items()]
+            )
+            self._connection.commit()
+            self._evict()
+
+    def size_bytes(self) -> int:
+        """Total size of the stored vectors across all models"""
+        with self._lock:
+            return self._connection.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def _evict(self) -> None:
+        total = self._connection.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for rowid, size in self._connection.execute(
+            "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((rowid,))
+            total -= size
+        self._connection.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+        self._connection.commit()
+        logger.info(f"Evicted {len(evicted)} embeddings from {self.path}")
+
+    def compact(self) -> None:
+        """Apply the size bound and reclaim the file space left behind by evicted rows"""
+        with self._lock:
+            self._evict()
+            self._connection.execute("VACUUM")
+        logger.info(f"Compacted embedding store {self.path} to {self.path.stat().st_size} bytes")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the on-disk embedding store")
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument("--path", default=os.getenv("EMBEDDING_STORE_PATH", "data/embeddings.sqlite3"))
+    parser.add_argument("--max-mb", type=int, default=int(os.getenv("EMBEDDING_STORE_MAX_MB", "512")))
+    args = parser.parse_args()
+
+    store = EmbeddingStore(args.path, os.getenv("EMBEDDING_MODEL", ""), max_bytes=args.max_mb * 1024 * 1024)
+    if args.command == "compact":
+        store.compact()
+    print(f"{args.path}: {store.size_bytes()} bytes of vectors, {store.path.stat().st_size} bytes on disk")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
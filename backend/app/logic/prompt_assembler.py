@@ -0,0 +1,118 @@
+from dataclasses import asdict, dataclass
+from typing import List, Tuple
+
+from app.logic.tokenizer import count_tokens, count_tokens_cached, truncate_to_tokens
+from app.models.data_structures import Message
+
+TRIM_MARKER = " […]"
+
+
+@dataclass
+class PromptStats:
+    """Token counts of one assembled prompt"""
+    system_tokens: int = 0
+    context_tokens: int = 0
+    summary_tokens: int = 0
+    history_tokens: int = 0
+    message_tokens: int = 0
+    chunks_used: int = 0
+    chunks_dropped: int = 0
+    history_used: int = 0
+    history_dropped: int = 0
+    trimmed: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return (self.system_tokens + self.context_tokens + self.summary_tokens
+                + self.history_tokens + self.message_tokens)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+
+class PromptAssembler:
+    """
+    Fits the prompt into a token budget. The static system prompt is always kept, the user message
+    is trimmed to max_message_tokens, retrieved context gets what is left up to
+    max_context_tokens and history the rest up to max_history_tokens. The lowest-value items
+    go first: the least similar chunks, then the oldest history messages. The item at the
+    budget edge is trimmed rather than dropped when at least min_trim_tokens of it fit.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 8000, max_context_tokens: int = 3000,
+                 max_history_tokens: int = 3000, max_message_tokens: int = 2000,
+                 max_history_messages: int = 10, min_trim_tokens: int = 64):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_context_tokens = max_context_tokens
+        self.max_history_tokens = max_history_tokens
+        self.max_message_tokens = max_message_tokens
+        self.max_history_messages = max_history_messages
+        self.min_trim_tokens = min_trim_tokens
+
+    def fit_message(self, message: str, stats: PromptStats) -> str:
+        """The user message, trimmed to its own budget"""
+        tokens = count_tokens(message)
+        if tokens > self.max_message_tokens:
+            message = truncate_to_tokens(message, self.max_message_tokens) + TRIM_MARKER
+            tokens = self.max_message_tokens
+            stats.trimmed += 1
+        stats.message_tokens = tokens
+        return message
+
+    def fit_summary(self, summary: str, stats: PromptStats) -> str:
+        """The session summary, trimmed to the history budget it shares with the history messages"""
+        if not summary:
+            return ""
+        tokens = count_tokens(summary)
+        if tokens > self.max_history_tokens:
+            summary = truncate_to_tokens(summary, self.max_history_tokens) + TRIM_MARKER
+            tokens = self.max_history_tokens
+            stats.trimmed += 1
+        stats.summary_tokens = tokens
+        return summary
+
+    def fit_context(self, chunks: List[str], reserved_tokens: int, stats: PromptStats) -> str:
+        """
+        Join the chunks (most relevant first) that fit next to reserved_tokens, which
+        covers the system prompt and the user message
+        """
+        budget = max(0, min(self.max_context_tokens, self.max_prompt_tokens - reserved_tokens))
+        fitted, used = self._fit(chunks, budget, stats)
+        stats.chunks_used = len(fitted)
+        stats.chunks_dropped = len(chunks) - len(fitted)
+        stats.context_tokens = used
+        return "".join(f"{chunk}\n\n" for chunk in fitted)
+
+    def fit_history(self, history: List[Message], stats: PromptStats) -> List[Message]:
+        """
+        The most recent history messages that fit the budget left by the system prompt, context
+        and message. A session summary counts against the history budget.
+        """
+        recent = history[-self.max_history_messages:] if self.max_history_messages else []
+        budget = max(0, min(self.max_history_tokens - stats.summary_tokens, self.max_prompt_tokens
+                            - stats.system_tokens - stats.context_tokens - stats.summary_tokens
+                            - stats.message_tokens))
+        # Newest first, so the oldest messages are the ones dropped
+        fitted, used = self._fit([message.content for message in reversed(recent)], budget, stats)
+        kept = [Message(role=message.role, content=content)
+                for message, content in zip(reversed(recent), fitted)][::-1]
+        stats.history_used = len(kept)
+        stats.history_dropped = len(history) - len(kept)
+        stats.history_tokens = used
+        return kept
+
+    def _fit(self, texts: List[str], budget: int, stats: PromptStats) -> Tuple[List[str], int]:
+        fitted, used = [], 0
+        for text in texts:
+            tokens = count_tokens_cached(text)
+            if used + tokens <= budget:
+                fitted.append(text)
+                used += tokens
+                continue
+            remaining = budget - used
+            if remaining >= self.min_trim_tokens:
+                fitted.append(truncate_to_tokens(text, remaining) + TRIM_MARKER)
+                used = budget
+                stats.trimmed += 1
+            break
+        return fitted, used
@@ -0,0 +1,94 @@
+import hashlib
+from typing import Dict, List, Optional
+
+import numpy as np
+from redis.asyncio import Redis
+
+from app.logs.logger import get_logger
+from app.logs.metrics import RESPONSE_CACHE_LOOKUPS
+
+logger = get_logger(__name__)
+
+
+class SemanticResponseCache:
+    """
+    Redis-backed cache of generated answers, looked up by question similarity.
+    Entries are grouped per retrieval context, so a lookup only compares against
+    questions that were answered from exactly the same chunks. Each entry packs
+    the float32 question embedding followed by the UTF-8 answer.
+    """
+
+    def __init__(self, redis_client: Redis, similarity_threshold: float = 0.95, ttl_seconds: int = 86400,
+                 max_entries_per_context: int = 32, key_prefix: str = "response_cache"):
+        self.redis = redis_client
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries_per_context = max_entries_per_context
+        self.key_prefix = key_prefix
+        self.hits = 0
+        self.misses = 0
+
+    def context_key(self, context: str) -> str:
+        digest = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        return f"{self.key_prefix}:entries:{digest}"
+
+    async def lookup(self, question_embedding: List[float], context: str) -> Optional[str]:
+        """Return the cached answer of the most similar question above the threshold, if any"""
+        try:
+            entries = await self.redis.hgetall(self.context_key(context))
+        except Exception as e:
+            logger.warning(f"Response cache lookup failed: {str(e)}")
+            entries = {}
+
+        answer = self._best_match(np.asarray(question_embedding, dtype=np.float32), entries.values())
+        if answer is None:
+            self.misses += 1
+            RESPONSE_CACHE_LOOKUPS.labels("miss").inc()
+        else:
+            self.hits += 1
+            RESPONSE_CACHE_LOOKUPS.labels("hit").inc()
+        return answer
+
+    def _best_match(self, query: np.ndarray, payloads) -> Optional[str]:
+        vector_size = query.size * 4
+        query_norm = np.linalg.norm(query)
+        if not query_norm:
+            return None
+
+        best_similarity, best_answer = self.similarity_threshold, None
+        for payload in payloads:
+            cached = np.frombuffer(payload[:vector_size], dtype=np.float32)
+            if cached.size != query.size:
+                continue
+            similarity = float(cached @ query) / (float(np.linalg.norm(cached)) * query_norm)
+            if similarity >= best_similarity:
+                best_similarity, best_answer = similarity, payload[vector_size:].decode("utf-8")
+        return best_answer
+
+    async def store(self, question_embedding: List[float], context: str, answer: str) -> None:
+        """Cache an answer unless its context group is already full"""
+        key = self.context_key(context)
+        vector = np.asarray(question_embedding, dtype=np.float32)
+        field = hashlib.sha256(vector.tobytes()).hexdigest()
+        try:
+            if await self.redis.hlen(key) >= self.max_entries_per_context:
+                return
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(key, field, vector.tobytes() + answer.encode("utf-8"))
+                pipe.expire(key, self.ttl_seconds)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {str(e)}")
+
+    async def invalidate(self) -> None:
+        """Drop every cached answer, used when the document corpus changes"""
+        deleted = 0
+        try:
+            async for key in self.redis.scan_iter(match=f"{self.key_prefix}:entries:*"):
+                deleted += await self.redis.delete(key)
+            logger.info(f"Invalidated {deleted} response cache groups")
+        except Exception as e:
+            logger.error(f"Failed to invalidate response cache: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,47 @@
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = DEFAULT_ENCODING) -> Optional[tiktoken.Encoding]:
+    """Load and cache a tiktoken encoding; None when it can't be loaded (e.g. offline)"""
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Failed to load tokenizer {name}, estimating token counts: {str(e)}")
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = DEFAULT_ENCODING) -> int:
+    """Count tokens in text, falling back to a ~4 characters per token estimate"""
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=4096)
+def count_tokens_cached(text: str) -> int:
+    """count_tokens memoized by text, for strings counted on every request such as chat history"""
+    return count_tokens(text)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """Keep the first max_tokens tokens of text"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(encoding_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
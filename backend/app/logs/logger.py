@@ -1,23 +1,142 @@
-import logging
+import os
 import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
 from functools import lru_cache
+from typing import Dict, Optional
 
 FORMATTER = logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including fields passed through `extra`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key != "sample_rate":
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of DEBUG records so high-frequency debug sites stay cheap.
+    A call site can set its own rate with extra={"sample_rate": 0.01}.
+    """
+
+    def __init__(self, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            if record.levelno > logging.DEBUG:
+                return True
+            rate = self.debug_sample_rate
+        return rate >= 1.0 or random.random() < rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the writer falls behind"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render tracebacks now, but leave formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse per-module levels like 'app.middleware=WARNING,app.db.db_handler=DEBUG'"""
+    levels = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = entry.partition("=")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def resolve_level(logger_name: str, default_level: str, levels: Dict[str, int]) -> int:
+    """Return the level of the most specific configured module prefix of logger_name"""
+    best, best_level = "", logging.getLevelName(default_level.upper())
+    for name, level in levels.items():
+        if (logger_name == name or logger_name.startswith(f"{name}.")) and len(name) > len(best):
+            best, best_level = name, level
+    return best_level
+
+
 @lru_cache(maxsize=None)
 def get_console_handler() -> logging.StreamHandler:
     """Configure and cache console logging handler"""
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(FORMATTER)
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(FORMATTER)
     return console_handler
 
-def get_logger(logger_name: str) -> logging.Logger:
+
+@lru_cache(maxsize=None)
+def get_handler() -> logging.Handler:
+    """
+    Configure and cache the handler shared by all app loggers. Unless LOG_ASYNC is false,
+    records are put on a bounded queue and written by a background listener thread,
+    so logging never blocks the event loop on stdout.
+    """
+    if os.getenv("LOG_ASYNC", "true").lower() != "true":
+        handler = get_console_handler()
+    else:
+        handler = _QueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        listener = logging.handlers.QueueListener(handler.queue, get_console_handler(), respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    return handler
+
+
+@lru_cache(maxsize=None)
+def _configured_levels() -> Dict[str, int]:
+    return parse_levels(os.getenv("LOG_LEVELS", ""))
+
+
+def get_logger(logger_name: str, level: Optional[str] = None) -> logging.Logger:
     logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.DEBUG)
-    
+    logger.setLevel(resolve_level(logger_name, level or os.getenv("LOG_LEVEL", "INFO"), _configured_levels()))
+
     if not logger.handlers:
-        logger.addHandler(get_console_handler())
-    
+        logger.addHandler(get_handler())
+
     logger.propagate = False
     return logger
-
@@ -0,0 +1,98 @@
+import os
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus metrics for the chat pipeline and the rate limiter.
+#
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty directory
+# before the workers start: each process then writes its samples to files there and
+# render_metrics() aggregates all of them, whichever worker serves the scrape.
+
+# 5ms up to a minute, from a cached answer to a long completion stream
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_LIMIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Duration of each chat pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+CHAT_PROMPT_TOKENS = Histogram(
+    "chat_prompt_tokens",
+    "Tokens of each part of the assembled chat prompt",
+    ["part"],
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+)
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens",
+    "Prompt tokens reported by the upstream, by whether its prompt cache served them",
+    ["cache"],
+)
+CHAT_REQUESTS = Counter(
+    "chat_requests",
+    "Chat requests by outcome",
+    ["outcome"],
+)
+CHAT_LOGS = Counter(
+    "chat_logs",
+    "Chat logs handled by the write-behind writer, by whether they were written or lost",
+    ["result"],
+)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    "response_cache_lookups",
+    "Semantic response cache lookups by result",
+    ["result"],
+)
+CHAT_STREAMS_IN_FLIGHT = Gauge(
+    "chat_streams_in_flight",
+    "Chat responses currently being streamed",
+    multiprocess_mode="livesum",
+)
+RATE_LIMIT_CHECK_SECONDS = Histogram(
+    "rate_limit_check_seconds",
+    "Duration of rate limit checks by deciding tier",
+    ["tier"],
+    buckets=RATE_LIMIT_BUCKETS,
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions",
+    "Rate limit decisions by deciding tier and result",
+    ["tier", "result"],
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size",
+    "Configured database connection pool size",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Database connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+
+
+def instrument_pool(engine: Engine) -> None:
+    """Track checked out connections of the engine's pool"""
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        DB_POOL_SIZE.inc(size())
+    event.listen(engine, "checkout", lambda *args: DB_POOL_CHECKED_OUT.inc())
+    event.listen(engine, "checkin", lambda *args: DB_POOL_CHECKED_OUT.dec())
+
+
+def render_metrics() -> bytes:
+    """Render all metrics in the Prometheus text format, across processes in multiprocess mode"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead() -> None:
+    """Drop this process's live gauges from the multiprocess aggregate when it exits"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
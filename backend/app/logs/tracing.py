@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+import urllib.request
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Trace of the request being handled; None when the request is not sampled
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class _NoopSpan:
+    """Stands in for a span when the request is not traced, so call sites stay unconditional"""
+
+    recording = False
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """One timed operation of a trace, with size attributes such as chunks, characters or tokens"""
+
+    recording = True
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = 0
+        self.duration_ns: Optional[int] = None
+        self._started_at = 0
+
+    def __enter__(self) -> "Span":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_value is not None:
+            self.attributes["error"] = repr(exc_value)
+        self.end()
+
+    def start(self) -> None:
+        self.start_ns = time.time_ns()
+        self._started_at = time.perf_counter_ns()
+        self.trace._stack.append(self)
+
+    def end(self) -> None:
+        if self.duration_ns is not None:
+            return
+        self.duration_ns = time.perf_counter_ns() - self._started_at
+        if self in self.trace._stack:
+            self.trace._stack.remove(self)
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.duration_ns or 0) / 1e6
+
+    def elapsed_ms(self) -> float:
+        """Time since the span started, for spans still open"""
+        return (time.perf_counter_ns() - self._started_at) / 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Trace:
+    """
+    Spans of one request. Spans are parented to the innermost open span of the trace,
+    which is kept on the trace itself rather than in context variables, so a span may
+    stay open across the yields of a streamed response.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+        self.root = self.span(name, **attributes)
+        self.root.start()
+
+    def span(self, name: str, **attributes: Any) -> Span:
+        parent = self._stack[-1].span_id if self._stack else None
+        span = Span(self, name, parent, attributes)
+        self.spans.append(span)
+        return span
+
+    def server_timing(self) -> str:
+        """Server-Timing header value for the finished top-level phases"""
+        return ", ".join(
+            f"{span.name};dur={span.duration_ms:.1f}"
+            for span in self.spans
+            if span.parent_id == self.root.span_id and span.duration_ns is not None
+        )
+
+    def finish(self) -> None:
+        """End the root span and hand the trace to the exporter"""
+        if self.root.duration_ns is not None:
+            return
+        self.root.end()
+        self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id, "spans": [span.to_dict() for span in self.spans]}
+
+
+def span(name: str, **attributes: Any):
+    """Time a block as a span of the current trace; a no-op when the request is not traced"""
+    trace = _current_trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return trace.span(name, **attributes)
+
+
+class JsonlTraceExporter:
+    """Append each trace as one JSON line to a local file"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, traces: List[Trace]) -> None:
+        with self.path.open("a") as file:
+            for trace in traces:
+                file.write(json.dumps(trace.to_dict(), default=str) + "\n")
+
+
+class OtlpHttpTraceExporter:
+    """Send traces to an OTLP/HTTP collector (JSON encoding), e.g. a local OpenTelemetry collector"""
+
+    def __init__(self, endpoint: str, service_name: str = "chat-backend", timeout: float = 5.0):
+        self.url = f"{endpoint.rstrip('/')}/v1/traces"
+        self.service_name = service_name
+        self.timeout = timeout
+
+    def export(self, traces: List[Trace]) -> None:
+        body = json.dumps(self.to_otlp(traces)).encode()
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+    def to_otlp(self, traces: List[Trace]) -> dict:
+        spans = []
+        for trace in traces:
+            for span in trace.spans:
+                otlp_span = {
+                    "traceId": trace.trace_id,
+                    "spanId": span.span_id,
+                    "name": span.name,
+                    "kind": 2 if span.parent_id is None else 1,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.start_ns + (span.duration_ns or 0)),
+                    "attributes": [_otlp_attribute(key, value) for key, value in span.attributes.items()],
+                }
+                if span.parent_id is not None:
+                    otlp_span["parentSpanId"] = span.parent_id
+                spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Tracer:
+    """
+    Samples requests and exports their finished traces from a background thread, so
+    writing a file or calling a collector never blocks the event loop. Traces are
+    dropped when the export queue is full.
+    """
+
+    def __init__(self, exporter, sample_rate: float = 0.01, max_queue_size: int = 1000, batch_size: int = 50):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def start_trace(self, name: str, **attributes: Any) -> Optional[Trace]:
+        """Start a trace for the current request if it is sampled"""
+        if self.sample_rate <= 0 or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return None
+        trace = Trace(self, name, attributes)
+        _current_trace.set(trace)
+        return trace
+
+    def export(self, trace: Trace) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            traces = [self.queue.get()]
+            while len(traces) < self.batch_size and not self.queue.empty():
+                traces.append(self.queue.get_nowait())
+            try:
+                self.exporter.export(traces)
+            except Exception as e:
+                self.dropped += len(traces)
+                logger.warning(f"Failed to export {len(traces)} traces: {str(e)}")
@@ -0,0 +1,84 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LocalRateLimitTier:
+    """
+    In-process tier in front of the Redis rate limits.
+
+    Clients Redis recently denied are rejected locally until their retry-after passes.
+    While Redis reports plenty of headroom on every limit of a request, a share of that
+    headroom (budget_fraction) is granted as a local budget valid for sync_interval
+    seconds; requests within budget are admitted without a Redis call and their counts
+    are sent along with the next sync. Near a threshold the budget shrinks to zero, so
+    every request is checked against Redis.
+    """
+
+    def __init__(self, budget_fraction: float = 0.1, sync_interval: float = 1.0, max_entries: int = 10000):
+        self.budget_fraction = budget_fraction
+        self.sync_interval = sync_interval
+        self.max_entries = max_entries
+        self._denied_until: Dict[str, float] = {}
+        self._budgets: Dict[str, Tuple[int, float]] = {}
+        self._pending: Dict[str, int] = {}
+
+    def precheck(self, keys: List[str]) -> Optional[Tuple[Optional[int], int]]:
+        """
+        Decide locally when possible.
+        Returns (index of the denied limit or None, retry_after_seconds), or None when Redis must decide.
+        """
+        now = time.monotonic()
+        for index, key in enumerate(keys):
+            denied_until = self._denied_until.get(key)
+            if denied_until is not None and denied_until > now:
+                return index, math.ceil(denied_until - now)
+
+        budgets = [self._budgets.get(key) for key in keys]
+        if not all(budget is not None and budget[0] > 0 and budget[1] > now for budget in budgets):
+            return None
+
+        for key, (remaining, expires_at) in zip(keys, budgets):
+            self._budgets[key] = (remaining - 1, expires_at)
+            self._pending[key] = self._pending.get(key, 0) + 1
+        return None, 0
+
+    def take_pending(self, keys: List[str]) -> List[int]:
+        """Hand over the locally admitted requests that Redis has not counted yet"""
+        return [self._pending.pop(key, 0) for key in keys]
+
+    def restore_pending(self, keys: List[str], pending: List[int]) -> None:
+        """Keep counts for the next sync when the Redis call failed"""
+        for key, count in zip(keys, pending):
+            if count:
+                self._pending[key] = self._pending.get(key, 0) + count
+
+    def record(self, keys: List[str], denied: Optional[int], retry_after: int, remaining: List[int]) -> None:
+        """Update the local state from a Redis decision"""
+        now = time.monotonic()
+        if denied is not None:
+            self._denied_until[keys[denied]] = now + retry_after
+            for key in keys:
+                self._budgets.pop(key, None)
+        else:
+            for key, headroom in zip(keys, remaining):
+                budget = int(headroom * self.budget_fraction)
+                if budget > 0:
+                    self._budgets[key] = (budget, now + self.sync_interval)
+                else:
+                    self._budgets.pop(key, None)
+
+        if len(self._denied_until) + len(self._budgets) > self.max_entries:
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        self._denied_until = {key: until for key, until in self._denied_until.items() if until > now}
+        self._budgets = {key: budget for key, budget in self._budgets.items() if budget[1] > now}
+        if len(self._denied_until) + len(self._budgets) > self.max_entries:
+            logger.warning("Local rate limit tier is full, dropping local state")
+            self._denied_until.clear()
+            self._budgets.clear()
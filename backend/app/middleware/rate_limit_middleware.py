@@ -1,18 +1,28 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
 from app.middleware.rate_limiter import RateLimiter
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, rate_limiter: RateLimiter):
-        super().__init__(app)
+class RateLimitMiddleware:
+    """
+    Pure ASGI rate limiting middleware. The decision is made from the request scope
+    before the app runs; allowed requests get the original receive and send, so
+    streamed responses such as /chat pass through without extra tasks or buffering.
+    """
+
+    def __init__(self, app: ASGIApp, rate_limiter: RateLimiter):
+        self.app = app
         self.rate_limiter = rate_limiter
 
-    async def dispatch(self, request: Request, call_next):
-        # Check rate limits
-        rate_limit_response = await self.rate_limiter.check_rate_limit(request, None)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Check rate limits; the body is never read here
+        rate_limit_response = await self.rate_limiter.check_rate_limit(Request(scope), None)
         if rate_limit_response:
-            return rate_limit_response
+            await rate_limit_response(scope, receive, send)
+            return
 
         # Proceed with the request if within limits
-        response = await call_next(request)
-        return response 
\ No newline at end of file
+        await self.app(scope, receive, send)
@@ -1,20 +1,124 @@
-from typing import Optional, Tuple
+import time
+import logging
+from typing import List, Optional, Tuple
 from fastapi import Request, Response
-from redis import Redis
+from redis.asyncio import Redis
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from app.logs.logger import get_logger
+from app.logs.metrics import RATE_LIMIT_CHECK_SECONDS, RATE_LIMIT_DECISIONS
+from app.middleware.local_rate_limit import LocalRateLimitTier
 from app.models.data_structures import RateLimitResponse
 
 logger = get_logger(__name__)
 
+# Evaluates every limit that applies to a request in one round trip.
+# KEYS holds one key per limit and ARGV a (strategy, max requests, window seconds,
+# pending) group per limit, where strategy is 0 for a fixed window, 1 for a sliding
+# window counter and 2 for a token bucket, and pending counts requests a local tier
+# already admitted. The request is only counted when every limit allows it.
+# Returns the 1-based index of the first exceeded limit (0 if allowed), its retry-after
+# and the remaining headroom of each limit.
+CHECK_LIMITS_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local denied, retry_after = 0, 0
+local states = {}
+
+for i, key in ipairs(KEYS) do
+    local state = {
+        strategy = tonumber(ARGV[4 * i - 3]),
+        max = tonumber(ARGV[4 * i - 2]),
+        window = tonumber(ARGV[4 * i - 1]),
+        pending = tonumber(ARGV[4 * i])
+    }
+    if state.strategy == 0 then
+        state.count = tonumber(redis.call('GET', key) or '0') + state.pending
+        state.used = state.count
+        local ttl = redis.call('TTL', key)
+        state.retry = ttl > 0 and ttl or state.window
+    elseif state.strategy == 1 then
+        -- Weighted sum of the previous and the current fixed window
+        local index = math.floor(now / state.window)
+        local data = redis.call('HMGET', key, 'window', 'current', 'previous')
+        local stored = tonumber(data[1] or '-1')
+        local current, previous = tonumber(data[2] or '0'), tonumber(data[3] or '0')
+        if stored == index - 1 then
+            previous, current = current, 0
+        elseif stored ~= index then
+            previous, current = 0, 0
+        end
+        current = current + state.pending
+        local elapsed = now - index * state.window
+        state.index, state.current, state.previous = index, current, previous
+        state.used = previous * (1 - elapsed / state.window) + current
+        if previous > 0 and current + 1 <= state.max then
+            state.retry = math.ceil(state.window * (1 - (state.max - current - 1) / previous) - elapsed)
+        else
+            state.retry = math.ceil(state.window - elapsed)
+        end
+    else
+        local rate = state.max / state.window
+        local data = redis.call('HMGET', key, 'tokens', 'updated')
+        local tokens = tonumber(data[1] or state.max)
+        local updated = tonumber(data[2] or now)
+        tokens = math.min(state.max, tokens + (now - updated) * rate) - state.pending
+        state.tokens = tokens
+        state.used = state.max - tokens
+        state.retry = math.ceil((1 - tokens) / rate)
+    end
+    if denied == 0 and state.used + 1 > state.max then
+        denied = i
+        retry_after = math.max(1, state.retry)
+    end
+    states[i] = state
+end
+
+local cost = denied == 0 and 1 or 0
+local result = {denied, retry_after}
+for i, key in ipairs(KEYS) do
+    local state = states[i]
+    if state.strategy == 0 then
+        if state.pending + cost > 0 then
+            redis.call('INCRBY', key, state.pending + cost)
+            if redis.call('TTL', key) < 0 then
+                redis.call('EXPIRE', key, state.window)
+            end
+        end
+    elseif state.strategy == 1 then
+        redis.call('HSET', key, 'window', state.index, 'current', state.current + cost, 'previous', state.previous)
+        redis.call('EXPIRE', key, math.ceil(2 * state.window))
+    else
+        redis.call('HSET', key, 'tokens', tostring(state.tokens - cost), 'updated', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(state.window))
+    end
+    result[i + 2] = math.max(0, math.floor(state.max - state.used - cost))
+end
+return result
+"""
+
+STRATEGIES = {"fixed-window": 0, "sliding-window": 1, "token-bucket": 2}
+
+
 class RateLimiter:
-    def __init__(self, redis_client: Redis, limiter: Limiter, global_rate: str, chat_rate: str):
+    def __init__(self, redis_client: Redis, limiter: Limiter, global_rate: str, chat_rate: str,
+                 global_strategy: str = "fixed-window", chat_strategy: str = "fixed-window",
+                 local_tier: Optional[LocalRateLimitTier] = None):
+        for strategy in (global_strategy, chat_strategy):
+            if strategy not in STRATEGIES:
+                raise ValueError(f"Unknown rate limit strategy {strategy}, expected one of {list(STRATEGIES)}")
         self.redis = redis_client
         self.limiter = limiter
         self.global_rate = global_rate
         self.chat_rate = chat_rate
-        logger.info(f"Initializing RateLimiter with global_rate={global_rate}, chat_rate={chat_rate}")
+        self.global_strategy = global_strategy
+        self.chat_strategy = chat_strategy
+        self.local_tier = local_tier
+        # Called by its SHA with EVALSHA; redis-py loads it into Redis on first use
+        self.check_limits_script = redis_client.register_script(CHECK_LIMITS_SCRIPT)
+        logger.info(f"Initializing RateLimiter with global_rate={global_rate} ({global_strategy}), "
+                    f"chat_rate={chat_rate} ({chat_strategy})")
 
     async def check_rate_limit(self, request: Request, response: Response) -> Optional[Response]:
         """Main rate limiting logic entry point"""
@@ -23,64 +127,57 @@ class RateLimiter:
                 return None
 
             client_ip = get_remote_address(request)
-            logger.debug(f"Checking rate limits for IP: {client_ip}")
 
-            # Check global rate limit
-            global_limit_response = await self._check_global_limit()
-            if global_limit_response:
-                return global_limit_response
-
-            # Check chat-specific rate limit
+            limits = [(self._key("rate_limit:global", self.global_strategy), self.global_rate, self.global_strategy)]
             if self._is_chat_endpoint(request):
-                chat_limit_response = await self._check_chat_limit(client_ip)
-                if chat_limit_response:
-                    return chat_limit_response
+                limits.append((self._key(f"rate_limit:chat:{client_ip}", self.chat_strategy),
+                               self.chat_rate, self.chat_strategy))
 
-            return None
+            denied, retry_after = await self._check_limits(limits)
+            if denied is None:
+                return None
+
+            key = limits[denied][0]
+            if denied == 0:
+                logger.warning(f"Global rate limit exceeded. Key: {key}")
+                return self._global_limit_response(retry_after)
+            logger.warning(f"Chat rate limit exceeded for IP: {client_ip}. Key: {key}")
+            return self._chat_limit_response(retry_after)
 
         except Exception as e:
+            RATE_LIMIT_DECISIONS.labels("redis", "error").inc()
             logger.error(f"Rate limiting error: {str(e)}")
             return None  # Fail open
 
+    def _key(self, base_key: str, strategy: str) -> str:
+        """Each strategy stores a different Redis type, so non-default ones get their own key"""
+        return base_key if strategy == "fixed-window" else f"{base_key}:{strategy}"
+
     def _is_health_check(self, request: Request) -> bool:
         """Check if the request is for health check endpoints"""
-        return request.url.path in ["/", "/health"]
+        return request.url.path in ["/", "/health", "/ready", "/metrics"]
 
     def _is_chat_endpoint(self, request: Request) -> bool:
         """Check if the request is for chat endpoints"""
         return request.url.path.startswith("/chat")
 
-    async def _check_global_limit(self) -> Optional[Response]:
-        """Check global rate limit"""
-        global_key = "rate_limit:global"
-        is_allowed, retry_after = await self._check_limit(global_key, self.global_rate)
-        
-        if not is_allowed:
-            logger.warning(f"Global rate limit exceeded. Key: {global_key}")
-            return self._create_limit_response(
-                detail="Global rate limit exceeded",
-                type="rate_limit_exceeded",
-                limit=self.global_rate,
-                retry_after=retry_after,
-                friendly_message=f"You've reached the global rate limit. Please try again in {retry_after} seconds."
-            )
-        return None
-
-    async def _check_chat_limit(self, client_ip: str) -> Optional[Response]:
-        """Check chat-specific rate limit"""
-        chat_key = f"rate_limit:chat:{client_ip}"
-        is_allowed, retry_after = await self._check_limit(chat_key, self.chat_rate)
-        
-        if not is_allowed:
-            logger.warning(f"Chat rate limit exceeded for IP: {client_ip}. Key: {chat_key}")
-            return self._create_limit_response(
-                detail="Chat rate limit exceeded",
-                type="chat_rate_limit_exceeded",
-                limit=self.chat_rate,
-                retry_after=retry_after,
-                friendly_message="You're sending messages too quickly! Please wait before sending another message."
-            )
-        return None
+    def _global_limit_response(self, retry_after: int) -> Response:
+        return self._create_limit_response(
+            detail="Global rate limit exceeded",
+            type="rate_limit_exceeded",
+            limit=self.global_rate,
+            retry_after=retry_after,
+            friendly_message=f"You've reached the global rate limit. Please try again in {retry_after} seconds."
+        )
+
+    def _chat_limit_response(self, retry_after: int) -> Response:
+        return self._create_limit_response(
+            detail="Chat rate limit exceeded",
+            type="chat_rate_limit_exceeded",
+            limit=self.chat_rate,
+            retry_after=retry_after,
+            friendly_message="You're sending messages too quickly! Please wait before sending another message."
+        )
 
     def _create_limit_response(self, detail: str, type: str, limit: str, 
                              retry_after: int, friendly_message: str) -> Response:
@@ -98,29 +195,45 @@ class RateLimiter:
             status_code=429
         )
 
-    async def _check_limit(self, key: str, limit: str) -> Tuple[bool, int]:
+    async def _check_limits(self, limits: List[Tuple[str, str, str]]) -> Tuple[Optional[int], int]:
         """
-        Check if the request is within rate limits
-        Returns (is_allowed, retry_after_seconds)
+        Check every (key, limit, strategy) triple, locally when the local tier can decide
+        and otherwise atomically in a single script call.
+        Returns (index of the first exceeded limit or None, retry_after_seconds)
         """
-        count, period = self._parse_limit(limit)
-        period_seconds = self._convert_period_to_seconds(period)
-            
-        # Use Redis for atomic increment and expire
-        current = self.redis.incr(key)
-        logger.debug(f"Rate limit check - Key: {key}, Current: {current}, Limit: {count}")
-        
-        if current == 1:
-            self.redis.expire(key, period_seconds)
-            logger.debug(f"Set expiry for key {key} to {period_seconds} seconds")
-        
-        # If we've exceeded the limit, get the TTL
-        if current > count:
-            retry_after = self.redis.ttl(key)
-            logger.debug(f"Rate limit exceeded for key {key}. Retry after: {retry_after} seconds")
-            return False, max(0, retry_after)
-            
-        return True, 0
+        started_at = time.perf_counter()
+        keys = [key for key, _, _ in limits]
+        if self.local_tier is not None:
+            decision = self.local_tier.precheck(keys)
+            if decision is not None:
+                RATE_LIMIT_CHECK_SECONDS.labels("local").observe(time.perf_counter() - started_at)
+                RATE_LIMIT_DECISIONS.labels("local", "allowed" if decision[0] is None else "denied").inc()
+                return decision
+            pending = self.local_tier.take_pending(keys)
+        else:
+            pending = [0] * len(limits)
+
+        args = []
+        for (_, limit, strategy), pending_count in zip(limits, pending):
+            count, period = self._parse_limit(limit)
+            args.extend([STRATEGIES[strategy], count, self._convert_period_to_seconds(period), pending_count])
+
+        try:
+            result = await self.check_limits_script(keys=keys, args=args)
+        except Exception:
+            if self.local_tier is not None:
+                self.local_tier.restore_pending(keys, pending)
+            raise
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Rate limit check - Keys: {keys}, Result: {result}", extra={"sample_rate": 0.01})
+
+        denied = int(result[0]) - 1 if int(result[0]) else None
+        retry_after = max(0, int(result[1]))
+        if self.local_tier is not None:
+            self.local_tier.record(keys, denied, retry_after, [int(headroom) for headroom in result[2:]])
+        RATE_LIMIT_CHECK_SECONDS.labels("redis").observe(time.perf_counter() - started_at)
+        RATE_LIMIT_DECISIONS.labels("redis", "allowed" if denied is None else "denied").inc()
+        return denied, retry_after
 
     def _parse_limit(self, limit: str) -> Tuple[int, str]:
         """Parse rate limit string into count and period"""
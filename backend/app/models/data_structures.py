@@ -2,7 +2,7 @@ from pydantic import BaseModel, field_validator
 from datetime import datetime, timezone
 from typing import Optional, List
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column
+from sqlalchemy import Column, DateTime
 from sqlalchemy.dialects.postgresql import JSONB
 from pgvector.sqlalchemy import Vector
 from datetime import datetime
@@ -15,7 +15,8 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
-    messages: List[Message]
+    # Omitted when the server keeps the session history
+    messages: Optional[List[Message]] = None
     session_id: str
     timestamp: float
 
@@ -30,10 +31,14 @@ class ChatLog(SQLModel, table=True):
     session_id: str = Field(index=True)
     user_message: str = Field(index=True)
     assistant_message: str = Field(default="")
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Timezone-aware columns: asyncpg cannot bind aware datetimes to timestamp without time zone
+    timestamp: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        nullable=False
+        sa_column=Column(DateTime(timezone=True), nullable=False)
     )
 
     class Config:
@@ -42,6 +47,13 @@ class ChatLog(SQLModel, table=True):
         }
 
 
+class RetrievedChunk(BaseModel):
+    """A chunk returned by a retrieval backend other than Postgres"""
+    content: str
+    doc_metadata: dict
+    similarity: float
+
+
 class RateLimitResponse(BaseModel):
     """Response structure for rate limit exceeded cases"""
     detail: str
@@ -61,15 +73,33 @@ class RateLimitResponse(BaseModel):
             }
         }
         
+class Document(SQLModel, table=True):
+    """Manifest entry for an indexed markdown file, used to detect changes at startup"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    source: str = Field(unique=True, index=True)
+    size: int = Field(nullable=False)
+    mtime: float = Field(nullable=False)
+    content_hash: str = Field(nullable=False)
+    chunk_count: int = Field(default=0, nullable=False)
+    embedding_model: Optional[str] = Field(default=None)
+    updated_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=Column(DateTime(timezone=True), nullable=False)
+    )
+
+
 class DocumentChunk(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    document_id: Optional[int] = Field(default=None, foreign_key="document.id", ondelete="CASCADE", index=True)
     content: str = Field(nullable=False)
     embedding: List[float] = Field(sa_column=Column(Vector(1536)))
+    # Hash of the chunk text, used to reuse embeddings across re-indexing and files
+    chunk_hash: Optional[str] = Field(default=None, index=True)
     doc_metadata: dict = Field(
         default_factory=dict, 
         sa_column=Column("doc_metadata", JSONB)
     )
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        nullable=False
+        sa_column=Column(DateTime(timezone=True), nullable=False)
     ) 
\ No newline at end of file
@@ -0,0 +1,63 @@
+import time
+from typing import Optional
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class IndexingStatus:
+    """
+    Progress of the background document indexing run, reported by the readiness endpoint.
+
+    The service is ready once a consistent index exists: either a previous run left one
+    in the database, in which case chats are served from it while re-indexing runs, or
+    the current run has finished.
+    """
+
+    def __init__(self):
+        self.state = "pending"
+        self.has_previous_index = False
+        self.documents_total = 0
+        self.documents_changed = 0
+        self.documents_indexed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready" or self.has_previous_index
+
+    def start(self) -> None:
+        self.state = "indexing"
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+        self.documents_total = self.documents_changed = self.documents_indexed = 0
+
+    def document_indexed(self) -> None:
+        self.documents_indexed += 1
+
+    def finish(self) -> None:
+        self.state = "ready"
+        self.finished_at = time.time()
+        logger.info(f"Indexing finished in {self.finished_at - self.started_at:.1f}s, "
+                    f"{self.documents_indexed} of {self.documents_total} documents re-indexed")
+
+    def fail(self, error: Exception) -> None:
+        self.state = "failed"
+        self.finished_at = time.time()
+        self.error = str(error)
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "documents_total": self.documents_total,
+            "documents_changed": self.documents_changed,
+            "documents_indexed": self.documents_indexed,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
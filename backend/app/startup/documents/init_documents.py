@@ -1,17 +1,33 @@
 from pathlib import Path
+from typing import Optional
 from app.logs.logger import get_logger
 from app.db.db_handler import DatabaseHandler
+from app.db.memory_index import MemoryVectorIndex
 from app.logic.document_indexer import DocumentIndexer
+from app.logic.response_cache import SemanticResponseCache
+from app.startup.documents.indexing_status import IndexingStatus
 
 logger = get_logger(__name__)
 
 
-async def init_documents(document_indexer: DocumentIndexer, db_handler: DatabaseHandler):
+async def init_documents(document_indexer: DocumentIndexer, db_handler: DatabaseHandler,
+                         response_cache: Optional[SemanticResponseCache] = None,
+                         memory_index: Optional[MemoryVectorIndex] = None,
+                         status: Optional[IndexingStatus] = None):
     """
     Process markdown documents found in the docs folder by reading each file,
     chunking it with DocumentService and storing it into the database.
-    Updates existing documents if their content has changed.
+    Files are checked against the documents manifest; a file whose size and mtime
+    match its manifest entry is skipped without being read.
+    Chunks from all new or changed files are embedded together in batches, and
+    each document's chunks are replaced in one transaction once all are embedded.
+    Chunks whose text is already stored reuse their embedding instead of being re-embedded.
+    Updates existing documents if their content has changed, drops cached
+    answers that may have been generated from the old content and re-exports
+    the in-memory retrieval index. Progress is reported through `status`.
     """
+    status = status or IndexingStatus()
+    status.start()
 
     docs_dir = Path(__file__).resolve().parents[3] / "docs"
 
@@ -19,36 +35,92 @@ async def init_documents(document_indexer: DocumentIndexer, db_handler: Database
 
     if not docs_dir.exists():
         logger.error(f"Docs directory {docs_dir} does not exist.")
+        status.finish()
         return
 
+    # One query for the whole manifest instead of per-file lookups
+    manifest = await db_handler.get_document_manifest()
+    # Chunks, not manifest rows: a manifest without chunks has nothing to answer from
+    status.has_previous_index = await db_handler.has_chunks()
+    embedding_model = document_indexer.embedding_model
+
+    corpus_changed = False
+    pending_documents = {}
+    document_info = {}
     for file_path in docs_dir.glob("*.md"):
         str_path = str(file_path)
         logger.info(f"Checking file: {str_path}")
+        status.documents_total += 1
+        stat = file_path.stat()
+        entry = manifest.get(str_path)
+        indexed = entry is not None and entry.embedding_model == embedding_model
+
+        # Same size and mtime as when indexed: skip without reading the file
+        if indexed and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            logger.debug(f"Skipping unchanged file: {str_path}")
+            continue
         
         # Read the current file content and calculate its hash
         with open(str_path, 'r') as file:
             content = file.read()
         current_hash = document_indexer.calculate_content_hash(content)
         
-        # Check if document exists and get its stored hash
-        if await db_handler.document_exists(str_path):
-            stored_hash = await db_handler.get_document_hash(str_path)
-            
-            if stored_hash == current_hash:
-                logger.debug(f"Skipping unchanged file: {str_path}")
-                continue
-                
+        if indexed and entry.content_hash == current_hash:
+            logger.debug(f"Skipping touched but unchanged file: {str_path}")
+            await db_handler.update_document_stat(str_path, stat.st_size, stat.st_mtime)
+            continue
+
+        if entry is not None:
             logger.info(f"Updating modified file: {str_path}")
-            # Delete existing chunks before processing updated content
-            await db_handler.delete_document_chunks(str_path)
         else:
             logger.info(f"Processing new file: {str_path}")
         
-        # Process and store the document chunks
-        chunks = document_indexer.process_markdown(str_path)
+        corpus_changed = True
+        status.documents_changed += 1
+        pending_documents[str_path] = document_indexer.split_markdown(str_path, content)
+        document_info[str_path] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'content_hash': current_hash,
+            'embedding_model': embedding_model
+        }
+
+    # Reuse stored embeddings for chunk texts we have seen before, in any file,
+    # and embed every remaining distinct chunk text only once
+    chunk_hashes = {chunk['chunk_hash'] for chunks in pending_documents.values() for chunk in chunks}
+    known_embeddings = await db_handler.get_embeddings_by_hash(list(chunk_hashes), embedding_model) if chunk_hashes else {}
+    unique_chunks = {}
+    for chunks in pending_documents.values():
         for chunk in chunks:
-            await db_handler.store_document_chunk(
-                content=chunk['content'],
-                embedding=chunk['embedding'],
-                metadata=chunk['metadata']
-            ) 
\ No newline at end of file
+            if chunk['chunk_hash'] not in known_embeddings:
+                unique_chunks.setdefault(chunk['chunk_hash'], chunk)
+    if chunk_hashes:
+        logger.info(f"Reusing {len(known_embeddings)} stored embeddings, "
+                    f"embedding {len(unique_chunks)} of {len(chunk_hashes)} distinct chunks")
+
+    async def write_ready_documents():
+        # Each document is swapped in atomically once every one of its chunks has an embedding
+        for str_path, chunks in list(pending_documents.items()):
+            if all(chunk['chunk_hash'] in known_embeddings for chunk in chunks):
+                await db_handler.replace_document_chunks(str_path, [
+                    {**chunk, 'embedding': known_embeddings[chunk['chunk_hash']]} for chunk in chunks
+                ], document_info[str_path])
+                del pending_documents[str_path]
+                status.document_indexed()
+
+    # Documents made only of known chunks, or emptied ones, need no embedding calls
+    await write_ready_documents()
+    async for batch in document_indexer.embed_chunks(list(unique_chunks.values())):
+        for chunk in batch:
+            known_embeddings[chunk['chunk_hash']] = chunk['embedding']
+        await write_ready_documents()
+
+    if corpus_changed:
+        await db_handler.refresh_vector_index()
+        if response_cache is not None:
+            await response_cache.invalidate()
+
+    if memory_index is not None and (corpus_changed or not memory_index.exists()):
+        await memory_index.export(db_handler)
+
+    status.finish()
@@ -0,0 +1,217 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+PERCENTILES = (50, 90, 95, 99)
+
+WORDS = ("experience", "project", "python", "backend", "team", "design", "database", "deployment",
+         "latency", "cloud", "skills", "education", "role", "architecture", "testing", "api")
+
+
+@dataclass
+class LoadTestConfig:
+    """
+    Settings of one load-test run against /chat.
+
+    With arrival_rate > 0 requests arrive open-loop (Poisson, requests per second) and
+    concurrency caps how many are in flight; with arrival_rate 0 each of the concurrency
+    workers sends its next request as soon as the previous one finished.
+    Distributions are "value:weight" lists, e.g. "0:0.5,4:0.3,10:0.2".
+    """
+    base_url: str = "http://localhost:8000"
+    concurrency: int = 8
+    arrival_rate: float = 0.0
+    requests: int = 200
+    history_lengths: str = "0:0.5,2:0.3,8:0.2"
+    message_words: str = "8:0.6,24:0.3,64:0.1"
+    timeout: float = 60.0
+    seed: int = 0
+
+
+@dataclass
+class RequestResult:
+    status: int = 0
+    ttft: Optional[float] = None
+    latency: Optional[float] = None
+    frames: int = 0
+    characters: int = 0
+    inter_token: List[float] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def parse_distribution(spec: str) -> Tuple[List[int], List[float]]:
+    """Parse "value:weight,..." into values and weights"""
+    values, weights = [], []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        value, _, weight = entry.partition(":")
+        values.append(int(value))
+        weights.append(float(weight or 1))
+    return values, weights
+
+
+def parse_frame(line: str) -> Optional[str]:
+    """Return the text of a `0:` stream frame, None for blank or other frame types"""
+    if not line.startswith("0:"):
+        return None
+    return json.loads(line[2:])
+
+
+def build_chat_request(rng: random.Random, history_lengths: Tuple[List[int], List[float]],
+                       message_words: Tuple[List[int], List[float]]) -> dict:
+    """A ChatRequest body with a sampled conversation length and message size"""
+    def sentence() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(rng.choices(*message_words)[0]))
+
+    history = rng.choices(*history_lengths)[0]
+    return {
+        "message": sentence(),
+        "messages": [{"role": "user" if i % 2 == 0 else "assistant", "content": sentence()} for i in range(history)],
+        "session_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "timestamp": time.time(),
+    }
+
+
+async def send_chat(client: httpx.AsyncClient, body: dict) -> RequestResult:
+    """Send one chat and time its stream frame by frame"""
+    result = RequestResult()
+    started = time.perf_counter()
+    last_frame = None
+    try:
+        async with client.stream("POST", "/chat", json=body) as response:
+            result.status = response.status_code
+            if response.status_code != 200:
+                await response.aread()
+                return result
+            async for line in response.aiter_lines():
+                text = parse_frame(line)
+                if text is None:
+                    continue
+                now = time.perf_counter()
+                if last_frame is None:
+                    result.ttft = now - started
+                else:
+                    result.inter_token.append(now - last_frame)
+                last_frame = now
+                result.frames += 1
+                result.characters += len(text)
+        result.latency = time.perf_counter() - started
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    return result
+
+
+async def run_load_test(config: LoadTestConfig, transport: Optional[httpx.AsyncBaseTransport] = None) -> dict:
+    """Drive /chat according to config and return the summary of the run"""
+    rng = random.Random(config.seed)
+    history_lengths = parse_distribution(config.history_lengths)
+    message_words = parse_distribution(config.message_words)
+    bodies = [build_chat_request(rng, history_lengths, message_words) for _ in range(config.requests)]
+    slots = asyncio.Semaphore(config.concurrency)
+    limits = httpx.Limits(max_connections=config.concurrency, max_keepalive_connections=config.concurrency)
+
+    async with httpx.AsyncClient(base_url=config.base_url, timeout=config.timeout, limits=limits,
+                                 transport=transport) as client:
+        async def limited(body: dict) -> RequestResult:
+            async with slots:
+                return await send_chat(client, body)
+
+        started = time.perf_counter()
+        if config.arrival_rate > 0:
+            tasks = []
+            for body in bodies:
+                tasks.append(asyncio.create_task(limited(body)))
+                await asyncio.sleep(rng.expovariate(config.arrival_rate))
+            results = await asyncio.gather(*tasks)
+        else:
+            results = await asyncio.gather(*(limited(body) for body in bodies))
+        wall_time = time.perf_counter() - started
+
+    return summarize(results, wall_time)
+
+
+def _percentiles(values: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {f"p{p}": None for p in PERCENTILES}
+    return {f"p{p}": round(float(v), 6) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def summarize(results: List[RequestResult], wall_time: float) -> dict:
+    """Aggregate per-request results into rates and latency percentiles (seconds)"""
+    total = len(results)
+    completed = [r for r in results if r.status == 200 and r.error is None]
+    rate_limited = sum(r.status == 429 for r in results)
+    errors = total - len(completed) - rate_limited
+    return {
+        "requests": total,
+        "completed": len(completed),
+        "wall_time": round(wall_time, 3),
+        "throughput_rps": round(len(completed) / wall_time, 3) if wall_time else 0.0,
+        "frames_per_second": round(sum(r.frames for r in completed) / wall_time, 3) if wall_time else 0.0,
+        "rate_limited_rate": round(rate_limited / total, 4) if total else 0.0,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "ttft": _percentiles([r.ttft for r in completed if r.ttft is not None]),
+        "inter_token": _percentiles([gap for r in completed for gap in r.inter_token]),
+        "latency": _percentiles([r.latency for r in completed if r.latency is not None]),
+        "errors": sorted({r.error for r in results if r.error})[:10],
+    }
+
+
+def compare(baseline: dict, current: dict) -> Dict[str, Optional[float]]:
+    """Relative change of the headline numbers of two runs, e.g. {"ttft.p99": 0.12} for +12%"""
+    changes = {}
+    for metric in ("ttft", "inter_token", "latency"):
+        for percentile in ("p50", "p99"):
+            before, after = baseline[metric][percentile], current[metric][percentile]
+            changes[f"{metric}.{percentile}"] = round(after / before - 1, 4) if before and after is not None else None
+    for metric in ("throughput_rps", "rate_limited_rate", "error_rate"):
+        before, after = baseline[metric], current[metric]
+        changes[metric] = round(after / before - 1, 4) if before else None
+    return changes
+
+
+def main() -> None:
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser(description="Load-test the /chat streaming endpoint")
+    parser.add_argument("--base-url", default=defaults.base_url)
+    parser.add_argument("--concurrency", type=int, default=defaults.concurrency)
+    parser.add_argument("--arrival-rate", type=float, default=defaults.arrival_rate,
+                        help="Requests per second (Poisson arrivals); 0 runs closed-loop")
+    parser.add_argument("--requests", type=int, default=defaults.requests)
+    parser.add_argument("--history-lengths", default=defaults.history_lengths)
+    parser.add_argument("--message-words", default=defaults.message_words)
+    parser.add_argument("--timeout", type=float, default=defaults.timeout)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--output", default=None, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    config = LoadTestConfig(**{k: v for k, v in vars(args).items() if k not in ("output", "baseline")})
+    summary = asyncio.run(run_load_test(config))
+    report = {"started_at": datetime.now(timezone.utc).isoformat(), "config": asdict(config), "summary": summary}
+    if args.baseline:
+        report["compared_to"] = args.baseline
+        report["changes"] = compare(json.loads(Path(args.baseline).read_text())["summary"], summary)
+
+    output = Path(args.output or f"perf/results/load_test_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps(report, indent=2))
+    logger.info(f"Load test results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
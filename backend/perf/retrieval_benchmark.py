@@ -0,0 +1,296 @@
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from app.db.memory_index import MemoryVectorIndex
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "retrieval.json"
+
+
+def make_corpus(size: int, dims: int, clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random cluster centres, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dims)).astype(np.float32)
+    corpus = np.empty((size, dims), dtype=np.float32)
+    # Generate in blocks to keep peak memory near the size of the corpus itself
+    for start in range(0, size, 65536):
+        block = min(65536, size - start)
+        assignments = rng.integers(0, clusters, block)
+        corpus[start:start + block] = centres[assignments] + 0.5 * rng.standard_normal((block, dims), dtype=np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    return corpus
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float = 0.3, seed: int = 1) -> np.ndarray:
+    """Perturbed copies of random corpus vectors, so every query has close neighbours"""
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, corpus.shape[0], count)]
+    queries = picks + noise * rng.standard_normal(picks.shape, dtype=np.float32) / np.sqrt(corpus.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Ground-truth ids of the k most cosine-similar corpus vectors for each query"""
+    truth = np.empty((queries.shape[0], k), dtype=np.int64)
+    for start in range(0, queries.shape[0], 64):
+        scores = queries[start:start + 64] @ corpus.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        truth[start:start + 64] = np.take_along_axis(top, order, axis=1)
+    return truth
+
+
+def recall_at_k(found: Iterable[Iterable[int]], truth: np.ndarray) -> float:
+    """Mean share of the exact top-k that a backend returned"""
+    hits = [len(set(ids) & set(expected.tolist())) / len(expected) for ids, expected in zip(found, truth)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def summarize(name: str, params: dict, latencies: List[float], found: List[List[int]], truth: np.ndarray,
+              build_seconds: Optional[float] = None) -> dict:
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {
+        "backend": name,
+        "params": params,
+        "recall_at_k": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(p50), 3),
+        "p99_ms": round(float(p99), 3),
+        "qps": round(len(latencies) / sum(latencies), 1),
+        "build_seconds": round(build_seconds, 3) if build_seconds is not None else None,
+    }
+
+
+class PgvectorBenchmark:
+    """
+    Loads a synthetic corpus into its own table of a local pgvector database and times
+    exact search and ANN searches with the same ORDER BY ... LIMIT query shape as
+    DatabaseHandler.search_similar_chunks (cosine distance).
+    """
+
+    TABLE = "retrieval_benchmark"
+
+    def __init__(self, connection_url: str):
+        import psycopg2
+        from pgvector.psycopg2 import register_vector
+
+        self.connection = psycopg2.connect(connection_url)
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        register_vector(self.connection)
+
+    def load(self, corpus: np.ndarray) -> float:
+        started = time.perf_counter()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+            cursor.execute(f"CREATE TABLE {self.TABLE} (id integer PRIMARY KEY, embedding vector({corpus.shape[1]}))")
+            for start in range(0, corpus.shape[0], 5000):
+                rows = "".join(
+                    f"{start + i}\t[{','.join(map(str, vector.tolist()))}]\n"
+                    for i, vector in enumerate(corpus[start:start + 5000])
+                )
+                cursor.copy_expert(f"COPY {self.TABLE} (id, embedding) FROM STDIN", io.StringIO(rows))
+            cursor.execute(f"ANALYZE {self.TABLE}")
+        return time.perf_counter() - started
+
+    def build_index(self, index_type: str, params: dict) -> float:
+        """Replace the table's vector index; returns the build time in seconds"""
+        started = time.perf_counter()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {self.TABLE}_embedding_idx")
+            if index_type != "none":
+                options = ", ".join(f"{key} = {int(value)}" for key, value in params.items())
+                cursor.execute(f"CREATE INDEX {self.TABLE}_embedding_idx ON {self.TABLE} "
+                               f"USING {index_type} (embedding vector_cosine_ops) WITH ({options})")
+        return time.perf_counter() - started
+
+    def search(self, queries: np.ndarray, k: int, settings: Dict[str, int]) -> Tuple[List[float], List[List[int]]]:
+        latencies, found = [], []
+        with self.connection.cursor() as cursor:
+            for name, value in settings.items():
+                cursor.execute(f"SET {name} = {int(value)}")
+            for query in queries:
+                started = time.perf_counter()
+                cursor.execute(f"SELECT id FROM {self.TABLE} ORDER BY embedding <=> %s LIMIT %s", (query, k))
+                ids = [row[0] for row in cursor.fetchall()]
+                latencies.append(time.perf_counter() - started)
+                found.append(ids)
+            for name in settings:
+                cursor.execute(f"RESET {name}")
+        return latencies, found
+
+    def close(self) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.TABLE}")
+        self.connection.close()
+
+
+def run_pgvector(bench: PgvectorBenchmark, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray,
+                 k: int, hnsw_ef_search: List[int], ivfflat_probes: List[int]) -> List[dict]:
+    results = []
+    load_seconds = bench.load(corpus)
+    logger.info(f"Loaded {corpus.shape[0]} vectors into pgvector in {load_seconds:.1f}s")
+
+    bench.build_index("none", {})
+    latencies, found = bench.search(queries, k, {})
+    results.append(summarize("pgvector-seqscan", {}, latencies, found, truth))
+
+    build_seconds = bench.build_index("hnsw", {"m": 16, "ef_construction": 64})
+    for ef_search in hnsw_ef_search:
+        latencies, found = bench.search(queries, k, {"hnsw.ef_search": ef_search})
+        results.append(summarize("pgvector-hnsw", {"m": 16, "ef_construction": 64, "ef_search": ef_search},
+                                 latencies, found, truth, build_seconds))
+
+    # Same rule of thumb as VECTOR_IVFFLAT_LISTS: about rows / 1000 clusters
+    lists = max(1, corpus.shape[0] // 1000)
+    build_seconds = bench.build_index("ivfflat", {"lists": lists})
+    for probes in ivfflat_probes:
+        if probes > lists:
+            continue
+        latencies, found = bench.search(queries, k, {"ivfflat.probes": probes})
+        results.append(summarize("pgvector-ivfflat", {"lists": lists, "probes": probes},
+                                 latencies, found, truth, build_seconds))
+    return results
+
+
+def run_memory(corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    """Time MemoryVectorIndex, the in-process retrieval backend, on the same corpus"""
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = MemoryVectorIndex(index_dir)
+        started = time.perf_counter()
+        index._write_generation([("", {"id": i}, vector) for i, vector in enumerate(corpus)])
+        build_seconds = time.perf_counter() - started
+
+        async def search_all() -> Tuple[List[float], List[List[int]]]:
+            latencies, found = [], []
+            for query in queries:
+                started = time.perf_counter()
+                chunks = await index.search_similar_chunks(query, k)
+                latencies.append(time.perf_counter() - started)
+                found.append([chunk.doc_metadata["id"] for chunk in chunks])
+            return latencies, found
+
+        latencies, found = asyncio.run(search_all())
+        return summarize("memory", {}, latencies, found, truth, build_seconds)
+
+
+def result_key(size: int, result: dict) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()))
+    return f"{size}/{result['backend']}/{params}"
+
+
+def find_regressions(baseline: dict, current: dict, recall_tolerance: float = 0.02,
+                     latency_tolerance: Optional[float] = None) -> List[str]:
+    """
+    Configurations whose recall dropped beyond recall_tolerance. With latency_tolerance, also
+    those whose p99 grew by more than that fraction; absolute latencies only compare on the
+    machine the baseline was recorded on, so that check is off by default.
+    """
+    previous = {result_key(run["size"], result): result for run in baseline["runs"] for result in run["results"]}
+    regressions = []
+    for run in current["runs"]:
+        for result in run["results"]:
+            key = result_key(run["size"], result)
+            before = previous.get(key)
+            if before is None:
+                continue
+            if result["recall_at_k"] < before["recall_at_k"] - recall_tolerance:
+                regressions.append(f"{key}: recall@k {before['recall_at_k']} -> {result['recall_at_k']}")
+            if latency_tolerance is not None and result["p99_ms"] > before["p99_ms"] * (1 + latency_tolerance):
+                regressions.append(f"{key}: p99 {before['p99_ms']}ms -> {result['p99_ms']}ms")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Retrieval recall and latency benchmark")
+    parser.add_argument("--sizes", type=_int_list, default=[1000, 10000, 100000],
+                        help="Corpus sizes, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--dims", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", default="memory,pgvector")
+    parser.add_argument("--hnsw-ef-search", type=_int_list, default=[20, 40, 80, 160])
+    parser.add_argument("--ivfflat-probes", type=_int_list, default=[1, 5, 10, 20])
+    parser.add_argument("--dsn", default=None, help="Postgres URL, defaults to the POSTGRES_* settings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Where to write the JSON results")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--latency-tolerance", type=float, default=None,
+                        help="Also fail when p99 grows by more than this fraction, e.g. 0.25; "
+                             "only meaningful on the machine the baseline was recorded on")
+    args = parser.parse_args()
+
+    backends = {backend.strip() for backend in args.backends.split(",")}
+    bench = None
+    if "pgvector" in backends:
+        from app.factory import get_db_config
+        bench = PgvectorBenchmark(args.dsn or get_db_config().get_connection_url())
+
+    runs = []
+    try:
+        for size in args.sizes:
+            corpus = make_corpus(size, args.dims, seed=args.seed)
+            queries = make_queries(corpus, args.queries, seed=args.seed + 1)
+            truth = exact_top_k(corpus, queries, args.k)
+            results = []
+            if "memory" in backends:
+                results.append(run_memory(corpus, queries, truth, args.k))
+            if bench is not None:
+                results.extend(run_pgvector(bench, corpus, queries, truth, args.k,
+                                            args.hnsw_ef_search, args.ivfflat_probes))
+            for result in results:
+                logger.info(f"{size} {result['backend']} {result['params']}: recall@{args.k}={result['recall_at_k']} "
+                            f"p50={result['p50_ms']}ms p99={result['p99_ms']}ms")
+            runs.append({"size": size, "results": results})
+    finally:
+        if bench is not None:
+            bench.close()
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {"dims": args.dims, "queries": args.queries, "k": args.k, "seed": args.seed},
+        "runs": runs,
+    }
+    output = Path(args.output or f"perf/results/retrieval_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    logger.info(f"Retrieval benchmark results written to {output}")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2))
+        logger.info(f"Baseline updated at {baseline_path}")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline["config"] != report["config"]:
+            logger.warning(f"Baseline {baseline_path} was recorded with {baseline['config']}, not comparing")
+            return
+        regressions = find_regressions(baseline, report, latency_tolerance=args.latency_tolerance)
+        for regression in regressions:
+            logger.warning(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
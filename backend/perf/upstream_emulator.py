@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Union
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.logic.tokenizer import count_tokens, get_encoding
+from app.logs.logger import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDING_DIMENSIONS = 1536
+
+WORDS = ("the", "a", "project", "team", "built", "service", "latency", "database", "python", "design",
+         "experience", "results", "improved", "system", "users", "data", "pipeline", "deployed", "cloud",
+         "api", "tests", "reliable", "scaled", "with", "and", "for", "to", "of", "in", "on")
+
+
+@dataclass
+class EmulatorConfig:
+    """
+    Latency and failure profile of the emulated upstream.
+
+    Delays are in seconds; jitter scales every delay by a random factor in [1 - jitter, 1 + jitter].
+    error_rate and rate_limit_rate are the shares of requests answered with 500 and 429.
+    """
+    ttft: float = 0.3
+    tokens_per_second: float = 50.0
+    jitter: float = 0.1
+    completion_tokens: int = 120
+    embedding_latency: float = 0.02
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word: str, dimensions: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+
+def embed_text(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> np.ndarray:
+    """
+    Deterministic unit-length embedding: the sum of per-word vectors seeded by each word's hash,
+    so the same text always maps to the same vector and texts sharing words end up close.
+    """
+    words = re.findall(r"\w+", text.lower()) or [""]
+    vector = np.sum([_word_vector(word, dimensions) for word in words], axis=0)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def completion_text(messages: List[dict], tokens: int) -> List[str]:
+    """Deterministic completion tokens derived from the conversation"""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).digest()
+    rng = random.Random(digest)
+    return [("" if i == 0 else " ") + rng.choice(WORDS) for i in range(tokens)]
+
+
+def _decode_input(value: Union[str, List[int]]) -> str:
+    if isinstance(value, str):
+        return value
+    # Token ids, as sent by clients that check the context length with tiktoken
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(value)
+    return " ".join(str(token) for token in value)
+
+
+def _error(status_code: int, message: str, error_type: str, headers: Optional[dict] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"message": message, "type": error_type, "param": None, "code": error_type}},
+        headers=headers,
+    )
+
+
+def create_emulator(config: EmulatorConfig) -> FastAPI:
+    """FastAPI app serving the OpenAI chat completions and embeddings endpoints"""
+    app = FastAPI()
+    rng = random.Random(config.seed)
+
+    def delay(seconds: float) -> float:
+        return max(0.0, seconds * (1 + rng.uniform(-config.jitter, config.jitter)))
+
+    def injected_failure() -> Optional[JSONResponse]:
+        roll = rng.random()
+        if roll < config.rate_limit_rate:
+            return _error(429, "Rate limit reached (emulated)", "rate_limit_exceeded", {"retry-after": "1"})
+        if roll < config.rate_limit_rate + config.error_rate:
+            return _error(500, "Internal server error (emulated)", "server_error")
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        model = body.get("model", "emulator")
+        messages = body.get("messages", [])
+        max_tokens = body.get("max_tokens") or config.completion_tokens
+        tokens = completion_text(messages, min(config.completion_tokens, max_tokens))
+        prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in messages)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        completion_id = f"chatcmpl-{hashlib.md5(json.dumps(messages).encode()).hexdigest()[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            duration = delay(config.ttft)
+            if config.tokens_per_second > 0:
+                duration += len(tokens) / config.tokens_per_second
+            await asyncio.sleep(duration)
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(tokens)}}],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def frame(delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(delay(config.ttft))
+            yield frame({"role": "assistant", "content": ""})
+            for token in tokens:
+                yield frame({"content": token})
+                if config.tokens_per_second > 0:
+                    await asyncio.sleep(delay(1 / config.tokens_per_second))
+            yield frame({}, "stop")
+            if include_usage:
+                usage_chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                               "model": model, "choices": [], "usage": usage}
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        texts = [_decode_input(value) for value in inputs]
+        dimensions = body.get("dimensions") or EMBEDDING_DIMENSIONS
+        await asyncio.sleep(delay(config.embedding_latency))
+
+        data = []
+        for index, text in enumerate(texts):
+            vector = embed_text(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        prompt_tokens = sum(count_tokens(text) for text in texts)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "emulator"),
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        }
+
+    return app
+
+
+def main() -> None:
+    defaults = EmulatorConfig()
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible LLM and embedding emulator")
+    parser.add_argument("--host", default=os.getenv("EMULATOR_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("EMULATOR_PORT", "9000")))
+    parser.add_argument("--ttft", type=float, default=defaults.ttft, help="Seconds until the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--jitter", type=float, default=defaults.jitter)
+    parser.add_argument("--completion-tokens", type=int, default=defaults.completion_tokens)
+    parser.add_argument("--embedding-latency", type=float, default=defaults.embedding_latency)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    config = EmulatorConfig(**{k: v for k, v in vars(args).items() if k not in ("host", "port")})
+    logger.info(f"Starting upstream emulator on {args.host}:{args.port} with {config}")
+    uvicorn.run(create_emulator(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
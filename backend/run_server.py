@@ -1,9 +1,15 @@
 import os
+from dotenv import load_dotenv
+
+# Before the app imports: loggers and their handler read LOG_* settings when modules are imported
+load_dotenv()
+
 from app import factory
 from app.controllers.chat_router import ChatRouter
+from app.controllers.metrics_router import MetricsRouter
+from app.logs import metrics
 from app.logs.logger import get_logger
 from app.startup.documents.init_documents import init_documents
-from dotenv import load_dotenv
 import uvicorn
 import asyncio
 
@@ -13,23 +19,28 @@ async def initialize_services():
     """Initialize all required services and data"""
     document_indexer = factory.document_indexer()
     db_handler = factory.database_handler()
-    await init_documents(document_indexer, db_handler)
+    status = factory.indexing_status()
+    try:
+        await init_documents(document_indexer, db_handler, factory.response_cache(), factory.memory_index(), status)
+    except Exception as e:
+        # Keep serving; chats use whatever consistent index is already stored
+        logger.exception("Document indexing failed")
+        status.fail(e)
 
 async def create_application():
     """Create and configure the FastAPI application"""
     app = factory.create_app()
     chat_service = factory.chat_service()
-    router = ChatRouter(chat_service=chat_service)
+    router = ChatRouter(chat_service=chat_service, indexing_status=factory.indexing_status(),
+                        tracer=factory.tracer())
     app.include_router(router=router.router)
+    app.include_router(router=MetricsRouter().router)
     
     return app
 
 async def run_server():
     """Main function to start the server"""
-    load_dotenv()
-    
     app = await create_application()
-    await initialize_services()
     
     logger.info("Starting the server")
     config = uvicorn.Config(
@@ -38,7 +49,27 @@ async def run_server():
         port=int(os.getenv("UVICORN_PORT"))
     )
     server = uvicorn.Server(config)
-    await server.serve()
+    chat_log_writer = factory.chat_log_writer()
+    chat_log_writer.start()
+    session_store = factory.session_store()
+    serve_task = asyncio.create_task(server.serve())
+
+    # Index documents in the background once the port is open, so cold starts
+    # answer /health and /ready immediately
+    while not server.started and not serve_task.done():
+        await asyncio.sleep(0.05)
+    indexing_task = asyncio.create_task(initialize_services())
+
+    try:
+        await serve_task
+    finally:
+        indexing_task.cancel()
+        # Write out chat logs still queued when the server stopped
+        await chat_log_writer.stop()
+        # Finish summaries still being folded in the background
+        if session_store is not None:
+            await session_store.drain()
+        metrics.mark_process_dead()
 
 if __name__ == '__main__':
     asyncio.run(run_server())
@@ -1,9 +1,13 @@
 import pytest
+import json
 from fastapi.responses import StreamingResponse
 import time
 from unittest.mock import Mock
 from fastapi import HTTPException
 
+from app.controllers.chat_router import ChatRouter
+from app.logs.tracing import Tracer, span
+
 from app.models.data_structures import ChatRequest, Message
 
 
@@ -31,6 +35,32 @@ async def test_health_check_endpoint(chat_router):
     response = await chat_router._health_check()
     assert response == {"status": "healthy"}
 
+@pytest.mark.unit
+async def test_readiness_endpoint_reports_progress(chat_router):
+    """Test that /ready is 503 while the first index is built and 200 once it is done"""
+    status = chat_router.indexing_status
+    status.start()
+    status.documents_total = 3
+    
+    response = await chat_router._readiness_check()
+    assert response.status_code == 503
+    assert json.loads(response.body)["state"] == "indexing"
+    
+    status.finish()
+    response = await chat_router._readiness_check()
+    assert response.status_code == 200
+    assert json.loads(response.body)["ready"] is True
+
+@pytest.mark.unit
+async def test_readiness_endpoint_ready_with_previous_index(chat_router):
+    """Test that a re-index over an existing index does not take the service out of rotation"""
+    chat_router.indexing_status.start()
+    chat_router.indexing_status.has_previous_index = True
+    
+    response = await chat_router._readiness_check()
+    
+    assert response.status_code == 200
+
 @pytest.mark.unit
 async def test_chat_endpoint_success(chat_router, mock_chat_service, chat_request):
     """Test successful chat endpoint response"""
@@ -55,14 +85,38 @@ async def test_chat_endpoint_unexpected_error(chat_router, mock_chat_service, ch
     assert exc_info.value.status_code == 500
     assert exc_info.value.detail == "An internal server error occurred."
 
+@pytest.mark.unit
+async def test_chat_endpoint_traced_sets_server_timing(mock_chat_service, chat_request):
+    """Test that a traced chat reports its pre-stream phases and finishes the trace after streaming"""
+    async def mock_stream():
+        with span("retrieve"):
+            pass
+        yield "0:\"Hi\"\n"
+        yield "0:\" there\"\n"
+    mock_chat_service.stream_chat.return_value = mock_stream()
+    tracer = Tracer(Mock(), sample_rate=1.0)
+    tracer.export = Mock()
+    router = ChatRouter(chat_service=mock_chat_service, tracer=tracer)
+    
+    response = await router._chat(chat_request)
+    
+    server_timing = response.headers["server-timing"]
+    assert server_timing.startswith("retrieve;dur=")
+    assert "prestream;dur=" in server_timing
+    tracer.export.assert_not_called()
+    
+    body = [chunk async for chunk in response.body_iterator]
+    assert body == ["0:\"Hi\"\n", "0:\" there\"\n"]
+    tracer.export.assert_called_once()
+
 @pytest.mark.unit
 def test_router_initialization(chat_router):
     """Test that routes are properly added during initialization"""
     routes = chat_router.router.routes
-    assert len(routes) == 3
+    assert len(routes) == 4
     
     route_paths = {route.path for route in routes}
-    assert route_paths == {"/", "/health", "/chat"}
+    assert route_paths == {"/", "/health", "/ready", "/chat"}
     
     route_methods = {
         route.path: [method for method in route.methods]
@@ -70,4 +124,5 @@ def test_router_initialization(chat_router):
     }
     assert route_methods["/"] == ["GET"]
     assert route_methods["/health"] == ["GET"]
+    assert route_methods["/ready"] == ["GET"]
     assert route_methods["/chat"] == ["POST"] 
\ No newline at end of file
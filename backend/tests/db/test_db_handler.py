@@ -1,13 +1,19 @@
+import os
+import time
+import asyncio
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+import asyncpg
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
 from datetime import datetime
 import numpy as np
+from sqlalchemy import DateTime, Integer, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql.elements import TextClause
 from sqlmodel import Session
 
 from app.db.db_handler import DatabaseHandler
-from app.db.db_config import PostgresConfig
-from app.models.data_structures import ChatLog, DocumentChunk
+from app.db.db_config import PostgresConfig, VectorIndexConfig
+from app.models.data_structures import ChatLog, ChatRequest, Document, DocumentChunk
 
 # ============================================================================
 # FIXTURES AND HELPERS
@@ -19,7 +25,20 @@ def mock_db_config():
     return PostgresConfig(
         db_name="testdb",
         user="testuser",
-        password="testpass"
+        password="testpass",
+        async_engine=False
+    )
+
+@pytest.fixture
+def mock_async_db_config():
+    """Create a PostgresConfig with the async engine enabled"""
+    return PostgresConfig(
+        db_name="testdb",
+        user="testuser",
+        password="testpass",
+        pool_size=20,
+        max_overflow=5,
+        pool_timeout=7
     )
 
 @pytest.fixture
@@ -41,13 +60,81 @@ def patched_db_handler(mock_db_config, mock_session):
         mock_create_engine.return_value = mock_engine
         
         with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
-            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
                 with patch.object(DatabaseHandler, 'get_session') as mock_get_session:
                     # Setup the context manager to return our mock session
                     mock_get_session.return_value.__enter__.return_value = mock_session
                     handler = DatabaseHandler(mock_db_config)
                     yield handler
 
+def pg_message(kind, body=b""):
+    return kind + (len(body) + 4).to_bytes(4, "big") + body
+
+class FakePostgres:
+    """
+    Just enough of the Postgres wire protocol for asyncpg to prepare and run one statement,
+    so its real parameter codecs encode the values without a database server
+    """
+
+    def __init__(self, parameter_oids):
+        self.parameter_oids = parameter_oids
+        self.binds = []
+
+    async def handle(self, reader, writer):
+        length = int.from_bytes(await reader.readexactly(4), "big")
+        await reader.readexactly(length - 4)
+        writer.write(pg_message(b"R", (0).to_bytes(4, "big")))
+        for key, value in ((b"server_version", b"16.0"), (b"client_encoding", b"UTF8"),
+                           (b"integer_datetimes", b"on"), (b"TimeZone", b"UTC")):
+            writer.write(pg_message(b"S", key + b"\0" + value + b"\0"))
+        writer.write(pg_message(b"K", (1).to_bytes(4, "big") * 2))
+        writer.write(pg_message(b"Z", b"I"))
+        replies = {
+            b"P": pg_message(b"1"),
+            b"D": pg_message(b"t", len(self.parameter_oids).to_bytes(2, "big")
+                             + b"".join(oid.to_bytes(4, "big") for oid in self.parameter_oids)) + pg_message(b"n"),
+            b"B": pg_message(b"2"),
+            b"E": pg_message(b"C", b"INSERT 0 1\0"),
+            b"S": pg_message(b"Z", b"I"),
+            b"C": pg_message(b"3"),
+        }
+        while True:
+            try:
+                kind = await reader.readexactly(1)
+                length = int.from_bytes(await reader.readexactly(4), "big")
+                body = await reader.readexactly(length - 4)
+            except asyncio.IncompleteReadError:
+                break
+            if kind == b"X":
+                break
+            if kind == b"B":
+                self.binds.append(body)
+            writer.write(replies.get(kind, b""))
+            await writer.drain()
+        writer.close()
+
+def pg_type_oid(column):
+    """Postgres type oid of a model column, for the types these tests bind"""
+    if isinstance(column.type, DateTime):
+        return 1184 if column.type.timezone else 1114
+    return 23 if isinstance(column.type, Integer) else 25
+
+async def asyncpg_insert(table, row):
+    """INSERT `row` through asyncpg, with parameter types taken from the model's columns"""
+    columns = list(row)
+    fake = FakePostgres([pg_type_oid(table.c[column]) for column in columns])
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    connection = await asyncpg.connect(host="127.0.0.1", port=server.sockets[0].getsockname()[1],
+                                       user="test", database="test", ssl=False)
+    try:
+        placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+        await connection.execute(f"INSERT INTO {table.name} VALUES ({placeholders})", *row.values())
+    finally:
+        await connection.close()
+        server.close()
+    return fake.binds
+
 # ============================================================================
 # INITIALIZATION TESTS
 # ============================================================================
@@ -57,7 +144,8 @@ def test_database_handler_initialization(mock_db_config):
     """Test that DatabaseHandler initializes with proper configuration"""
     with patch('app.db.db_handler.create_engine') as mock_create_engine:
         with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
-            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
                 # when
                 handler = DatabaseHandler(mock_db_config)
                 
@@ -70,7 +158,8 @@ def test_database_handler_initialization(mock_db_config):
 def test_setup_vector_extension(mock_db_config, mock_session):
     """Test that vector extension setup is called during initialization"""
     with patch('app.db.db_handler.create_engine'):
-        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+             patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
             with patch.object(DatabaseHandler, 'get_session') as mock_get_session:
                 # Setup the context manager
                 mock_get_session.return_value.__enter__.return_value = mock_session
@@ -90,13 +179,71 @@ def test_setup_database(mock_db_config):
     """Test that database setup is called during initialization"""
     with patch('app.db.db_handler.create_engine'):
         with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
-            with patch('app.db.db_handler.SQLModel.metadata.create_all') as mock_create_all:
+            with patch('app.db.db_handler.SQLModel.metadata.create_all') as mock_create_all, \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
                 # when
                 handler = DatabaseHandler(mock_db_config)
                 
                 # then
                 mock_create_all.assert_called_once()
 
+@pytest.mark.unit
+def test_setup_database_migrates_naive_timestamps(mock_db_config):
+    """Test that timestamp columns from earlier versions are converted to timestamptz"""
+    with patch('app.db.db_handler.create_engine') as mock_create_engine, \
+         patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'), \
+         patch('app.db.db_handler.SQLModel.metadata.create_all'), \
+         patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+        DatabaseHandler(mock_db_config)
+    
+    connection = mock_create_engine.return_value.begin.return_value.__enter__.return_value
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert any('ALTER TABLE chatlog ALTER COLUMN "timestamp" TYPE TIMESTAMPTZ' in sql for sql in statements)
+    assert any('ALTER TABLE chatlog ALTER COLUMN "created_at" TYPE TIMESTAMPTZ' in sql for sql in statements)
+    assert any('ALTER TABLE documentchunk ALTER COLUMN "created_at" TYPE TIMESTAMPTZ' in sql for sql in statements)
+    assert any('ALTER TABLE document ALTER COLUMN "updated_at" TYPE TIMESTAMPTZ' in sql for sql in statements)
+
+@pytest.mark.unit
+def test_database_handler_pool_settings_from_config(mock_async_db_config):
+    """Test that pool sizing comes from PostgresConfig for both engines"""
+    with patch('app.db.db_handler.create_engine') as mock_create_engine, \
+         patch('app.db.db_handler.create_async_engine') as mock_create_async_engine, \
+         patch('app.db.db_handler.event') as mock_event:
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                # when
+                handler = DatabaseHandler(mock_async_db_config)
+                
+                # then
+                mock_create_async_engine.assert_called_once()
+                assert mock_create_async_engine.call_args[0][0] == mock_async_db_config.get_async_connection_url()
+                for create in (mock_create_engine, mock_create_async_engine):
+                    kwargs = create.call_args[1]
+                    assert kwargs['pool_size'] == 20
+                    assert kwargs['max_overflow'] == 5
+                    assert kwargs['pool_timeout'] == 7
+                assert handler.async_engine == mock_create_async_engine.return_value
+                # The sync pool is only needed for the startup DDL
+                mock_create_engine.return_value.dispose.assert_called_once()
+                # asyncpg connections get the binary vector codec
+                mock_event.listen.assert_called_once()
+                assert mock_event.listen.call_args[0][1] == "connect"
+
+@pytest.mark.unit
+def test_database_handler_sync_mode_has_no_async_engine(mock_db_config):
+    """Test that disabling async mode skips the asyncpg engine"""
+    with patch('app.db.db_handler.create_engine'), \
+         patch('app.db.db_handler.create_async_engine') as mock_create_async_engine, \
+         patch('app.db.db_handler.event'):
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                handler = DatabaseHandler(mock_db_config)
+                
+                mock_create_async_engine.assert_not_called()
+                assert handler.async_engine is None
+
 # ============================================================================
 # SESSION MANAGEMENT TESTS
 # ============================================================================
@@ -111,8 +258,9 @@ def test_get_session_success():
     with patch('app.db.db_handler.create_engine', return_value=mock_engine):
         with patch('app.db.db_handler.Session', return_value=mock_session):
             with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
-                with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
-                    handler = DatabaseHandler(Mock())
+                with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                     patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                    handler = DatabaseHandler(Mock(async_engine=False))
                     
                     # when
                     with handler.get_session() as session:
@@ -135,8 +283,9 @@ def test_get_session_exception():
     with patch('app.db.db_handler.create_engine', return_value=mock_engine):
         with patch('app.db.db_handler.Session', return_value=mock_session):
             with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
-                with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
-                    handler = DatabaseHandler(Mock())
+                with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                     patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                    handler = DatabaseHandler(Mock(async_engine=False))
                     
                     # when
                     with pytest.raises(RuntimeError):
@@ -149,6 +298,57 @@ def test_get_session_exception():
                     mock_session.rollback.assert_called_once()
                     mock_session.close.assert_called_once()
 
+@pytest.mark.unit
+async def test_async_mode_runs_operations_on_async_session(mock_async_db_config, mock_session):
+    """Test that async mode drives queries through AsyncSession.run_sync"""
+    # given
+    mock_async_session = MagicMock()
+    mock_async_session.run_sync = AsyncMock(side_effect=lambda operation: operation(mock_session))
+    mock_exists_result = MagicMock()
+    mock_exists_result.first.return_value = (True,)
+    mock_session.exec.return_value = mock_exists_result
+    
+    with patch('app.db.db_handler.create_engine'), patch('app.db.db_handler.create_async_engine'), \
+         patch('app.db.db_handler.event'):
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                with patch.object(DatabaseHandler, 'get_session') as mock_get_session, \
+                     patch.object(DatabaseHandler, 'get_async_session') as mock_get_async_session:
+                    mock_get_async_session.return_value.__aenter__.return_value = mock_async_session
+                    handler = DatabaseHandler(mock_async_db_config)
+                    
+                    # when
+                    result = await handler.document_exists("test.md")
+                    
+                    # then
+                    assert result is True
+                    mock_async_session.run_sync.assert_awaited_once()
+                    mock_get_session.assert_not_called()
+
+@pytest.mark.unit
+async def test_get_async_session_commits_and_closes(mock_async_db_config):
+    """Test that get_async_session commits on success and always closes"""
+    mock_async_session = MagicMock()
+    mock_async_session.commit = AsyncMock()
+    mock_async_session.rollback = AsyncMock()
+    mock_async_session.close = AsyncMock()
+    
+    with patch('app.db.db_handler.create_engine'), patch('app.db.db_handler.create_async_engine'), \
+         patch('app.db.db_handler.event'):
+        with patch('app.db.db_handler.AsyncSession', return_value=mock_async_session):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+                with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                     patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                    handler = DatabaseHandler(mock_async_db_config)
+                    
+                    async with handler.get_async_session():
+                        pass
+                    
+                    mock_async_session.commit.assert_awaited_once()
+                    mock_async_session.rollback.assert_not_awaited()
+                    mock_async_session.close.assert_awaited_once()
+
 # ============================================================================
 # DATABASE OPERATIONS TESTS
 # ============================================================================
@@ -198,6 +398,68 @@ async def test_log_chat_exception(patched_db_handler, mock_session):
     
     assert "Failed to log chat to database" in str(exc_info.value)
 
+@pytest.mark.unit
+async def test_log_chats_uses_one_multi_row_insert(patched_db_handler, mock_session):
+    """Test that a batch of chat logs is written with a single INSERT"""
+    # given
+    timestamp = datetime.now()
+    chat_logs = [
+        ChatLog(user_message=f"Hello {i}", assistant_message="Hi", session_id="test-session", timestamp=timestamp)
+        for i in range(3)
+    ]
+    
+    # when
+    await patched_db_handler.log_chats(chat_logs)
+    
+    # then
+    statement, rows = mock_session.execute.call_args[0]
+    assert "INSERT INTO chatlog" in str(statement)
+    assert [row["user_message"] for row in rows] == ["Hello 0", "Hello 1", "Hello 2"]
+    assert "id" not in rows[0]
+    mock_session.execute.assert_called_once()
+
+@pytest.mark.unit
+async def test_log_chats_exception(patched_db_handler, mock_session):
+    """Test that a failed batch write raises so the writer can count it"""
+    mock_session.execute.side_effect = Exception("Database error")
+    
+    with pytest.raises(RuntimeError) as exc_info:
+        await patched_db_handler.log_chats([ChatLog(user_message="Hello", session_id="test-session")])
+    
+    assert "Failed to log chats to database" in str(exc_info.value)
+
+@pytest.mark.unit
+async def test_chat_log_row_encodes_through_asyncpg():
+    """Test that a chat log row, as log_chats builds it, passes asyncpg's parameter encoding"""
+    chat_request = ChatRequest(message="Hello", session_id="test-session", timestamp=time.time())
+    chat_log = ChatLog(user_message="Hello", assistant_message="Hi", session_id="test-session",
+                       timestamp=chat_request.timestamp)
+    
+    binds = await asyncpg_insert(ChatLog.__table__, chat_log.model_dump(exclude={'id'}))
+    
+    assert len(binds) == 1
+
+@pytest.mark.integration
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_DB"), reason="needs a Postgres database in TEST_POSTGRES_*")
+async def test_log_chats_against_postgres():
+    """Test that chat logs are written on the async engine of a real database"""
+    handler = DatabaseHandler(PostgresConfig(
+        server=os.getenv("TEST_POSTGRES_SERVER", "localhost"),
+        port=int(os.getenv("TEST_POSTGRES_PORT", "5432")),
+        db_name=os.getenv("TEST_POSTGRES_DB"),
+        user=os.getenv("TEST_POSTGRES_USER", "postgres"),
+        password=os.getenv("TEST_POSTGRES_PASSWORD", "postgres")
+    ))
+    chat_request = ChatRequest(message="Hello", session_id="integration-test", timestamp=time.time())
+    try:
+        await handler.log_chat("Hello", "Hi", "integration-test", chat_request.timestamp)
+        await handler.log_chats([ChatLog(user_message="Hello", session_id="integration-test",
+                                         timestamp=chat_request.timestamp)])
+    finally:
+        await handler._run(lambda session: session.exec(
+            text("DELETE FROM chatlog WHERE session_id = 'integration-test'")))
+        await handler.close()
+
 @pytest.mark.unit
 async def test_store_document_chunk(patched_db_handler, mock_session):
     """Test that store_document_chunk adds a DocumentChunk to the session"""
@@ -241,7 +503,9 @@ async def test_search_similar_chunks(patched_db_handler, mock_session):
     result = await handler.search_similar_chunks(query_embedding, limit)
     
     # then
-    mock_session.exec.assert_called_once()
+    # One call to set hnsw.ef_search, one for the search itself
+    assert mock_session.exec.call_count == 2
+    assert "hnsw.ef_search" in str(mock_session.exec.call_args_list[0][0][0])
     # Check that the query is a text object
     assert isinstance(mock_session.exec.call_args[0][0], TextClause)
     # Check that the parameters are correct
@@ -250,6 +514,68 @@ async def test_search_similar_chunks(patched_db_handler, mock_session):
     assert params['limit'] == limit
     mock_results.all.assert_called_once()
 
+@pytest.mark.unit
+async def test_search_similar_chunks_orders_by_index_operator(patched_db_handler, mock_session):
+    """Test that the search orders by the bare distance operator so the ANN index can be used"""
+    # when
+    await patched_db_handler.search_similar_chunks([0.1, 0.2, 0.3], 4)
+    
+    # then
+    sql = " ".join(str(mock_session.exec.call_args[0][0]).split())
+    assert "ORDER BY embedding <=> CAST(:embedding AS vector) LIMIT :limit" in sql
+    assert "1 - (embedding <=> CAST(:embedding AS vector)) as similarity" in sql
+
+@pytest.mark.unit
+async def test_search_similar_chunks_ivfflat_sets_probes(patched_db_handler, mock_session):
+    """Test that IVFFlat searches set ivfflat.probes for the transaction"""
+    # given
+    patched_db_handler.config.vector_index = VectorIndexConfig(index_type="ivfflat", distance="inner_product", probes=7)
+    
+    # when
+    await patched_db_handler.search_similar_chunks([0.1, 0.2, 0.3], 4)
+    
+    # then
+    set_config_call = mock_session.exec.call_args_list[0]
+    assert "ivfflat.probes" in str(set_config_call[0][0])
+    assert set_config_call[1]['params'] == {'value': '7'}
+    sql = " ".join(str(mock_session.exec.call_args[0][0]).split())
+    assert "ORDER BY embedding <#> CAST(:embedding AS vector)" in sql
+
+@pytest.mark.unit
+def test_setup_vector_index_creates_hnsw_and_drops_stale(mock_db_config, mock_session):
+    """Test that the configured HNSW index is created and other embedding indexes dropped"""
+    # given
+    mock_existing = MagicMock()
+    mock_existing.all.return_value = [("documentchunk_embedding_ivfflat_cosine_idx",)]
+    mock_session.exec.side_effect = [mock_existing, MagicMock(), MagicMock()]
+    
+    with patch('app.db.db_handler.create_engine'):
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'):
+                with patch.object(DatabaseHandler, 'get_session') as mock_get_session:
+                    mock_get_session.return_value.__enter__.return_value = mock_session
+                    
+                    # when
+                    DatabaseHandler(mock_db_config)
+    
+    # then
+    statements = [" ".join(str(call[0][0]).split()) for call in mock_session.exec.call_args_list]
+    assert 'DROP INDEX IF EXISTS "documentchunk_embedding_ivfflat_cosine_idx"' in statements[1]
+    assert "CREATE INDEX IF NOT EXISTS documentchunk_embedding_hnsw_cosine_idx" in statements[2]
+    assert "USING hnsw (embedding vector_cosine_ops)" in statements[2]
+    assert "WITH (m = 16, ef_construction = 64)" in statements[2]
+
+@pytest.mark.unit
+async def test_refresh_vector_index_only_for_ivfflat(patched_db_handler, mock_session):
+    """Test that only IVFFlat indexes are rebuilt after the corpus changes"""
+    # HNSW is maintained incrementally
+    await patched_db_handler.refresh_vector_index()
+    mock_session.exec.assert_not_called()
+    
+    patched_db_handler.config.vector_index = VectorIndexConfig(index_type="ivfflat")
+    await patched_db_handler.refresh_vector_index()
+    assert "REINDEX INDEX documentchunk_embedding_ivfflat_cosine_idx" in str(mock_session.exec.call_args[0][0])
+
 @pytest.mark.unit
 async def test_document_operations(patched_db_handler, mock_session):
     """Test document existence, hash retrieval, and deletion operations"""
@@ -268,7 +594,7 @@ async def test_document_operations(patched_db_handler, mock_session):
     mock_delete_result.rowcount = 1
     
     # Configure mock_session.exec to return different results for different calls
-    mock_session.exec.side_effect = [mock_exists_result, mock_hash_result, mock_delete_result]
+    mock_session.exec.side_effect = [mock_exists_result, mock_hash_result, mock_delete_result, mock_delete_result]
     
     # Test document_exists
     result = await handler.document_exists(file_path)
@@ -283,6 +609,17 @@ async def test_document_operations(patched_db_handler, mock_session):
     assert result is True
     mock_session.commit.assert_called()
 
+@pytest.mark.unit
+async def test_has_chunks(patched_db_handler, mock_session):
+    """Test that has_chunks checks the chunk table and is False on errors"""
+    mock_session.exec.return_value.first.return_value = (True,)
+    
+    assert await patched_db_handler.has_chunks() is True
+    assert "FROM documentchunk" in str(mock_session.exec.call_args[0][0])
+    
+    mock_session.exec.side_effect = Exception("Database error")
+    assert await patched_db_handler.has_chunks() is False
+
 @pytest.mark.unit
 async def test_error_handling(patched_db_handler, mock_session):
     """Test error handling in database operations"""
@@ -314,3 +651,198 @@ async def test_error_handling(patched_db_handler, mock_session):
     # Test delete_document_chunks error handling
     result = await handler.delete_document_chunks("test.txt")
     assert result is False
+
+@pytest.mark.unit
+async def test_get_all_chunks(patched_db_handler, mock_session):
+    """Test that get_all_chunks returns content, metadata and embedding tuples"""
+    # given
+    mock_session.exec.return_value.all.return_value = [("content", {"source": "a.md"}, [0.1, 0.2])]
+    
+    # when
+    result = await patched_db_handler.get_all_chunks()
+    
+    # then
+    assert result == [("content", {"source": "a.md"}, [0.1, 0.2])]
+    assert "documentchunk" in str(mock_session.exec.call_args[0][0])
+
+@pytest.mark.unit
+async def test_replace_document_chunks_sync_mode(patched_db_handler, mock_session):
+    """Test that stale rows are deleted and only new chunks are inserted in one session"""
+    # given
+    mock_session.exec.return_value.all.return_value = [("kept",), ("removed",)]
+    chunks = [
+        {"content": "a", "chunk_hash": "kept", "embedding": [0.1, 0.2], "metadata": {"source": "a.md"}},
+        {"content": "b", "chunk_hash": "new", "embedding": [0.3, 0.4], "metadata": {"source": "a.md"}},
+    ]
+    
+    # when
+    await patched_db_handler.replace_document_chunks("a.md", chunks)
+    
+    # then
+    select_call, delete_call, update_call = mock_session.exec.call_args_list
+    assert "DELETE FROM documentchunk" in str(delete_call[0][0])
+    assert delete_call[1]["params"]["file_path"] == "a.md"
+    assert sorted(delete_call[1]["params"]["hashes"]) == ["kept", "new"]
+    assert "UPDATE documentchunk" in str(update_call[0][0])
+    assert update_call[1]["params"]["metadata"] == '{"source": "a.md"}'
+    statement, rows = mock_session.execute.call_args[0]
+    assert "INSERT INTO documentchunk" in str(statement)
+    assert [row["content"] for row in rows] == ["b"]
+    assert rows[0]["chunk_hash"] == "new"
+    assert rows[0]["doc_metadata"] == {"source": "a.md"}
+    assert rows[0]["document_id"] is None
+
+@pytest.mark.unit
+async def test_replace_document_chunks_upserts_manifest(patched_db_handler, mock_session):
+    """Test that the manifest row is upserted in the same session and linked to new chunks"""
+    # given
+    mock_session.exec.return_value.all.return_value = []
+    mock_session.exec.return_value.first.return_value = ("test-model",)
+    mock_session.exec.return_value.one.return_value = (7,)
+    document = {"size": 21, "mtime": 100.0, "content_hash": "abc", "embedding_model": "test-model"}
+    
+    # when
+    await patched_db_handler.replace_document_chunks("a.md", [
+        {"content": "a", "chunk_hash": "h", "embedding": [0.1], "metadata": {"source": "a.md"}}
+    ], document)
+    
+    # then
+    upsert_call = mock_session.exec.call_args_list[2]
+    assert "INSERT INTO document" in str(upsert_call[0][0])
+    assert "ON CONFLICT (source)" in str(upsert_call[0][0])
+    assert upsert_call[1]["params"]["chunk_count"] == 1
+    assert upsert_call[1]["params"]["content_hash"] == "abc"
+    assert mock_session.exec.call_args_list[-1][1]["params"]["document_id"] == 7
+    _, rows = mock_session.execute.call_args[0]
+    assert rows[0]["document_id"] == 7
+    assert len(await asyncpg_insert(Document.__table__, {"updated_at": upsert_call[1]["params"]["updated_at"]})) == 1
+
+@pytest.mark.unit
+async def test_replace_document_chunks_replaces_embeddings_after_model_change(patched_db_handler, mock_session):
+    """Test that a new embedding model rewrites every chunk instead of keeping old-model vectors"""
+    # given
+    mock_session.exec.return_value.all.return_value = [("kept",)]
+    mock_session.exec.return_value.first.return_value = ("old-model",)
+    mock_session.exec.return_value.one.return_value = (7,)
+    document = {"size": 21, "mtime": 100.0, "content_hash": "abc", "embedding_model": "new-model"}
+    
+    # when
+    await patched_db_handler.replace_document_chunks("a.md", [
+        {"content": "a", "chunk_hash": "kept", "embedding": [0.5, 0.5], "metadata": {"source": "a.md"}},
+        {"content": "b", "chunk_hash": "new", "embedding": [0.3, 0.4], "metadata": {"source": "a.md"}},
+    ], document)
+    
+    # then
+    delete_call = next(call for call in mock_session.exec.call_args_list if "DELETE FROM documentchunk" in str(call[0][0]))
+    assert delete_call[1]["params"]["hashes"] == []
+    _, rows = mock_session.execute.call_args[0]
+    assert {row["chunk_hash"]: row["embedding"] for row in rows} == {"kept": [0.5, 0.5], "new": [0.3, 0.4]}
+    assert all(row["document_id"] == 7 for row in rows)
+
+@pytest.mark.unit
+async def test_get_document_manifest(patched_db_handler, mock_session):
+    """Test that the manifest is loaded in one query and keyed by source"""
+    document = Document(source="a.md", size=1, mtime=2.0, content_hash="abc")
+    mock_session.exec.return_value.all.return_value = [document]
+    
+    result = await patched_db_handler.get_document_manifest()
+    
+    assert result == {"a.md": document}
+    mock_session.exec.assert_called_once()
+    mock_session.expunge_all.assert_called_once()
+
+@pytest.mark.unit
+async def test_update_document_stat(patched_db_handler, mock_session):
+    """Test that a touched document gets its new size and mtime recorded"""
+    await patched_db_handler.update_document_stat("a.md", 21, 200.0)
+    
+    assert "UPDATE document SET" in str(mock_session.exec.call_args[0][0])
+    assert mock_session.exec.call_args[1]["params"] == {"file_path": "a.md", "size": 21, "mtime": 200.0}
+
+@pytest.mark.unit
+async def test_replace_document_chunks_skips_insert_when_nothing_new(patched_db_handler, mock_session):
+    """Test that an edit that only removed chunks writes no rows"""
+    mock_session.exec.return_value.all.return_value = [("a",), ("b",)]
+    
+    await patched_db_handler.replace_document_chunks("a.md", [
+        {"content": "a", "chunk_hash": "a", "embedding": [0.1], "metadata": {"source": "a.md"}}
+    ])
+    
+    mock_session.execute.assert_not_called()
+
+@pytest.mark.unit
+async def test_replace_document_chunks_async_mode_uses_copy(mock_async_db_config, mock_session):
+    """Test that async mode copies rows over the connection that ran the delete"""
+    # given
+    mock_session.exec.return_value.all.return_value = []
+    mock_async_session = MagicMock()
+    mock_async_session.run_sync = AsyncMock(side_effect=lambda operation: operation(mock_session))
+    dbapi_connection = mock_session.connection.return_value.connection.dbapi_connection
+    raw_connection = MagicMock()
+    dbapi_connection.run_async = Mock(side_effect=lambda fn: fn(raw_connection))
+    
+    with patch('app.db.db_handler.create_engine'), patch('app.db.db_handler.create_async_engine'), \
+         patch('app.db.db_handler.event'):
+        with patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_extension'):
+            with patch.object(DatabaseHandler, '_DatabaseHandler__setup_database'), \
+                 patch.object(DatabaseHandler, '_DatabaseHandler__setup_vector_index'):
+                with patch.object(DatabaseHandler, 'get_async_session') as mock_get_async_session:
+                    mock_get_async_session.return_value.__aenter__.return_value = mock_async_session
+                    handler = DatabaseHandler(mock_async_db_config)
+                    
+                    # when
+                    await handler.replace_document_chunks("a.md", [
+                        {"content": "a", "chunk_hash": "h", "embedding": [0.1, 0.2], "metadata": {"source": "a.md"}}
+                    ])
+    
+    # then
+    mock_session.execute.assert_not_called()
+    table = raw_connection.copy_records_to_table.call_args[0][0]
+    kwargs = raw_connection.copy_records_to_table.call_args[1]
+    assert table == "documentchunk"
+    assert kwargs["columns"] == ["document_id", "content", "embedding", "chunk_hash", "doc_metadata", "created_at"]
+    _, content, embedding, chunk_hash, metadata, _ = kwargs["records"][0]
+    assert content == "a"
+    assert embedding.dtype == np.float32
+    assert chunk_hash == "h"
+    assert metadata == '{"source": "a.md"}'
+    document_id, _, _, _, _, created_at = kwargs["records"][0]
+    assert len(await asyncpg_insert(DocumentChunk.__table__, {
+        "document_id": document_id, "content": content, "chunk_hash": chunk_hash, "created_at": created_at
+    })) == 1
+
+@pytest.mark.unit
+async def test_get_embeddings_by_hash(patched_db_handler, mock_session):
+    """Test that stored embeddings are returned keyed by chunk hash"""
+    mock_session.exec.return_value.all.return_value = [("h1", [0.1, 0.2])]
+    
+    result = await patched_db_handler.get_embeddings_by_hash(["h1", "h2"])
+    
+    assert result == {"h1": [0.1, 0.2]}
+    query = mock_session.exec.call_args[0][0]
+    assert "DISTINCT ON" in str(query.compile(dialect=postgresql.dialect()))
+
+@pytest.mark.unit
+async def test_get_embeddings_by_hash_error_returns_empty(patched_db_handler, mock_session):
+    """Test that a failed lookup just means everything gets embedded"""
+    mock_session.exec.side_effect = Exception("Database error")
+    
+    assert await patched_db_handler.get_embeddings_by_hash(["h1"]) == {}
+    assert await patched_db_handler.get_embeddings_by_hash([]) == {}
+
+@pytest.mark.unit
+async def test_replace_document_chunks_exception(patched_db_handler, mock_session):
+    """Test that a failed replace raises so the document can be retried"""
+    mock_session.exec.side_effect = Exception("Database error")
+    
+    with pytest.raises(RuntimeError) as exc_info:
+        await patched_db_handler.replace_document_chunks("a.md", [])
+    
+    assert "Failed to replace document chunks" in str(exc_info.value)
+
+@pytest.mark.unit
+def test_encode_vector_accepts_text_and_arrays():
+    """Test that the binary vector encoder handles both bound text and numpy arrays"""
+    from app.db.db_handler import _encode_vector
+    
+    assert _encode_vector("[1.0,2.0]") == _encode_vector(np.array([1.0, 2.0], dtype=np.float32))
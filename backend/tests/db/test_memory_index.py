@@ -0,0 +1,100 @@
+import pytest
+import json
+import numpy as np
+from unittest.mock import Mock, AsyncMock
+
+from app.db.memory_index import MemoryVectorIndex
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def corpus_rows():
+    """Chunks as returned by DatabaseHandler.get_all_chunks"""
+    return [
+        ("Python and FastAPI", {"source": "cv.md"}, np.array([1.0, 0.0, 0.0])),
+        ("Kubernetes on AWS", {"source": "cv.md"}, np.array([0.0, 2.0, 0.0])),
+        ("Hiking and photography", {"source": "about.md"}, np.array([0.0, 0.0, 3.0])),
+    ]
+
+@pytest.fixture
+def mock_db_handler(corpus_rows):
+    """Create a mock DatabaseHandler serving the corpus"""
+    handler = Mock()
+    handler.get_all_chunks = AsyncMock(return_value=corpus_rows)
+    handler.search_similar_chunks = AsyncMock(return_value=["from postgres"])
+    return handler
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+async def test_export_and_search_top_k(tmp_path, mock_db_handler):
+    """Test that an exported index returns the nearest chunks in order"""
+    # given
+    index = MemoryVectorIndex(str(tmp_path))
+    await index.export(mock_db_handler)
+
+    # when
+    results = await index.search_similar_chunks([0.1, 0.9, 0.2], limit=2)
+
+    # then
+    assert [chunk.content for chunk in results] == ["Kubernetes on AWS", "Hiking and photography"]
+    assert results[0].doc_metadata == {"source": "cv.md"}
+    assert results[0].similarity > results[1].similarity
+    # Rows are stored unit length, so similarity is cosine
+    assert results[0].similarity == pytest.approx(0.9 / np.linalg.norm([0.1, 0.9, 0.2]), rel=1e-5)
+
+@pytest.mark.unit
+async def test_export_writes_float32_matrix_and_manifest(tmp_path, mock_db_handler):
+    """Test the on-disk layout of an exported generation"""
+    await MemoryVectorIndex(str(tmp_path)).export(mock_db_handler)
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert manifest["rows"] == 3 and manifest["dims"] == 3
+    matrix = np.fromfile(tmp_path / manifest["matrix"], dtype=np.float32).reshape(3, 3)
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+
+@pytest.mark.unit
+async def test_search_reloads_after_reexport(tmp_path, mock_db_handler, corpus_rows):
+    """Test that a worker picks up a new generation and old files are cleaned up"""
+    # given
+    index = MemoryVectorIndex(str(tmp_path))
+    exporter = MemoryVectorIndex(str(tmp_path))
+    await exporter.export(mock_db_handler)
+    await index.search_similar_chunks([1.0, 0.0, 0.0], limit=1)
+
+    # when
+    mock_db_handler.get_all_chunks.return_value = corpus_rows + [
+        ("Rust systems work", {"source": "new.md"}, np.array([1.0, 0.1, 0.0]))
+    ]
+    await exporter.export(mock_db_handler)
+    results = await index.search_similar_chunks([1.0, 0.1, 0.0], limit=1)
+
+    # then
+    assert results[0].content == "Rust systems work"
+    assert len(list(tmp_path.glob("embeddings-*.f32"))) == 1
+    assert len(list(tmp_path.glob("chunks-*.json"))) == 1
+
+@pytest.mark.unit
+async def test_search_falls_back_to_postgres_before_export(tmp_path, mock_db_handler):
+    """Test that Postgres answers until the first export exists"""
+    index = MemoryVectorIndex(str(tmp_path), fallback=mock_db_handler)
+
+    results = await index.search_similar_chunks([1.0, 0.0, 0.0], limit=4)
+
+    assert results == ["from postgres"]
+    mock_db_handler.search_similar_chunks.assert_awaited_once_with([1.0, 0.0, 0.0], 4)
+    assert index.exists() is False
+
+@pytest.mark.unit
+async def test_search_empty_corpus(tmp_path, mock_db_handler):
+    """Test that an exported empty corpus returns no chunks"""
+    mock_db_handler.get_all_chunks.return_value = []
+    index = MemoryVectorIndex(str(tmp_path), fallback=mock_db_handler)
+    await index.export(mock_db_handler)
+
+    assert await index.search_similar_chunks([1.0, 0.0, 0.0], limit=4) == []
+    mock_db_handler.search_similar_chunks.assert_not_called()
@@ -0,0 +1,101 @@
+import pytest
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import Mock, AsyncMock
+from prometheus_client import REGISTRY
+
+from app.logic.chat_log_writer import ChatLogWriter
+
+# ============================================================================
+# FIXTURES AND HELPERS
+# ============================================================================
+
+def chat_logs_total(result):
+    return REGISTRY.get_sample_value("chat_logs_total", {"result": result}) or 0.0
+
+@pytest.fixture
+def mock_db_handler():
+    """Create a mock DatabaseHandler with a bulk log_chats"""
+    handler = Mock()
+    handler.log_chats = AsyncMock()
+    return handler
+
+def enqueue_logs(writer, count):
+    for i in range(count):
+        writer.enqueue(f"question {i}", f"answer {i}", "test-session", datetime.now(timezone.utc))
+
+def written_batch_sizes(handler):
+    return [len(call[0][0]) for call in handler.log_chats.await_args_list]
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+async def test_flushes_full_batches(mock_db_handler):
+    """Test that queued logs are written as soon as a batch is full"""
+    # given
+    writer = ChatLogWriter(mock_db_handler, batch_size=3, flush_interval=60)
+    writer.start()
+
+    # when
+    enqueue_logs(writer, 3)
+    await asyncio.sleep(0.01)
+
+    # then
+    assert written_batch_sizes(mock_db_handler) == [3]
+    assert writer.stats()["written"] == 3
+    await writer.stop()
+
+@pytest.mark.unit
+async def test_flushes_partial_batch_after_interval(mock_db_handler):
+    """Test that a partial batch is written once the flush interval passes"""
+    writer = ChatLogWriter(mock_db_handler, batch_size=100, flush_interval=0.02)
+    writer.start()
+
+    enqueue_logs(writer, 2)
+    await asyncio.sleep(0.01)
+    assert written_batch_sizes(mock_db_handler) == []
+    await asyncio.sleep(0.05)
+
+    assert written_batch_sizes(mock_db_handler) == [2]
+    await writer.stop()
+
+@pytest.mark.unit
+async def test_stop_flushes_queued_logs(mock_db_handler):
+    """Test that logs still queued at shutdown are written in batches"""
+    writer = ChatLogWriter(mock_db_handler, batch_size=2, flush_interval=60)
+    enqueue_logs(writer, 5)
+
+    await writer.stop()
+
+    assert written_batch_sizes(mock_db_handler) == [2, 2, 1]
+    logs = [log for call in mock_db_handler.log_chats.await_args_list for log in call[0][0]]
+    assert logs[0].user_message == "question 0"
+    assert logs[0].session_id == "test-session"
+
+@pytest.mark.unit
+async def test_overflow_is_counted_not_raised(mock_db_handler):
+    """Test that a full queue drops new logs and counts them"""
+    writer = ChatLogWriter(mock_db_handler, max_queue_size=2)
+    overflowed_before = chat_logs_total("overflowed")
+
+    enqueue_logs(writer, 5)
+
+    assert writer.stats() == {"queued": 2, "written": 0, "overflowed": 3, "dropped": 0}
+    assert chat_logs_total("overflowed") == overflowed_before + 3
+
+@pytest.mark.unit
+async def test_failed_write_is_counted_as_dropped(mock_db_handler):
+    """Test that a database error drops the batch and the writer keeps going"""
+    mock_db_handler.log_chats.side_effect = [RuntimeError("Database error"), None]
+    writer = ChatLogWriter(mock_db_handler, batch_size=2, flush_interval=60)
+    enqueue_logs(writer, 4)
+    dropped_before, written_before = chat_logs_total("dropped"), chat_logs_total("written")
+
+    await writer.stop()
+
+    assert writer.stats()["dropped"] == 2
+    assert writer.stats()["written"] == 2
+    assert chat_logs_total("dropped") == dropped_before + 2
+    assert chat_logs_total("written") == written_before + 2
@@ -2,7 +2,7 @@ import pytest
 import hashlib
 import tempfile
 import os
-from unittest.mock import Mock, patch, mock_open
+from unittest.mock import Mock, AsyncMock, patch, mock_open
 
 from app.logic.document_indexer import DocumentIndexer
 
@@ -115,3 +115,57 @@ def test_text_splitter_configuration(document_indexer):
     """Test that text splitter is configured correctly"""
     assert document_indexer.text_splitter._chunk_size == 1000
     assert document_indexer.text_splitter._chunk_overlap == 200
+
+@pytest.mark.unit
+def test_split_markdown(document_indexer, sample_markdown_content):
+    """Test that split_markdown returns chunks with metadata and no embeddings"""
+    with patch.object(document_indexer.text_splitter, "split_text", return_value=["Chunk 1", "Chunk 2"]):
+        result = document_indexer.split_markdown("test.md", sample_markdown_content)
+    
+    assert [chunk["content"] for chunk in result] == ["Chunk 1", "Chunk 2"]
+    assert all("embedding" not in chunk for chunk in result)
+    assert result[0]["metadata"] == {
+        "source": "test.md",
+        "content_hash": document_indexer.calculate_content_hash(sample_markdown_content)
+    }
+    assert result[0]["chunk_hash"] == hashlib.md5("Chunk 1".encode("utf-8")).hexdigest()
+    assert result[0]["chunk_hash"] != result[1]["chunk_hash"]
+
+@pytest.mark.unit
+async def test_embed_chunks_uses_pipeline(mock_embeddings):
+    """Test that embed_chunks yields the pipeline's batches"""
+    async def run(chunks):
+        yield [{**chunks[0], "embedding": [1.0]}]
+    pipeline = Mock()
+    pipeline.run = Mock(side_effect=run)
+    indexer = DocumentIndexer(embeddings=mock_embeddings, pipeline=pipeline)
+    
+    batches = [batch async for batch in indexer.embed_chunks([{"content": "a", "metadata": {}}])]
+    
+    assert batches == [[{"content": "a", "metadata": {}, "embedding": [1.0]}]]
+
+@pytest.mark.unit
+async def test_embed_chunks_reuses_embedding_store(mock_embeddings, tmp_path):
+    """Test that stored chunks skip the pipeline and new embeddings are written back"""
+    # given
+    from app.logic.embedding_store import EmbeddingStore
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "test-model")
+    store.put_many({"known": [1.0, 2.0]})
+    pipeline = Mock()
+    async def run(chunks):
+        yield [{**chunk, "embedding": [3.0, 4.0]} for chunk in chunks]
+    pipeline.run = Mock(side_effect=run)
+    indexer = DocumentIndexer(embeddings=mock_embeddings, pipeline=pipeline, embedding_store=store)
+    chunks = [
+        {"content": "a", "chunk_hash": "known", "metadata": {}},
+        {"content": "b", "chunk_hash": "new", "metadata": {}},
+    ]
+
+    # when
+    results = [chunk async for batch in indexer.embed_chunks(chunks) for chunk in batch]
+
+    # then
+    assert [chunk["chunk_hash"] for chunk in pipeline.run.call_args[0][0]] == ["new"]
+    assert {chunk["chunk_hash"] for chunk in results} == {"known", "new"}
+    assert list(store.get_many(["new"])["new"]) == [3.0, 4.0]
+    store.close()
@@ -0,0 +1,118 @@
+import pytest
+import numpy as np
+from unittest.mock import Mock, AsyncMock
+
+from app.logic.embedding_cache import EmbeddingCache
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def mock_embeddings():
+    """Create a mock OpenAIEmbeddings"""
+    embeddings = Mock()
+    embeddings.aembed_query = AsyncMock(return_value=[0.25, 0.5, 0.75])
+    return embeddings
+
+@pytest.fixture
+def mock_redis():
+    """Create a mock async Redis client backed by a dict"""
+    store = {}
+    redis = Mock()
+    redis.store = store
+    redis.get = AsyncMock(side_effect=lambda key: store.get(key))
+    redis.set = AsyncMock(side_effect=lambda key, value, ex=None: store.__setitem__(key, value))
+    return redis
+
+@pytest.fixture
+def embedding_cache(mock_embeddings, mock_redis):
+    """Create an EmbeddingCache with mock dependencies"""
+    return EmbeddingCache(
+        embeddings=mock_embeddings,
+        redis_client=mock_redis,
+        model_name="text-embedding-3-small",
+        max_entries=2,
+        ttl_seconds=60
+    )
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_cache_key_normalizes_text_and_includes_model(embedding_cache):
+    """Test that whitespace and case differences map to the same key"""
+    key = embedding_cache.cache_key("What are your   skills?")
+
+    assert key == embedding_cache.cache_key("  what are your skills? ")
+    assert key.startswith("embedding_cache:text-embedding-3-small:")
+
+@pytest.mark.unit
+async def test_miss_embeds_and_stores_float32_bytes(embedding_cache, mock_embeddings, mock_redis):
+    """Test that a miss calls the API and writes compact float32 bytes with a TTL"""
+    result = await embedding_cache.embed_query("What are your skills?")
+
+    assert result == [0.25, 0.5, 0.75]
+    mock_embeddings.aembed_query.assert_awaited_once_with("What are your skills?")
+    key, payload = mock_redis.set.call_args[0]
+    assert payload == np.asarray([0.25, 0.5, 0.75], dtype=np.float32).tobytes()
+    assert mock_redis.set.call_args[1]["ex"] == 60
+
+@pytest.mark.unit
+async def test_local_hit_skips_redis_and_api(embedding_cache, mock_embeddings, mock_redis):
+    """Test that a repeated query is served from the in-process LRU"""
+    await embedding_cache.embed_query("What are your skills?")
+    mock_redis.get.reset_mock()
+
+    result = await embedding_cache.embed_query("what are your skills?")
+
+    assert result == [0.25, 0.5, 0.75]
+    mock_embeddings.aembed_query.assert_awaited_once()
+    mock_redis.get.assert_not_called()
+
+@pytest.mark.unit
+async def test_redis_hit_skips_api(mock_embeddings, mock_redis):
+    """Test that another process's cached vector is reused from Redis"""
+    writer = EmbeddingCache(mock_embeddings, mock_redis, "model")
+    reader = EmbeddingCache(mock_embeddings, mock_redis, "model")
+    await writer.embed_query("Where do you work?")
+
+    result = await reader.embed_query("Where do you work?")
+
+    assert result == [0.25, 0.5, 0.75]
+    mock_embeddings.aembed_query.assert_awaited_once()
+
+@pytest.mark.unit
+async def test_local_tier_is_bounded(embedding_cache):
+    """Test that the LRU evicts the least recently used entry"""
+    await embedding_cache.embed_query("first")
+    await embedding_cache.embed_query("second")
+    await embedding_cache.embed_query("first")
+    await embedding_cache.embed_query("third")
+
+    assert len(embedding_cache._local) == 2
+    assert embedding_cache.cache_key("second") not in embedding_cache._local
+    assert embedding_cache.cache_key("first") in embedding_cache._local
+
+@pytest.mark.unit
+async def test_redis_errors_fall_back_to_api(mock_embeddings):
+    """Test that Redis failures do not fail the query"""
+    redis = Mock()
+    redis.get = AsyncMock(side_effect=Exception("Redis down"))
+    redis.set = AsyncMock(side_effect=Exception("Redis down"))
+    cache = EmbeddingCache(mock_embeddings, redis, "model")
+
+    result = await cache.embed_query("hello")
+
+    assert result == [0.25, 0.5, 0.75]
+
+@pytest.mark.unit
+async def test_works_without_redis(mock_embeddings):
+    """Test that the cache degrades to a local LRU when no Redis client is given"""
+    cache = EmbeddingCache(mock_embeddings, None, "model")
+
+    await cache.embed_query("hello")
+    await cache.embed_query("hello")
+
+    mock_embeddings.aembed_query.assert_awaited_once()
@@ -0,0 +1,125 @@
+import pytest
+import asyncio
+import httpx
+from unittest.mock import Mock, AsyncMock, patch
+from openai import RateLimitError
+
+from app.logic.embedding_pipeline import EmbeddingPipeline
+
+# ============================================================================
+# FIXTURES AND HELPERS
+# ============================================================================
+
+def make_chunks(*contents):
+    return [{"content": content, "metadata": {"source": "test.md"}} for content in contents]
+
+def make_rate_limit_error():
+    response = httpx.Response(429, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return RateLimitError("Rate limit reached", response=response, body=None)
+
+@pytest.fixture
+def mock_embeddings():
+    """Create a mock OpenAIEmbeddings that embeds each text as [len(text)]"""
+    embeddings = Mock()
+    embeddings.aembed_documents = AsyncMock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+    return embeddings
+
+@pytest.fixture(autouse=True)
+def character_token_counts():
+    """Count one token per character so batch bounds are easy to reason about"""
+    with patch("app.logic.embedding_pipeline.count_tokens", side_effect=len):
+        yield
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_make_batches_respects_token_bound(mock_embeddings):
+    """Test that batches are cut before exceeding max_batch_tokens"""
+    pipeline = EmbeddingPipeline(mock_embeddings, max_batch_tokens=10)
+
+    batches = pipeline.make_batches(make_chunks("aaaa", "bbbb", "cc", "dddddd", "e" * 20))
+
+    assert [[chunk["content"] for chunk in batch] for batch in batches] == [
+        ["aaaa", "bbbb", "cc"], ["dddddd"], ["e" * 20]
+    ]
+
+@pytest.mark.unit
+def test_make_batches_respects_batch_size(mock_embeddings):
+    """Test that batches are cut at max_batch_size inputs"""
+    pipeline = EmbeddingPipeline(mock_embeddings, max_batch_size=2)
+
+    batches = pipeline.make_batches(make_chunks("a", "b", "c"))
+
+    assert [len(batch) for batch in batches] == [2, 1]
+
+@pytest.mark.unit
+async def test_run_embeds_every_chunk(mock_embeddings):
+    """Test that every chunk comes back with its embedding and metadata"""
+    pipeline = EmbeddingPipeline(mock_embeddings, max_batch_tokens=5)
+    chunks = make_chunks("one", "three", "seven!")
+
+    results = [chunk async for batch in pipeline.run(chunks) for chunk in batch]
+
+    assert sorted((chunk["content"], chunk["embedding"]) for chunk in results) == [
+        ("one", [3.0]), ("seven!", [6.0]), ("three", [5.0])
+    ]
+    assert all(chunk["metadata"] == {"source": "test.md"} for chunk in results)
+    assert mock_embeddings.aembed_documents.await_count == 3
+
+@pytest.mark.unit
+async def test_run_bounds_concurrency(mock_embeddings):
+    """Test that no more than max_concurrency batches are in flight"""
+    active, peak = 0, 0
+
+    async def slow_embed(texts):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return [[1.0] for _ in texts]
+
+    mock_embeddings.aembed_documents.side_effect = slow_embed
+    pipeline = EmbeddingPipeline(mock_embeddings, max_batch_size=1, max_concurrency=2)
+
+    batches = [batch async for batch in pipeline.run(make_chunks(*"abcdef"))]
+
+    assert len(batches) == 6
+    assert peak == 2
+
+@pytest.mark.unit
+async def test_run_retries_rate_limits_with_backoff(mock_embeddings):
+    """Test that rate-limited batches are retried after a backoff"""
+    mock_embeddings.aembed_documents.side_effect = [make_rate_limit_error(), make_rate_limit_error(), [[1.0]]]
+    pipeline = EmbeddingPipeline(mock_embeddings, base_delay=0.5)
+
+    with patch("app.logic.embedding_pipeline.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        batches = [batch async for batch in pipeline.run(make_chunks("a"))]
+
+    assert batches[0][0]["embedding"] == [1.0]
+    delays = [call[0][0] for call in mock_sleep.await_args_list]
+    assert len(delays) == 2
+    assert 0.5 <= delays[0] <= 1.0
+    assert 1.0 <= delays[1] <= 2.0
+
+@pytest.mark.unit
+async def test_run_gives_up_after_max_retries(mock_embeddings):
+    """Test that the rate limit error surfaces once retries are exhausted"""
+    mock_embeddings.aembed_documents.side_effect = make_rate_limit_error()
+    pipeline = EmbeddingPipeline(mock_embeddings, max_retries=1)
+
+    with patch("app.logic.embedding_pipeline.asyncio.sleep", new_callable=AsyncMock):
+        with pytest.raises(RateLimitError):
+            [batch async for batch in pipeline.run(make_chunks("a"))]
+
+    assert mock_embeddings.aembed_documents.await_count == 2
+
+@pytest.mark.unit
+async def test_run_with_no_chunks(mock_embeddings):
+    """Test that an empty input makes no API calls"""
+    pipeline = EmbeddingPipeline(mock_embeddings)
+
+    assert [batch async for batch in pipeline.run([])] == []
+    mock_embeddings.aembed_documents.assert_not_called()
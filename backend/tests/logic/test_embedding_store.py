@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+
+from app.logic.embedding_store import EmbeddingStore
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def store(tmp_path):
+    """Create an EmbeddingStore in a temporary directory"""
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "test-model")
+    yield store
+    store.close()
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_put_and_get_round_trip(store):
+    """Test that stored vectors come back as float32 arrays by hash"""
+    store.put_many({"h1": [0.1, 0.2], "h2": [0.3, 0.4]})
+
+    result = store.get_many(["h1", "h3"])
+
+    assert list(result) == ["h1"]
+    assert result["h1"].dtype == np.float32
+    assert np.allclose(result["h1"], [0.1, 0.2])
+
+@pytest.mark.unit
+def test_entries_are_scoped_by_model(tmp_path, store):
+    """Test that a different embedding model does not see another model's vectors"""
+    store.put_many({"h1": [0.1, 0.2]})
+    other = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "other-model")
+
+    assert other.get_many(["h1"]) == {}
+    other.close()
+
+@pytest.mark.unit
+def test_store_persists_across_instances(tmp_path, store):
+    """Test that vectors survive reopening the file, e.g. after a restart"""
+    store.put_many({"h1": [1.0, 2.0]})
+    store.close()
+
+    reopened = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "test-model")
+
+    assert np.allclose(reopened.get_many(["h1"])["h1"], [1.0, 2.0])
+    reopened.close()
+
+@pytest.mark.unit
+def test_evicts_least_recently_used_over_size_bound(tmp_path, monkeypatch):
+    """Test that the oldest unused vectors are evicted when over max_bytes"""
+    # given a store that fits two 2-dim float32 vectors
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "test-model", max_bytes=16)
+    clock = iter(range(100))
+    monkeypatch.setattr("app.logic.embedding_store.time.time", lambda: next(clock))
+    store.put_many({"old": [1.0, 1.0]})
+    store.put_many({"used": [2.0, 2.0]})
+    store.get_many(["old"])
+
+    # when
+    store.put_many({"new": [3.0, 3.0]})
+
+    # then
+    assert set(store.get_many(["old", "used", "new"])) == {"old", "new"}
+    assert store.size_bytes() == 16
+    store.close()
+
+@pytest.mark.unit
+def test_compact_applies_bound_and_vacuums(tmp_path):
+    """Test that compaction evicts down to the bound and keeps the store usable"""
+    store = EmbeddingStore(str(tmp_path / "embeddings.sqlite3"), "test-model")
+    store.put_many({f"h{i}": np.ones(256) for i in range(50)})
+    store.max_bytes = 1024 * 10
+
+    store.compact()
+
+    assert store.size_bytes() <= 1024 * 10
+    assert len(store.get_many([f"h{i}" for i in range(50)])) == 10
+    store.close()
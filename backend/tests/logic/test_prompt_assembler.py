@@ -0,0 +1,140 @@
+import pytest
+from unittest.mock import patch
+
+from app.logic.prompt_assembler import TRIM_MARKER, PromptAssembler, PromptStats
+from app.models.data_structures import Message
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def count_words(text):
+    return len(text.split())
+
+def truncate_words(text, max_tokens):
+    return " ".join(text.split()[:max_tokens])
+
+@pytest.fixture(autouse=True)
+def word_tokenizer():
+    """Count one token per word, so budgets are easy to reason about"""
+    with patch("app.logic.prompt_assembler.count_tokens", side_effect=count_words), \
+         patch("app.logic.prompt_assembler.count_tokens_cached", side_effect=count_words), \
+         patch("app.logic.prompt_assembler.truncate_to_tokens", side_effect=truncate_words):
+        yield
+
+def words(count, word="w"):
+    return " ".join([word] * count)
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_fit_message_trims_long_message():
+    """Test that a pasted wall of text is trimmed to the message budget"""
+    assembler = PromptAssembler(max_message_tokens=5)
+    stats = PromptStats()
+
+    message = assembler.fit_message(words(20), stats)
+
+    assert message == words(5) + TRIM_MARKER
+    assert stats.message_tokens == 5
+    assert stats.trimmed == 1
+
+
+@pytest.mark.unit
+def test_fit_context_drops_least_relevant_chunks():
+    """Test that chunks are kept in relevance order until the context budget is used"""
+    assembler = PromptAssembler(max_context_tokens=25, min_trim_tokens=10)
+    stats = PromptStats()
+
+    context = assembler.fit_context([words(10, "a"), words(10, "b"), words(10, "c"), words(10, "d")], 0, stats)
+
+    assert context == f"{words(10, 'a')}\n\n{words(10, 'b')}\n\n"
+    assert stats.chunks_used == 2
+    assert stats.chunks_dropped == 2
+    assert stats.context_tokens == 20
+
+
+@pytest.mark.unit
+def test_fit_context_trims_chunk_at_budget_edge():
+    """Test that the chunk at the edge is trimmed when enough of it fits"""
+    assembler = PromptAssembler(max_context_tokens=18, min_trim_tokens=5)
+    stats = PromptStats()
+
+    context = assembler.fit_context([words(10, "a"), words(10, "b")], 0, stats)
+
+    assert context.endswith(f"{words(8, 'b')}{TRIM_MARKER}\n\n")
+    assert stats.context_tokens == 18
+    assert stats.trimmed == 1
+
+
+@pytest.mark.unit
+def test_fit_context_respects_total_budget():
+    """Test that context only gets what the system prompt and message leave over"""
+    assembler = PromptAssembler(max_prompt_tokens=30, max_context_tokens=100, min_trim_tokens=100)
+    stats = PromptStats()
+
+    assembler.fit_context([words(10), words(10), words(10)], reserved_tokens=15, stats=stats)
+
+    assert stats.chunks_used == 1
+
+
+@pytest.mark.unit
+def test_fit_history_keeps_most_recent_messages():
+    """Test that the oldest history messages are dropped first and order is preserved"""
+    assembler = PromptAssembler(max_prompt_tokens=100, max_history_tokens=20, min_trim_tokens=100)
+    stats = PromptStats(system_tokens=10, message_tokens=5)
+    history = [Message(role="user", content=words(10, "old")),
+               Message(role="assistant", content=words(10, "mid")),
+               Message(role="user", content=words(10, "new"))]
+
+    kept = assembler.fit_history(history, stats)
+
+    assert [message.content for message in kept] == [words(10, "mid"), words(10, "new")]
+    assert [message.role for message in kept] == ["assistant", "user"]
+    assert stats.history_used == 2
+    assert stats.history_dropped == 1
+    assert stats.total_tokens == 10 + 20 + 5
+
+
+@pytest.mark.unit
+def test_fit_history_leaves_room_for_context():
+    """Test that retrieved context tokens are taken off the history budget"""
+    assembler = PromptAssembler(max_prompt_tokens=40, max_history_tokens=40, min_trim_tokens=100)
+    stats = PromptStats(system_tokens=10, context_tokens=15, message_tokens=5)
+    history = [Message(role="user", content=words(10, "old")),
+               Message(role="assistant", content=words(10, "new"))]
+
+    kept = assembler.fit_history(history, stats)
+
+    assert [message.content for message in kept] == [words(10, "new")]
+    assert stats.total_tokens == 10 + 15 + 10 + 5
+
+
+@pytest.mark.unit
+def test_summary_counts_against_history_budget():
+    """Test that a session summary is trimmed to the history budget and shrinks what history gets"""
+    assembler = PromptAssembler(max_prompt_tokens=100, max_history_tokens=20, min_trim_tokens=100)
+    stats = PromptStats()
+    history = [Message(role="user", content=words(10, "old")),
+               Message(role="assistant", content=words(10, "new"))]
+
+    summary = assembler.fit_summary(words(8), stats)
+    kept = assembler.fit_history(history, stats)
+
+    assert summary == words(8)
+    assert [message.content for message in kept] == [words(10, "new")]
+    assert stats.summary_tokens + stats.history_tokens == 18
+    assert assembler.fit_summary(words(30), PromptStats()).endswith(TRIM_MARKER)
+
+
+@pytest.mark.unit
+def test_fit_history_respects_message_count_limit():
+    """Test that at most max_history_messages are considered"""
+    assembler = PromptAssembler(max_history_messages=2)
+    history = [Message(role="user", content=f"message {i}") for i in range(5)]
+
+    kept = assembler.fit_history(history, PromptStats())
+
+    assert [message.content for message in kept] == ["message 3", "message 4"]
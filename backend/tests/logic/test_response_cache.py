@@ -0,0 +1,115 @@
+import pytest
+from unittest.mock import Mock, AsyncMock, MagicMock
+from prometheus_client import REGISTRY
+
+from app.logic.response_cache import SemanticResponseCache
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def lookups_total(result):
+    return REGISTRY.get_sample_value("response_cache_lookups_total", {"result": result}) or 0.0
+
+@pytest.fixture
+def mock_redis():
+    """Create a mock async Redis client backed by a dict of hashes"""
+    hashes = {}
+    redis = Mock()
+    redis.hashes = hashes
+    redis.hgetall = AsyncMock(side_effect=lambda key: dict(hashes.get(key, {})))
+    redis.hlen = AsyncMock(side_effect=lambda key: len(hashes.get(key, {})))
+
+    pipe = MagicMock()
+    pipe.hset = Mock(side_effect=lambda key, field, value: hashes.setdefault(key, {}).__setitem__(field, value))
+    pipe.execute = AsyncMock()
+    redis.pipeline = Mock(return_value=pipe)
+    pipe.__aenter__ = AsyncMock(return_value=pipe)
+    pipe.__aexit__ = AsyncMock(return_value=False)
+    redis.pipe = pipe
+    return redis
+
+@pytest.fixture
+def response_cache(mock_redis):
+    """Create a SemanticResponseCache with a mock Redis client"""
+    return SemanticResponseCache(
+        redis_client=mock_redis,
+        similarity_threshold=0.9,
+        ttl_seconds=120,
+        max_entries_per_context=2
+    )
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+async def test_lookup_hits_similar_question_with_same_context(response_cache):
+    """Test that a near-duplicate question with the same context replays the answer"""
+    await response_cache.store([1.0, 0.0, 0.0], "context", "I know Python.")
+    hits_before = lookups_total("hit")
+
+    answer = await response_cache.lookup([0.99, 0.05, 0.0], "context")
+
+    assert answer == "I know Python."
+    assert response_cache.stats() == {"hits": 1, "misses": 0}
+    assert lookups_total("hit") == hits_before + 1
+
+@pytest.mark.unit
+async def test_lookup_misses_below_threshold(response_cache):
+    """Test that dissimilar questions are not served from the cache"""
+    await response_cache.store([1.0, 0.0, 0.0], "context", "I know Python.")
+    misses_before = lookups_total("miss")
+
+    answer = await response_cache.lookup([0.0, 1.0, 0.0], "context")
+
+    assert answer is None
+    assert response_cache.stats() == {"hits": 0, "misses": 1}
+    assert lookups_total("miss") == misses_before + 1
+
+@pytest.mark.unit
+async def test_lookup_misses_with_different_context(response_cache):
+    """Test that the same question with different retrieved context is a miss"""
+    await response_cache.store([1.0, 0.0, 0.0], "old context", "Old answer")
+
+    assert await response_cache.lookup([1.0, 0.0, 0.0], "new context") is None
+
+@pytest.mark.unit
+async def test_lookup_picks_most_similar_entry(response_cache):
+    """Test that the best match above the threshold wins"""
+    await response_cache.store([1.0, 0.0, 0.0], "context", "First")
+    await response_cache.store([0.95, 0.31, 0.0], "context", "Second")
+
+    assert await response_cache.lookup([0.96, 0.28, 0.0], "context") == "Second"
+
+@pytest.mark.unit
+async def test_store_sets_ttl_and_respects_group_bound(response_cache, mock_redis):
+    """Test that entries expire and each context group stays bounded"""
+    await response_cache.store([1.0, 0.0], "context", "a")
+    await response_cache.store([0.0, 1.0], "context", "b")
+    await response_cache.store([1.0, 1.0], "context", "c")
+
+    assert len(mock_redis.hashes[response_cache.context_key("context")]) == 2
+    mock_redis.pipe.expire.assert_called_with(response_cache.context_key("context"), 120)
+
+@pytest.mark.unit
+async def test_lookup_treats_redis_errors_as_miss(response_cache, mock_redis):
+    """Test that Redis failures degrade to a miss"""
+    mock_redis.hgetall.side_effect = Exception("Redis down")
+
+    assert await response_cache.lookup([1.0, 0.0], "context") is None
+    assert response_cache.misses == 1
+
+@pytest.mark.unit
+async def test_invalidate_deletes_entry_groups(response_cache, mock_redis):
+    """Test that invalidation scans and deletes every cached group"""
+    async def scan_iter(match):
+        for key in [b"response_cache:entries:a", b"response_cache:entries:b"]:
+            yield key
+    mock_redis.scan_iter = Mock(side_effect=scan_iter)
+    mock_redis.delete = AsyncMock(return_value=1)
+
+    await response_cache.invalidate()
+
+    mock_redis.scan_iter.assert_called_once_with(match="response_cache:entries:*")
+    assert mock_redis.delete.await_count == 2
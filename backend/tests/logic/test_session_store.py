@@ -0,0 +1,153 @@
+import pytest
+import asyncio
+from unittest.mock import Mock, MagicMock, AsyncMock
+
+from app.logic.session_store import SessionStore, extractive_summarizer
+from app.models.data_structures import Message
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def redis_range(values, start, end):
+    """Python slice for Redis' inclusive start/end list indices"""
+    end = len(values) + end if end < 0 else end
+    return values[start if start >= 0 else max(0, len(values) + start):end + 1]
+
+@pytest.fixture
+def mock_redis():
+    """Create a mock async Redis client with lists, strings and pipelines backed by a dict"""
+    store, expiries = {}, {}
+    redis = Mock()
+    redis.store, redis.expiries = store, expiries
+    redis.set = AsyncMock(side_effect=lambda key, value, ex=None: store.__setitem__(key, value.encode()))
+    redis.get = AsyncMock(side_effect=lambda key: store.get(key))
+
+    def ltrim(key, start, end):
+        store[key] = redis_range(store.get(key, []), start, end)
+
+    commands = {
+        "get": lambda key: store.get(key),
+        "rpush": lambda key, *values: store.setdefault(key, []).extend(v.encode() for v in values),
+        "lrange": lambda key, start, end: redis_range(store.get(key, []), start, end),
+        "ltrim": ltrim,
+        "expire": lambda key, seconds: expiries.__setitem__(key, seconds),
+    }
+
+    def pipeline(transaction=True):
+        queued = []
+        pipe = MagicMock()
+        for name, command in commands.items():
+            setattr(pipe, name, Mock(side_effect=lambda *args, command=command: queued.append((command, args))))
+        pipe.execute = AsyncMock(side_effect=lambda: [command(*args) for command, args in queued])
+        pipe.__aenter__ = AsyncMock(return_value=pipe)
+        pipe.__aexit__ = AsyncMock(return_value=False)
+        return pipe
+
+    redis.pipeline = Mock(side_effect=pipeline)
+    return redis
+
+def turn(i):
+    return [Message(role="user", content=f"question {i}"), Message(role="assistant", content=f"answer {i}")]
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+async def test_append_and_load_round_trip(mock_redis):
+    """Test that appended turns are loaded back in order and both keys get the TTL"""
+    store = SessionStore(mock_redis, max_messages=10, ttl_seconds=60)
+
+    await store.append("s1", turn(1))
+    await store.append("s1", turn(2))
+    history = await store.load("s1")
+
+    assert [m.content for m in history.messages] == ["question 1", "answer 1", "question 2", "answer 2"]
+    assert history.summary == ""
+    assert mock_redis.expiries == {"chat_session:s1:messages": 60, "chat_session:s1:summary": 60}
+
+@pytest.mark.unit
+async def test_append_trims_and_summarizes_older_messages(mock_redis):
+    """Test that messages beyond max_messages are folded into the rolling summary"""
+    summarizer = AsyncMock(side_effect=lambda summary, messages: summary + "".join(m.content[0] for m in messages))
+    store = SessionStore(mock_redis, max_messages=2, summarizer=summarizer)
+
+    await store.append("s1", turn(1))
+    await store.append("s1", turn(2))
+    await store.append("s1", turn(3))
+    history = await store.load("s1")
+
+    assert [m.content for m in history.messages] == ["question 3", "answer 3"]
+    assert history.summary == "qaqa"
+    assert summarizer.await_count == 2
+    assert [m.content for m in summarizer.await_args.args[1]] == ["question 2", "answer 2"]
+
+@pytest.mark.unit
+async def test_background_summary_does_not_block_append(mock_redis):
+    """Test that a background fold lets append return before the summarizer finishes"""
+    release = asyncio.Event()
+
+    async def slow_summarizer(summary, messages):
+        await release.wait()
+        return summary + "".join(m.content[0] for m in messages)
+
+    store = SessionStore(mock_redis, max_messages=2, summarizer=slow_summarizer, background_summary=True)
+
+    await store.append("s1", turn(1))
+    await store.append("s1", turn(2))
+    assert (await store.load("s1")).summary == ""
+
+    release.set()
+    await store.drain()
+
+    assert (await store.load("s1")).summary == "qa"
+
+@pytest.mark.unit
+async def test_background_summaries_of_a_session_are_chained(mock_redis):
+    """Test that overlapping background folds of one session build on each other"""
+    async def summarizer(summary, messages):
+        await asyncio.sleep(0)
+        return summary + "".join(m.content[-1] for m in messages)
+
+    store = SessionStore(mock_redis, max_messages=2, summarizer=summarizer, background_summary=True)
+
+    for i in range(1, 5):
+        await store.append("s1", turn(i))
+    await store.drain()
+    history = await store.load("s1")
+
+    assert history.summary == "112233"
+    assert [m.content for m in history.messages] == ["question 4", "answer 4"]
+
+@pytest.mark.unit
+async def test_load_unknown_session_is_empty(mock_redis):
+    """Test that an unknown or expired session has no history"""
+    history = await SessionStore(mock_redis).load("missing")
+
+    assert history.messages == []
+    assert history.summary == ""
+
+@pytest.mark.unit
+async def test_redis_errors_are_not_raised():
+    """Test that a failing Redis is logged and treated as an empty history"""
+    redis = Mock()
+    redis.pipeline = Mock(side_effect=ConnectionError("down"))
+    store = SessionStore(redis)
+
+    await store.append("s1", turn(1))
+
+    assert (await store.load("s1")).messages == []
+
+@pytest.mark.unit
+async def test_extractive_summarizer_keeps_newest_lines_within_budget(monkeypatch):
+    """Test that the extractive summary clips long messages and drops the oldest lines"""
+    monkeypatch.setattr("app.logic.session_store.count_tokens", lambda text: len(text.split()))
+    monkeypatch.setattr("app.logic.session_store.truncate_to_tokens",
+                        lambda text, tokens: " ".join(text.split()[:tokens]))
+    summarize = extractive_summarizer(max_tokens=8, max_line_tokens=3)
+
+    summary = await summarize("user: first question", [Message(role="assistant", content="one two three four five"),
+                                                       Message(role="user", content="last one")])
+
+    assert summary == "assistant: one two three …\nuser: last one"
@@ -0,0 +1,48 @@
+import pytest
+from unittest.mock import Mock, patch
+
+from app.logic import tokenizer
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture(autouse=True)
+def clear_encoding_cache():
+    """Make sure each test loads the encoding afresh"""
+    tokenizer.get_encoding.cache_clear()
+    yield
+    tokenizer.get_encoding.cache_clear()
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_count_tokens_uses_cached_encoding():
+    """Test that the encoding is loaded once and reused"""
+    encoding = Mock()
+    encoding.encode = Mock(return_value=[1, 2, 3])
+    with patch("app.logic.tokenizer.tiktoken.get_encoding", return_value=encoding) as mock_get_encoding:
+        assert tokenizer.count_tokens("hello world") == 3
+        assert tokenizer.count_tokens("again") == 3
+
+    mock_get_encoding.assert_called_once_with("cl100k_base")
+
+@pytest.mark.unit
+def test_count_tokens_estimates_when_encoding_unavailable():
+    """Test that token counts are estimated when the encoding can't be loaded"""
+    with patch("app.logic.tokenizer.tiktoken.get_encoding", side_effect=Exception("offline")):
+        assert tokenizer.count_tokens("a" * 40) == 11
+
+@pytest.mark.unit
+def test_truncate_to_tokens_keeps_leading_tokens():
+    """Test that text is cut after the first max_tokens tokens"""
+    encoding = Mock()
+    encoding.encode = Mock(return_value=[1, 2, 3, 4])
+    encoding.decode = Mock(return_value="one two")
+    with patch("app.logic.tokenizer.tiktoken.get_encoding", return_value=encoding):
+        assert tokenizer.truncate_to_tokens("one two three four", 2) == "one two"
+        assert tokenizer.truncate_to_tokens("one two three four", 10) == "one two three four"
+
+    encoding.decode.assert_called_once_with([1, 2])
@@ -0,0 +1,103 @@
+import sys
+import json
+import queue
+import logging
+from unittest.mock import patch
+
+import pytest
+
+from app.logs.logger import JsonFormatter, SamplingFilter, _QueueHandler, parse_levels, resolve_level
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def make_record(level=logging.DEBUG, msg="message", args=None, **extra):
+    record = logging.LogRecord("app.test", level, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_parse_levels():
+    """Test that per-module level specs are parsed into numeric levels"""
+    levels = parse_levels("app.middleware=warning, app.db.db_handler=DEBUG,,")
+
+    assert levels == {"app.middleware": logging.WARNING, "app.db.db_handler": logging.DEBUG}
+
+
+@pytest.mark.unit
+def test_resolve_level_uses_most_specific_prefix():
+    """Test that the longest matching module prefix wins and unrelated modules use the default"""
+    levels = {"app": logging.WARNING, "app.middleware": logging.ERROR}
+
+    assert resolve_level("app.middleware.rate_limiter", "INFO", levels) == logging.ERROR
+    assert resolve_level("app.logic.chat_service", "INFO", levels) == logging.WARNING
+    assert resolve_level("application", "INFO", levels) == logging.INFO
+
+
+@pytest.mark.unit
+def test_json_formatter_includes_extra_fields():
+    """Test that JSON output carries the message and fields passed through extra"""
+    record = make_record(logging.INFO, "hello %s", ("world",), session_id="abc", sample_rate=0.5)
+
+    payload = json.loads(JsonFormatter().format(record))
+
+    assert payload["message"] == "hello world"
+    assert payload["level"] == "INFO"
+    assert payload["logger"] == "app.test"
+    assert payload["session_id"] == "abc"
+    assert "sample_rate" not in payload
+
+
+@pytest.mark.unit
+def test_sampling_filter_samples_debug_only():
+    """Test that only DEBUG records are sampled by default"""
+    sampling_filter = SamplingFilter(debug_sample_rate=0.0)
+
+    assert sampling_filter.filter(make_record(logging.INFO)) is True
+    assert sampling_filter.filter(make_record(logging.DEBUG)) is False
+
+
+@pytest.mark.unit
+def test_sampling_filter_uses_call_site_rate():
+    """Test that a per-record sample_rate overrides the default rate"""
+    sampling_filter = SamplingFilter(debug_sample_rate=1.0)
+
+    with patch("app.logs.logger.random.random", return_value=0.5):
+        assert sampling_filter.filter(make_record(sample_rate=0.1)) is False
+        assert sampling_filter.filter(make_record(sample_rate=0.9)) is True
+
+
+@pytest.mark.unit
+def test_queue_handler_drops_when_full():
+    """Test that a full queue drops records instead of blocking"""
+    handler = _QueueHandler(queue.Queue(maxsize=1))
+
+    handler.handle(make_record(logging.INFO, "first"))
+    handler.handle(make_record(logging.INFO, "second"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+@pytest.mark.unit
+def test_queue_handler_renders_message_and_exception():
+    """Test that queued records carry the merged message and traceback text"""
+    handler = _QueueHandler(queue.Queue())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("app.test", logging.ERROR, __file__, 1, "failed %d", (3,), sys.exc_info())
+
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+
+    assert queued.msg == "failed 3"
+    assert queued.args is None
+    assert queued.exc_info is None
+    assert "ValueError: boom" in queued.exc_text
@@ -0,0 +1,55 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from app.controllers.metrics_router import MetricsRouter
+from app.logs.metrics import CHAT_STAGE_SECONDS, instrument_pool, render_metrics
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_render_metrics_uses_prometheus_text_format():
+    """Test that recorded stages show up in the rendered exposition"""
+    CHAT_STAGE_SECONDS.labels("retrieve").observe(0.02)
+
+    body = render_metrics().decode()
+
+    assert "# TYPE chat_stage_seconds histogram" in body
+    assert 'chat_stage_seconds_bucket{le="0.025",stage="retrieve"}' in body
+
+
+@pytest.mark.unit
+def test_instrument_pool_tracks_checked_out_connections():
+    """Test that the pool gauges follow connection checkout and checkin"""
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=3)
+    size_before = sample("db_pool_size")
+    checked_out_before = sample("db_pool_checked_out")
+
+    instrument_pool(engine)
+    assert sample("db_pool_size") == size_before + 3
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert sample("db_pool_checked_out") == checked_out_before + 1
+    assert sample("db_pool_checked_out") == checked_out_before
+    engine.dispose()
+
+
+@pytest.mark.unit
+async def test_metrics_endpoint_serves_exposition():
+    """Test that the metrics route returns the Prometheus content type"""
+    response = await MetricsRouter()._metrics()
+
+    assert response.status_code == 200
+    assert response.media_type.startswith("text/plain")
+    assert b"chat_requests_total" in response.body or b"chat_stage_seconds" in response.body
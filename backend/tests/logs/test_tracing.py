@@ -0,0 +1,116 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from app.logs.tracing import NOOP_SPAN, JsonlTraceExporter, OtlpHttpTraceExporter, Tracer, span
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def tracer():
+    """Create a tracer that samples every request and records exported traces"""
+    tracer = Tracer(Mock(), sample_rate=1.0)
+    tracer.export = Mock()
+    return tracer
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+async def test_span_is_noop_without_trace():
+    """Test that spans cost nothing when the request is not traced"""
+    with span("retrieve", limit=4) as retrieve_span:
+        retrieve_span.set(chunks=2)
+
+    assert retrieve_span is NOOP_SPAN
+    assert retrieve_span.recording is False
+
+
+@pytest.mark.unit
+async def test_unsampled_request_starts_no_trace():
+    """Test that a zero sample rate never starts a trace"""
+    assert Tracer(Mock(), sample_rate=0).start_trace("chat") is None
+
+
+@pytest.mark.unit
+async def test_spans_nest_under_open_span(tracer):
+    """Test that spans are parented to the innermost open span and carry attributes"""
+    trace = tracer.start_trace("chat", session_id="s1")
+
+    with span("retrieve") as retrieve_span:
+        with span("db.search_similar_chunks") as db_span:
+            db_span.set(rows=3)
+    trace.finish()
+
+    assert retrieve_span.parent_id == trace.root.span_id
+    assert db_span.parent_id == retrieve_span.span_id
+    assert db_span.attributes == {"rows": 3}
+    assert db_span.duration_ns is not None
+    tracer.export.assert_called_once_with(trace)
+
+
+@pytest.mark.unit
+async def test_server_timing_lists_finished_top_level_phases(tracer):
+    """Test that only finished children of the root end up in Server-Timing"""
+    trace = tracer.start_trace("chat")
+    with span("embed_query"):
+        with span("nested"):
+            pass
+    open_span = span("llm")
+    open_span.start()
+
+    phases = trace.server_timing()
+
+    assert phases.startswith("embed_query;dur=")
+    assert "nested" not in phases
+    assert "llm" not in phases
+
+
+@pytest.mark.unit
+async def test_span_records_error(tracer):
+    """Test that a failing block is marked on its span"""
+    tracer.start_trace("chat")
+
+    with pytest.raises(ValueError):
+        with span("llm") as llm_span:
+            raise ValueError("upstream failed")
+
+    assert llm_span.attributes["error"] == "ValueError('upstream failed')"
+
+
+@pytest.mark.unit
+async def test_jsonl_exporter_writes_one_line_per_trace(tmp_path, tracer):
+    """Test that traces are appended to the file as JSON lines"""
+    trace = tracer.start_trace("chat")
+    with span("retrieve"):
+        pass
+    trace.finish()
+    exporter = JsonlTraceExporter(str(tmp_path / "traces" / "traces.jsonl"))
+
+    exporter.export([trace, trace])
+
+    lines = (tmp_path / "traces" / "traces.jsonl").read_text().splitlines()
+    assert len(lines) == 2
+    assert [s["name"] for s in json.loads(lines[0])["spans"]] == ["chat", "retrieve"]
+
+
+@pytest.mark.unit
+async def test_otlp_payload(tracer):
+    """Test the OTLP/HTTP JSON encoding of spans and attributes"""
+    trace = tracer.start_trace("chat")
+    with span("retrieve", chunks=4, hit=False, ratio=0.5):
+        pass
+    trace.finish()
+
+    payload = OtlpHttpTraceExporter("http://localhost:4318/").to_otlp([trace])
+
+    root, child = payload["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert root["traceId"] == trace.trace_id and "parentSpanId" not in root
+    assert child["parentSpanId"] == root["spanId"]
+    assert {"key": "chunks", "value": {"intValue": "4"}} in child["attributes"]
+    assert {"key": "hit", "value": {"boolValue": False}} in child["attributes"]
+    assert {"key": "ratio", "value": {"doubleValue": 0.5}} in child["attributes"]
@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import patch
+
+from app.middleware.local_rate_limit import LocalRateLimitTier
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_precheck_defers_to_redis_without_budget():
+    """Test that unknown keys always go to Redis"""
+    tier = LocalRateLimitTier()
+
+    assert tier.precheck(["a"]) is None
+
+@pytest.mark.unit
+def test_budget_is_a_share_of_headroom():
+    """Test that the local budget shrinks with the Redis headroom"""
+    tier = LocalRateLimitTier(budget_fraction=0.5, sync_interval=60)
+
+    tier.record(["a"], None, 0, [4])
+    assert [tier.precheck(["a"]) for _ in range(3)] == [(None, 0), (None, 0), None]
+    assert tier.take_pending(["a"]) == [2]
+
+    # Near the threshold there is no local budget, so every request syncs
+    tier.record(["a"], None, 0, [1])
+    assert tier.precheck(["a"]) is None
+
+@pytest.mark.unit
+def test_budget_requires_every_key():
+    """Test that a request is only admitted locally when all its limits have budget"""
+    tier = LocalRateLimitTier(budget_fraction=1.0, sync_interval=60)
+    tier.record(["global"], None, 0, [10])
+
+    assert tier.precheck(["global", "chat:ip"]) is None
+    assert tier.take_pending(["global", "chat:ip"]) == [0, 0]
+
+@pytest.mark.unit
+def test_budget_expires_after_sync_interval():
+    """Test that local admission stops once the sync interval has passed"""
+    tier = LocalRateLimitTier(budget_fraction=1.0, sync_interval=1.0)
+    with patch("app.middleware.local_rate_limit.time.monotonic", return_value=100.0):
+        tier.record(["a"], None, 0, [10])
+    with patch("app.middleware.local_rate_limit.time.monotonic", return_value=101.5):
+        assert tier.precheck(["a"]) is None
+
+@pytest.mark.unit
+def test_denial_is_cached_until_retry_after():
+    """Test that a denied key is rejected locally, then handed back to Redis"""
+    tier = LocalRateLimitTier()
+    with patch("app.middleware.local_rate_limit.time.monotonic", return_value=100.0):
+        tier.record(["global", "chat:ip"], 1, 30, [50, 0])
+    with patch("app.middleware.local_rate_limit.time.monotonic", return_value=110.0):
+        assert tier.precheck(["global", "chat:ip"]) == (1, 20)
+    with patch("app.middleware.local_rate_limit.time.monotonic", return_value=131.0):
+        assert tier.precheck(["global", "chat:ip"]) is None
+
+@pytest.mark.unit
+def test_restore_pending_after_failed_sync():
+    """Test that locally admitted counts survive a failed Redis call"""
+    tier = LocalRateLimitTier()
+
+    tier.restore_pending(["a", "b"], [3, 0])
+
+    assert tier.take_pending(["a", "b"]) == [3, 0]
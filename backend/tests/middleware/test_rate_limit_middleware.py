@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import Mock, AsyncMock
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def mock_rate_limiter():
+    """Create a mock RateLimiter that allows every request"""
+    limiter = Mock()
+    limiter.check_rate_limit = AsyncMock(return_value=None)
+    return limiter
+
+@pytest.fixture
+def client(mock_rate_limiter):
+    """Create a test app with a plain and a streaming endpoint behind the middleware"""
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/chat")
+    async def chat():
+        async def stream():
+            for token in ["Hello", " there"]:
+                yield token
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    app.add_middleware(RateLimitMiddleware, rate_limiter=mock_rate_limiter)
+    return TestClient(app)
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_allowed_request_passes_through(client, mock_rate_limiter):
+    """Test that an allowed request reaches the app unchanged"""
+    response = client.get("/health")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "healthy"}
+    request = mock_rate_limiter.check_rate_limit.call_args[0][0]
+    assert request.url.path == "/health"
+
+@pytest.mark.unit
+def test_allowed_stream_passes_through(client):
+    """Test that streamed chunks arrive as the app sent them"""
+    with client.stream("POST", "/chat") as response:
+        chunks = list(response.iter_text())
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert "".join(chunks) == "Hello there"
+
+@pytest.mark.unit
+def test_denied_request_gets_limit_response(client, mock_rate_limiter):
+    """Test that a denied request is answered by the limiter without running the app"""
+    mock_rate_limiter.check_rate_limit.return_value = Response(
+        content='{"detail": "Chat rate limit exceeded"}', media_type="application/json", status_code=429
+    )
+
+    response = client.post("/chat")
+
+    assert response.status_code == 429
+    assert response.json() == {"detail": "Chat rate limit exceeded"}
+
+@pytest.mark.unit
+async def test_non_http_scopes_bypass_limiter(mock_rate_limiter):
+    """Test that lifespan and websocket scopes are not rate limited"""
+    app = AsyncMock()
+    middleware = RateLimitMiddleware(app, rate_limiter=mock_rate_limiter)
+
+    await middleware({"type": "lifespan"}, Mock(), Mock())
+
+    app.assert_awaited_once()
+    mock_rate_limiter.check_rate_limit.assert_not_called()
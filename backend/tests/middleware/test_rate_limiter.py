@@ -1,8 +1,10 @@
+import time
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+import fakeredis
+from unittest.mock import Mock, AsyncMock, patch, MagicMock
 from fastapi import Request, Response
-from redis import Redis
 
+from app.middleware.local_rate_limit import LocalRateLimitTier
 from app.middleware.rate_limiter import RateLimiter
 from app.models.data_structures import RateLimitResponse
 
@@ -11,12 +13,15 @@ from app.models.data_structures import RateLimitResponse
 # ============================================================================
 
 @pytest.fixture
-def mock_redis():
-    """Create a mock Redis client"""
-    redis = Mock(spec=Redis)
-    redis.incr = Mock(return_value=1)  # First request, under limit
-    redis.expire = Mock()
-    redis.ttl = Mock(return_value=30)  # 30 seconds remaining
+def mock_script():
+    """Create a mock of the registered limit-checking script, allowing by default"""
+    return AsyncMock(return_value=[0, 0, 99, 9])
+
+@pytest.fixture
+def mock_redis(mock_script):
+    """Create a mock async Redis client"""
+    redis = Mock()
+    redis.register_script = Mock(return_value=mock_script)
     return redis
 
 @pytest.fixture
@@ -34,6 +39,18 @@ def rate_limiter(mock_redis, mock_limiter):
         chat_rate="10/minute"
     )
 
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze time.time, which fakeredis uses for TIME and key expiry, at the start of a minute"""
+    now = [1_000_000_020.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+@pytest.fixture
+def lua_redis(clock):
+    """Create an in-memory async Redis that runs Lua scripts"""
+    return fakeredis.FakeAsyncRedis()
+
 @pytest.fixture
 def mock_request():
     """Create a mock Request"""
@@ -84,6 +101,13 @@ def test_is_health_check():
     health_request.url.path = "/"
     assert limiter._is_health_check(health_request) is True
     
+    health_request.url.path = "/ready"
+    assert limiter._is_health_check(health_request) is True
+    
+    # Metrics scrapes are never rate limited
+    health_request.url.path = "/metrics"
+    assert limiter._is_health_check(health_request) is True
+    
     # Test non-health endpoint
     health_request.url.path = "/chat"
     assert limiter._is_health_check(health_request) is False
@@ -137,76 +161,97 @@ def test_convert_period_to_seconds():
     assert limiter._convert_period_to_seconds("unknown") == 86400  # Default to day
 
 @pytest.mark.unit
-async def test_check_limit_under_limit(rate_limiter, mock_redis):
-    """Test checking rate limit when under the limit"""
-    mock_redis.incr.return_value = 5  # Under the limit of 10
+def test_registers_script_once(mock_redis):
+    """Test that the Lua script is registered at construction, not per request"""
+    RateLimiter(mock_redis, Mock(), "100/minute", "10/minute")
+    
+    mock_redis.register_script.assert_called_once()
+    assert "INCR" in mock_redis.register_script.call_args[0][0]
+
+@pytest.mark.unit
+async def test_check_limits_under_limit(rate_limiter, mock_script):
+    """Test checking rate limits when every limit allows the request"""
+    mock_script.return_value = [0, 0, 9]
     
-    is_allowed, retry_after = await rate_limiter._check_limit("test_key", "10/minute")
+    denied, retry_after = await rate_limiter._check_limits([("test_key", "10/minute", "fixed-window")])
     
-    assert is_allowed is True
+    assert denied is None
     assert retry_after == 0
-    mock_redis.incr.assert_called_once_with("test_key")
+    mock_script.assert_awaited_once_with(keys=["test_key"], args=[0, 10, 60, 0])
 
 @pytest.mark.unit
-async def test_check_limit_over_limit(rate_limiter, mock_redis):
-    """Test checking rate limit when over the limit"""
-    mock_redis.incr.return_value = 11  # Over the limit of 10
-    mock_redis.ttl.return_value = 45  # 45 seconds remaining
+async def test_check_limits_over_limit(rate_limiter, mock_script):
+    """Test that the script's 1-based denied index and retry-after are mapped back"""
+    mock_script.return_value = [2, 45, 50, 0]
     
-    is_allowed, retry_after = await rate_limiter._check_limit("test_key", "10/minute")
+    denied, retry_after = await rate_limiter._check_limits([
+        ("a", "100/hour", "fixed-window"), ("b", "10/minute", "token-bucket")
+    ])
     
-    assert is_allowed is False
+    assert denied == 1
     assert retry_after == 45
-    mock_redis.incr.assert_called_once_with("test_key")
-    mock_redis.ttl.assert_called_once_with("test_key")
+    mock_script.assert_awaited_once_with(keys=["a", "b"], args=[0, 100, 3600, 0, 2, 10, 60, 0])
 
 @pytest.mark.unit
-async def test_check_global_limit_allowed(rate_limiter, mock_redis):
-    """Test global rate limit check when allowed"""
-    mock_redis.incr.return_value = 50  # Under the global limit
+def test_strategy_selection_and_keys(mock_redis):
+    """Test that strategies are chosen per limit and get their own keys"""
+    limiter = RateLimiter(mock_redis, Mock(), "100/minute", "10/minute", chat_strategy="sliding-window")
     
-    response = await rate_limiter._check_global_limit()
+    assert limiter.global_strategy == "fixed-window"
+    assert limiter._key("rate_limit:global", "fixed-window") == "rate_limit:global"
+    assert limiter._key("rate_limit:chat:1.2.3.4", "sliding-window") == "rate_limit:chat:1.2.3.4:sliding-window"
     
-    assert response is None
-    mock_redis.incr.assert_called_once()
-    assert "rate_limit:global" in mock_redis.incr.call_args[0]
+    with pytest.raises(ValueError):
+        RateLimiter(mock_redis, Mock(), "100/minute", "10/minute", chat_strategy="leaky")
 
 @pytest.mark.unit
-async def test_check_global_limit_exceeded(rate_limiter, mock_redis):
-    """Test global rate limit check when exceeded"""
-    mock_redis.incr.return_value = 101  # Over the global limit
-    mock_redis.ttl.return_value = 30
-    
-    response = await rate_limiter._check_global_limit()
-    
-    assert response is not None
-    assert response.status_code == 429
-    mock_redis.incr.assert_called_once()
-    mock_redis.ttl.assert_called_once()
+async def test_local_tier_skips_redis_within_budget(mock_redis, mock_script):
+    """Test that the local tier admits within budget and sends its counts on the next sync"""
+    # given a limiter whose local tier gets 10% of the reported headroom
+    limiter = RateLimiter(mock_redis, Mock(), "100/minute", "10/minute",
+                          local_tier=LocalRateLimitTier(budget_fraction=0.1, sync_interval=60))
+    limits = [("rate_limit:global", "100/minute", "fixed-window")]
+    mock_script.return_value = [0, 0, 30]
+    
+    # when
+    results = [await limiter._check_limits(limits) for _ in range(5)]
+    
+    # then the first call syncs, three are local and the fifth syncs with 3 pending
+    assert results == [(None, 0)] * 5
+    assert mock_script.await_count == 2
+    assert mock_script.call_args[1]["args"] == [0, 100, 60, 3]
 
 @pytest.mark.unit
-async def test_check_chat_limit_allowed(rate_limiter, mock_redis):
-    """Test chat rate limit check when allowed"""
-    mock_redis.incr.return_value = 5  # Under the chat limit
-    
-    response = await rate_limiter._check_chat_limit("127.0.0.1")
+async def test_local_tier_rejects_denied_client_without_redis(mock_redis, mock_script):
+    """Test that a denied client is rejected locally until its retry-after passes"""
+    limiter = RateLimiter(mock_redis, Mock(), "100/minute", "10/minute", local_tier=LocalRateLimitTier())
+    limits = [("rate_limit:global", "100/minute", "fixed-window"), ("rate_limit:chat:ip", "10/minute", "fixed-window")]
+    mock_script.return_value = [2, 30, 50, 0]
+    
+    first = await limiter._check_limits(limits)
+    second = await limiter._check_limits(limits)
+    
+    assert first == (1, 30)
+    assert second[0] == 1 and 29 <= second[1] <= 30
+    mock_script.assert_awaited_once()
+
+@pytest.mark.unit
+async def test_check_rate_limit_one_round_trip_for_chat(rate_limiter, mock_request, mock_response, mock_script):
+    """Test that global and chat limits are checked in a single script call"""
+    response = await rate_limiter.check_rate_limit(mock_request, mock_response)
     
     assert response is None
-    mock_redis.incr.assert_called_once()
-    assert "rate_limit:chat:127.0.0.1" in mock_redis.incr.call_args[0]
+    mock_script.assert_awaited_once()
+    assert mock_script.call_args[1]["keys"] == ["rate_limit:global", "rate_limit:chat:127.0.0.1"]
 
 @pytest.mark.unit
-async def test_check_chat_limit_exceeded(rate_limiter, mock_redis):
-    """Test chat rate limit check when exceeded"""
-    mock_redis.incr.return_value = 11  # Over the chat limit
-    mock_redis.ttl.return_value = 30
+async def test_check_rate_limit_non_chat_only_global(rate_limiter, mock_request, mock_response, mock_script):
+    """Test that other endpoints are only counted against the global limit"""
+    mock_request.url.path = "/api/data"
     
-    response = await rate_limiter._check_chat_limit("127.0.0.1")
+    await rate_limiter.check_rate_limit(mock_request, mock_response)
     
-    assert response is not None
-    assert response.status_code == 429
-    mock_redis.incr.assert_called_once()
-    mock_redis.ttl.assert_called_once()
+    assert mock_script.call_args[1]["keys"] == ["rate_limit:global"]
 
 @pytest.mark.unit
 def test_create_limit_response(rate_limiter):
@@ -226,19 +271,19 @@ def test_create_limit_response(rate_limiter):
     assert "30" in response.body.decode()  # retry_after value
 
 @pytest.mark.unit
-async def test_check_rate_limit_health_endpoint(rate_limiter, mock_request, mock_response):
+async def test_check_rate_limit_health_endpoint(rate_limiter, mock_request, mock_response, mock_script):
     """Test that health check endpoints bypass rate limiting"""
     mock_request.url.path = "/health"
     
     response = await rate_limiter.check_rate_limit(mock_request, mock_response)
     
     assert response is None  # No rate limit response means allowed
+    mock_script.assert_not_called()
 
 @pytest.mark.unit
-async def test_check_rate_limit_global_exceeded(rate_limiter, mock_request, mock_response, mock_redis):
+async def test_check_rate_limit_global_exceeded(rate_limiter, mock_request, mock_response, mock_script):
     """Test main rate limit check when global limit is exceeded"""
-    mock_redis.incr.return_value = 101  # Over the global limit
-    mock_redis.ttl.return_value = 30
+    mock_script.return_value = [1, 30, 0, 5]  # First limit, the global one, exceeded
     
     response = await rate_limiter.check_rate_limit(mock_request, mock_response)
     
@@ -247,24 +292,128 @@ async def test_check_rate_limit_global_exceeded(rate_limiter, mock_request, mock
     assert "Global rate limit exceeded" in response.body.decode()
 
 @pytest.mark.unit
-async def test_check_rate_limit_chat_exceeded(rate_limiter, mock_request, mock_response, mock_redis):
+async def test_check_rate_limit_chat_exceeded(rate_limiter, mock_request, mock_response, mock_script):
     """Test main rate limit check when chat limit is exceeded"""
-    # First call for global limit check (allowed)
-    # Second call for chat limit check (exceeded)
-    mock_redis.incr.side_effect = [50, 11]
-    mock_redis.ttl.return_value = 30
+    mock_script.return_value = [2, 30, 50, 0]  # Second limit, the chat one, exceeded
     
     response = await rate_limiter.check_rate_limit(mock_request, mock_response)
     
     assert response is not None
     assert response.status_code == 429
     assert "Chat rate limit exceeded" in response.body.decode()
+    assert '"retry_after":30' in response.body.decode()
 
 @pytest.mark.unit
-async def test_check_rate_limit_exception_handling(rate_limiter, mock_request, mock_response, mock_redis):
+async def test_check_rate_limit_exception_handling(rate_limiter, mock_request, mock_response, mock_script):
     """Test that exceptions in rate limiting are handled gracefully"""
-    mock_redis.incr.side_effect = Exception("Redis connection error")
+    mock_script.side_effect = Exception("Redis connection error")
     
     response = await rate_limiter.check_rate_limit(mock_request, mock_response)
     
     assert response is None  # Fail open on exceptions
+
+# ============================================================================
+# TESTS AGAINST THE REAL SCRIPT
+# ============================================================================
+
+@pytest.mark.unit
+async def test_script_fixed_window_denies_over_limit_with_ttl_retry_after(lua_redis, clock):
+    """Test that the script counts up to the limit, then denies with the key's remaining TTL"""
+    limiter = RateLimiter(lua_redis, Mock(), "100/minute", "3/minute")
+    limits = [("rate_limit:global", "100/minute", "fixed-window"), ("rate_limit:chat:ip", "3/minute", "fixed-window")]
+    
+    allowed = [await limiter._check_limits(limits) for _ in range(3)]
+    clock[0] += 20
+    denied = await limiter._check_limits(limits)
+    
+    assert allowed == [(None, 0)] * 3
+    assert denied == (1, 40)
+    assert await lua_redis.ttl("rate_limit:chat:ip") == 40
+
+@pytest.mark.unit
+async def test_script_counts_nothing_when_any_limit_denies(lua_redis, clock):
+    """Test that a denied request is not counted against any of its limits"""
+    limiter = RateLimiter(lua_redis, Mock(), "100/minute", "2/minute")
+    limits = [("rate_limit:global", "100/minute", "fixed-window"), ("rate_limit:chat:ip", "2/minute", "fixed-window")]
+    
+    results = [await limiter._check_limits(limits) for _ in range(4)]
+    
+    assert [denied for denied, _ in results] == [None, None, 1, 1]
+    assert await lua_redis.get("rate_limit:global") == b"2"
+    assert await lua_redis.get("rate_limit:chat:ip") == b"2"
+    assert await lua_redis.ttl("rate_limit:global") == 60
+
+@pytest.mark.unit
+async def test_script_reports_first_exceeded_limit_and_resets_after_window(lua_redis, clock):
+    """Test that the global limit is reported as index 0 and a new window allows again"""
+    limiter = RateLimiter(lua_redis, Mock(), "1/minute", "10/minute")
+    limits = [("rate_limit:global", "1/minute", "fixed-window"), ("rate_limit:chat:ip", "10/minute", "fixed-window")]
+    
+    first = await limiter._check_limits(limits)
+    second = await limiter._check_limits(limits)
+    clock[0] += 61
+    third = await limiter._check_limits(limits)
+    
+    assert first == (None, 0)
+    assert second == (0, 60)
+    assert third == (None, 0)
+
+@pytest.mark.unit
+async def test_script_sliding_window_smooths_boundary_burst(lua_redis, clock):
+    """Test that a burst at the end of a window still counts against the start of the next one"""
+    limiter = RateLimiter(lua_redis, Mock(), "10/minute", "10/minute", global_strategy="sliding-window")
+    limits = [("rate_limit:global:sliding-window", "10/minute", "sliding-window")]
+    clock[0] += 59
+    
+    burst = [await limiter._check_limits(limits) for _ in range(11)]
+    clock[0] += 2
+    after_boundary = await limiter._check_limits(limits)
+    clock[0] += 5
+    after_retry = await limiter._check_limits(limits)
+    
+    assert [denied for denied, _ in burst] == [None] * 10 + [0]
+    # A fixed window would allow ten more here; the weighted previous window still counts ~9.8
+    assert after_boundary == (0, 5)
+    assert after_retry == (None, 0)
+
+@pytest.mark.unit
+async def test_script_token_bucket_refills_at_the_limit_rate(lua_redis, clock):
+    """Test that a drained bucket admits one request per refill interval"""
+    limiter = RateLimiter(lua_redis, Mock(), "10/minute", "10/minute", global_strategy="token-bucket")
+    limits = [("rate_limit:global:token-bucket", "10/minute", "token-bucket")]
+    
+    burst = [await limiter._check_limits(limits) for _ in range(11)]
+    clock[0] += 6
+    refilled = [await limiter._check_limits(limits) for _ in range(2)]
+    
+    assert [denied for denied, _ in burst] == [None] * 10 + [0]
+    assert burst[-1] == (0, 6)
+    assert [denied for denied, _ in refilled] == [None, 0]
+
+@pytest.mark.unit
+@pytest.mark.parametrize("strategy", ["fixed-window", "sliding-window", "token-bucket"])
+async def test_script_charges_local_tier_pending_counts(lua_redis, clock, strategy):
+    """Test that requests admitted by the local tier are charged to Redis on the next sync"""
+    limiter = RateLimiter(lua_redis, Mock(), "10/minute", "10/minute", global_strategy=strategy,
+                          local_tier=LocalRateLimitTier(budget_fraction=0.5, sync_interval=60))
+    key = limiter._key("rate_limit:global", strategy)
+    limits = [(key, "10/minute", strategy)]
+    script = limiter.check_limits_script
+
+    async def run_script(**kwargs):
+        return await script(**kwargs)
+
+    limiter.check_limits_script = AsyncMock(side_effect=run_script)
+    
+    # The first call leaves headroom 9, so 4 requests are admitted locally before the next sync
+    results = [await limiter._check_limits(limits) for _ in range(6)]
+    
+    assert results == [(None, 0)] * 6
+    assert limiter.check_limits_script.await_count == 2
+    assert limiter.check_limits_script.call_args[1]["args"][-1] == 4
+    if strategy == "fixed-window":
+        assert await lua_redis.get(key) == b"6"
+    elif strategy == "sliding-window":
+        assert await lua_redis.hget(key, "current") == b"6"
+    else:
+        assert float(await lua_redis.hget(key, "tokens")) == 4
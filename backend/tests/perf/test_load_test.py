@@ -0,0 +1,109 @@
+import json
+import random
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+from perf.load_test import (LoadTestConfig, RequestResult, build_chat_request, compare, parse_distribution,
+                            parse_frame, run_load_test, summarize)
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def chat_app():
+    """A stand-in /chat that streams three frames, and rejects messages mentioning 'api' with 429"""
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        if "api" in body["message"].split():
+            return Response(status_code=429)
+
+        async def frames():
+            for text in ["Hello", " there", "!"]:
+                yield f"0:{json.dumps(text)}\n"
+        return StreamingResponse(frames(), media_type="text/event-stream")
+
+    return app
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_parse_distribution():
+    """Test that value:weight lists are parsed"""
+    assert parse_distribution("0:0.5, 4:0.3,10") == ([0, 4, 10], [0.5, 0.3, 1.0])
+
+
+@pytest.mark.unit
+def test_parse_frame():
+    """Test that only 0: frames yield text"""
+    assert parse_frame('0:"Hi\\n"') == "Hi\n"
+    assert parse_frame("") is None
+    assert parse_frame('2:{"x": 1}') is None
+
+
+@pytest.mark.unit
+def test_build_chat_request_is_seeded():
+    """Test that conversations follow the configured distribution and are reproducible"""
+    first = build_chat_request(random.Random(1), ([4], [1.0]), ([3], [1.0]))
+    second = build_chat_request(random.Random(1), ([4], [1.0]), ([3], [1.0]))
+
+    assert len(first["messages"]) == 4
+    assert [m["role"] for m in first["messages"]] == ["user", "assistant", "user", "assistant"]
+    assert len(first["message"].split()) == 3
+    assert first["message"] == second["message"] and first["session_id"] == second["session_id"]
+
+
+@pytest.mark.unit
+def test_summarize_rates_and_percentiles():
+    """Test that 429s and errors are reported separately from completed requests"""
+    results = [
+        RequestResult(status=200, ttft=0.1, latency=0.5, frames=3, inter_token=[0.1, 0.2]),
+        RequestResult(status=200, ttft=0.3, latency=0.7, frames=3, inter_token=[0.1]),
+        RequestResult(status=429),
+        RequestResult(error="ConnectError: refused"),
+    ]
+
+    summary = summarize(results, wall_time=2.0)
+
+    assert summary["completed"] == 2
+    assert summary["throughput_rps"] == 1.0
+    assert summary["rate_limited_rate"] == 0.25
+    assert summary["error_rate"] == 0.25
+    assert summary["ttft"]["p50"] == pytest.approx(0.2)
+    assert summary["errors"] == ["ConnectError: refused"]
+
+
+@pytest.mark.unit
+def test_compare_reports_relative_change():
+    """Test that runs are compared as relative changes"""
+    baseline = summarize([RequestResult(status=200, ttft=0.1, latency=1.0, inter_token=[0.01])], 1.0)
+    current = summarize([RequestResult(status=200, ttft=0.2, latency=1.0, inter_token=[0.01])], 1.0)
+
+    changes = compare(baseline, current)
+
+    assert changes["ttft.p50"] == 1.0
+    assert changes["latency.p99"] == 0.0
+    assert changes["error_rate"] is None
+
+
+@pytest.mark.unit
+async def test_run_load_test_against_app(chat_app):
+    """Test a full run: frames are parsed and 429s counted"""
+    config = LoadTestConfig(base_url="http://test", concurrency=4, requests=20, message_words="2:1", seed=3)
+
+    summary = await run_load_test(config, transport=httpx.ASGITransport(app=chat_app))
+
+    assert summary["requests"] == 20
+    assert summary["error_rate"] == 0.0
+    assert summary["completed"] + round(summary["rate_limited_rate"] * 20) == 20
+    assert summary["completed"] > 0
+    assert summary["ttft"]["p50"] is not None
+    assert summary["frames_per_second"] > 0
@@ -0,0 +1,93 @@
+import copy
+
+import numpy as np
+import pytest
+
+from perf.retrieval_benchmark import (exact_top_k, find_regressions, make_corpus, make_queries, recall_at_k,
+                                      run_memory)
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+@pytest.fixture
+def corpus():
+    return make_corpus(500, 32, clusters=10, seed=0)
+
+
+def make_report(recall=0.95, p99=2.0):
+    return {
+        "config": {"dims": 32, "queries": 10, "k": 5, "seed": 0},
+        "runs": [{"size": 500, "results": [
+            {"backend": "pgvector-hnsw", "params": {"ef_search": 40}, "recall_at_k": recall, "p99_ms": p99}
+        ]}],
+    }
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_make_corpus_is_seeded_and_normalized(corpus):
+    """Test that synthetic corpora are reproducible unit vectors"""
+    assert corpus.shape == (500, 32)
+    assert corpus.dtype == np.float32
+    assert np.allclose(np.linalg.norm(corpus, axis=1), 1.0, atol=1e-5)
+    assert np.array_equal(corpus, make_corpus(500, 32, clusters=10, seed=0))
+
+
+@pytest.mark.unit
+def test_exact_top_k_matches_brute_force(corpus):
+    """Test that ground truth is sorted by similarity"""
+    queries = make_queries(corpus, 3)
+
+    truth = exact_top_k(corpus, queries, 5)
+
+    for query, ids in zip(queries, truth):
+        expected = np.argsort(-(corpus @ query))[:5]
+        assert ids.tolist() == expected.tolist()
+
+
+@pytest.mark.unit
+def test_recall_at_k():
+    """Test recall as the mean share of the exact neighbours found"""
+    truth = np.array([[1, 2, 3, 4], [5, 6, 7, 8]])
+
+    assert recall_at_k([[4, 3, 2, 1], [5, 6, 0, 0]], truth) == 0.75
+
+
+@pytest.mark.unit
+def test_memory_backend_is_exact(corpus):
+    """Test that the in-memory backend reaches full recall"""
+    queries = make_queries(corpus, 20)
+    truth = exact_top_k(corpus, queries, 5)
+
+    result = run_memory(corpus, queries, truth, 5)
+
+    assert result["backend"] == "memory"
+    assert result["recall_at_k"] == 1.0
+    assert result["p99_ms"] >= result["p50_ms"] > 0
+
+
+@pytest.mark.unit
+def test_find_regressions():
+    """Test that recall drops and, when enabled, p99 growth beyond tolerance are reported, small noise is not"""
+    baseline = make_report()
+
+    assert find_regressions(baseline, make_report(recall=0.94, p99=2.2), latency_tolerance=0.25) == []
+    regressions = find_regressions(baseline, make_report(recall=0.90, p99=3.0), latency_tolerance=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("500/pgvector-hnsw/ef_search=40: recall@k")
+
+    unknown = copy.deepcopy(baseline)
+    unknown["runs"][0]["size"] = 1000
+    assert find_regressions(baseline, unknown) == []
+
+
+@pytest.mark.unit
+def test_find_regressions_ignores_latency_by_default():
+    """Test that p99 growth alone does not fail a run unless the latency check is enabled"""
+    baseline = make_report()
+
+    assert find_regressions(baseline, make_report(p99=10.0)) == []
+    assert len(find_regressions(baseline, make_report(recall=0.90, p99=10.0))) == 1
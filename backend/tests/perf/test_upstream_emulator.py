@@ -0,0 +1,80 @@
+import httpx
+import numpy as np
+import pytest
+from openai import AsyncOpenAI, RateLimitError, InternalServerError
+
+from perf.upstream_emulator import EMBEDDING_DIMENSIONS, EmulatorConfig, create_emulator, embed_text
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def make_client(config: EmulatorConfig) -> AsyncOpenAI:
+    """An AsyncOpenAI client talking to the emulator in-process"""
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_emulator(config)))
+    return AsyncOpenAI(base_url="http://emulator/v1", api_key="test", http_client=http_client, max_retries=0)
+
+
+@pytest.fixture
+def client():
+    return make_client(EmulatorConfig(ttft=0, tokens_per_second=0, embedding_latency=0, completion_tokens=5))
+
+# ============================================================================
+# TESTS
+# ============================================================================
+
+@pytest.mark.unit
+def test_embed_text_is_deterministic_and_normalized():
+    """Test that embeddings are stable unit vectors and that related texts are closer"""
+    first = embed_text("python backend engineer")
+
+    assert first.shape == (EMBEDDING_DIMENSIONS,)
+    assert np.isclose(np.linalg.norm(first), 1.0)
+    assert np.array_equal(first, embed_text("Python backend engineer"))
+    assert first @ embed_text("python backend developer") > first @ embed_text("gardening tips")
+
+
+@pytest.mark.unit
+async def test_streamed_completion(client):
+    """Test that the OpenAI client can stream a deterministic completion with usage"""
+    messages = [{"role": "user", "content": "Hello"}]
+
+    async def complete():
+        stream = await client.chat.completions.create(model="m", messages=messages, stream=True,
+                                                      stream_options={"include_usage": True})
+        deltas, usage = [], None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                deltas.append(chunk.choices[0].delta.content)
+        return deltas, usage
+
+    deltas, usage = await complete()
+    again, _ = await complete()
+
+    assert len(deltas) == 5
+    assert deltas == again
+    assert usage.completion_tokens == 5
+
+
+@pytest.mark.unit
+async def test_embeddings_endpoint(client):
+    """Test that the OpenAI client receives the emulated 1536-dim embeddings"""
+    response = await client.embeddings.create(model="text-embedding-3-small", input=["first text", "second text"])
+
+    assert [len(item.embedding) for item in response.data] == [EMBEDDING_DIMENSIONS] * 2
+    assert np.allclose(response.data[0].embedding, embed_text("first text"), atol=1e-6)
+
+
+@pytest.mark.unit
+async def test_failure_injection():
+    """Test that 429s and 500s are injected at the configured rates"""
+    rate_limited = make_client(EmulatorConfig(ttft=0, tokens_per_second=0, rate_limit_rate=1.0))
+    failing = make_client(EmulatorConfig(ttft=0, tokens_per_second=0, error_rate=1.0))
+    messages = [{"role": "user", "content": "Hello"}]
+
+    with pytest.raises(RateLimitError):
+        await rate_limited.chat.completions.create(model="m", messages=messages, stream=True)
+    with pytest.raises(InternalServerError):
+        await failing.embeddings.create(model="m", input="text")
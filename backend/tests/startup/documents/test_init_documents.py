@@ -2,6 +2,8 @@ import pytest
 from unittest.mock import Mock, patch, AsyncMock, mock_open
 from pathlib import Path
 
+from app.models.data_structures import Document
+from app.startup.documents.indexing_status import IndexingStatus
 from app.startup.documents.init_documents import init_documents
 
 # ============================================================================
@@ -12,26 +14,49 @@ from app.startup.documents.init_documents import init_documents
 def mock_document_indexer():
     """Create a mock DocumentIndexer"""
     indexer = Mock()
+    indexer.embedding_model = "test-model"
     indexer.calculate_content_hash = Mock(return_value="test_hash_123")
-    indexer.process_markdown = Mock(return_value=[
+    indexer.split_markdown = Mock(side_effect=lambda file_path, content: [
         {
             "content": "Test chunk content",
-            "embedding": [0.1, 0.2, 0.3],
-            "metadata": {"source": "test.md", "page": 1}
+            "chunk_hash": "chunk_hash_1",
+            "metadata": {"source": file_path, "page": 1}
         }
     ])
+
+    async def embed_chunks(chunks):
+        # One batch per chunk, like a pipeline with tiny batches
+        for chunk in chunks:
+            yield [{**chunk, "embedding": [0.1, 0.2, 0.3]}]
+    indexer.embed_chunks = Mock(side_effect=embed_chunks)
     return indexer
 
 @pytest.fixture
 def mock_db_handler():
     """Create a mock DatabaseHandler with async methods"""
     handler = AsyncMock()
-    handler.document_exists = AsyncMock()
-    handler.get_document_hash = AsyncMock()
     handler.delete_document_chunks = AsyncMock()
     handler.store_document_chunk = AsyncMock()
+    handler.replace_document_chunks = AsyncMock()
+    handler.refresh_vector_index = AsyncMock()
+    handler.get_embeddings_by_hash = AsyncMock(return_value={})
+    handler.get_document_manifest = AsyncMock(return_value={})
+    handler.has_chunks = AsyncMock(return_value=False)
+    handler.update_document_stat = AsyncMock()
     return handler
 
+def make_file(path, size=21, mtime=100.0):
+    """Create a mock markdown file path with stat results"""
+    mock_file_path = Mock()
+    mock_file_path.__str__ = Mock(return_value=path)
+    mock_file_path.stat.return_value = Mock(st_size=size, st_mtime=mtime)
+    return mock_file_path
+
+def manifest_entry(path, content_hash="test_hash_123", size=21, mtime=100.0, embedding_model="test-model"):
+    """Create a manifest entry as returned by get_document_manifest"""
+    return Document(source=path, size=size, mtime=mtime, content_hash=content_hash,
+                    chunk_count=1, embedding_model=embedding_model)
+
 # ============================================================================
 # TESTS
 # ============================================================================
@@ -59,7 +84,7 @@ async def test_init_documents_directory_not_exists(mock_document_indexer, mock_d
         # Verify no further processing occurred
         mock_docs_dir.glob.assert_not_called()
         mock_document_indexer.calculate_content_hash.assert_not_called()
-        mock_db_handler.document_exists.assert_not_called()
+        mock_db_handler.get_document_manifest.assert_not_called()
 
 @pytest.mark.unit
 async def test_init_documents_no_files(mock_document_indexer, mock_db_handler):
@@ -87,7 +112,7 @@ async def test_init_documents_no_files(mock_document_indexer, mock_db_handler):
         # Verify glob was called but no further processing occurred
         mock_docs_dir.glob.assert_called_once_with("*.md")
         mock_document_indexer.calculate_content_hash.assert_not_called()
-        mock_db_handler.document_exists.assert_not_called()
+        mock_db_handler.replace_document_chunks.assert_not_called()
 
 @pytest.mark.unit
 async def test_init_documents_new_file(mock_document_indexer, mock_db_handler):
@@ -96,9 +121,7 @@ async def test_init_documents_new_file(mock_document_indexer, mock_db_handler):
          patch("builtins.open", mock_open(read_data="Test markdown content")):
         
         # Create a mock file path
-        mock_file_path = Mock()
-        mock_file_path.__str__ = Mock()
-        mock_file_path.__str__.return_value = "/path/to/test.md"
+        mock_file_path = make_file("/path/to/test.md")
         
         # Setup mock docs_dir
         mock_docs_dir = Mock()
@@ -114,19 +137,27 @@ async def test_init_documents_new_file(mock_document_indexer, mock_db_handler):
         # Return mock_path when Path is instantiated
         mock_path_new.return_value = mock_path
         
-        # Setup db_handler to indicate file doesn't exist in DB
-        mock_db_handler.document_exists.return_value = False
+        # The manifest fixture is empty, so the file is new
         
         # Call the function
         await init_documents(mock_document_indexer, mock_db_handler)
         
         # Verify correct processing for a new file
+        mock_db_handler.get_document_manifest.assert_awaited_once()
         mock_document_indexer.calculate_content_hash.assert_called_once_with("Test markdown content")
-        mock_db_handler.document_exists.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.get_document_hash.assert_not_called()
         mock_db_handler.delete_document_chunks.assert_not_called()
-        mock_document_indexer.process_markdown.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.store_document_chunk.assert_called_once()
+        mock_document_indexer.split_markdown.assert_called_once_with("/path/to/test.md", "Test markdown content")
+        mock_db_handler.replace_document_chunks.assert_called_once_with("/path/to/test.md", [{
+            "content": "Test chunk content",
+            "chunk_hash": "chunk_hash_1",
+            "metadata": {"source": "/path/to/test.md", "page": 1},
+            "embedding": [0.1, 0.2, 0.3]
+        }], {
+            "size": 21,
+            "mtime": 100.0,
+            "content_hash": "test_hash_123",
+            "embedding_model": "test-model"
+        })
 
 @pytest.mark.unit
 async def test_init_documents_unchanged_file(mock_document_indexer, mock_db_handler):
@@ -135,9 +166,7 @@ async def test_init_documents_unchanged_file(mock_document_indexer, mock_db_hand
          patch("builtins.open", mock_open(read_data="Test markdown content")):
         
         # Create a mock file path
-        mock_file_path = Mock()
-        mock_file_path.__str__ = Mock()
-        mock_file_path.__str__.return_value = "/path/to/test.md"
+        mock_file_path = make_file("/path/to/test.md")
         
         # Setup mock docs_dir
         mock_docs_dir = Mock()
@@ -153,20 +182,19 @@ async def test_init_documents_unchanged_file(mock_document_indexer, mock_db_hand
         # Return mock_path when Path is instantiated
         mock_path_new.return_value = mock_path
         
-        # Setup db_handler to indicate file exists with matching hash
-        mock_db_handler.document_exists.return_value = True
-        mock_db_handler.get_document_hash.return_value = "test_hash_123"  # Same as mock_document_indexer returns
+        # Setup the manifest with the same size and mtime as the file
+        mock_db_handler.get_document_manifest.return_value = {"/path/to/test.md": manifest_entry("/path/to/test.md")}
         
         # Call the function
         await init_documents(mock_document_indexer, mock_db_handler)
         
-        # Verify file was skipped due to matching hash
-        mock_document_indexer.calculate_content_hash.assert_called_once_with("Test markdown content")
-        mock_db_handler.document_exists.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.get_document_hash.assert_called_once_with("/path/to/test.md")
+        # Verify file was skipped without being read or hashed
+        mock_document_indexer.calculate_content_hash.assert_not_called()
+        mock_db_handler.update_document_stat.assert_not_called()
         mock_db_handler.delete_document_chunks.assert_not_called()
-        mock_document_indexer.process_markdown.assert_not_called()
-        mock_db_handler.store_document_chunk.assert_not_called()
+        mock_document_indexer.split_markdown.assert_not_called()
+        mock_db_handler.replace_document_chunks.assert_not_called()
+        mock_db_handler.refresh_vector_index.assert_not_called()
 
 @pytest.mark.unit
 async def test_init_documents_modified_file(mock_document_indexer, mock_db_handler):
@@ -175,9 +203,7 @@ async def test_init_documents_modified_file(mock_document_indexer, mock_db_handl
          patch("builtins.open", mock_open(read_data="Test markdown content")):
         
         # Create a mock file path
-        mock_file_path = Mock()
-        mock_file_path.__str__ = Mock()
-        mock_file_path.__str__.return_value = "/path/to/test.md"
+        mock_file_path = make_file("/path/to/test.md")
         
         # Setup mock docs_dir
         mock_docs_dir = Mock()
@@ -193,20 +219,22 @@ async def test_init_documents_modified_file(mock_document_indexer, mock_db_handl
         # Return mock_path when Path is instantiated
         mock_path_new.return_value = mock_path
         
-        # Setup db_handler to indicate file exists with different hash
-        mock_db_handler.document_exists.return_value = True
-        mock_db_handler.get_document_hash.return_value = "different_hash_456"
+        # Setup the manifest with an older mtime and a different hash
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md", content_hash="different_hash_456", mtime=50.0)
+        }
         
         # Call the function
         await init_documents(mock_document_indexer, mock_db_handler)
         
         # Verify modified file was processed correctly
         mock_document_indexer.calculate_content_hash.assert_called_once_with("Test markdown content")
-        mock_db_handler.document_exists.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.get_document_hash.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.delete_document_chunks.assert_called_once_with("/path/to/test.md")
-        mock_document_indexer.process_markdown.assert_called_once_with("/path/to/test.md")
-        mock_db_handler.store_document_chunk.assert_called_once()
+        # Old chunks are replaced atomically rather than deleted up front
+        mock_db_handler.delete_document_chunks.assert_not_called()
+        mock_document_indexer.split_markdown.assert_called_once_with("/path/to/test.md", "Test markdown content")
+        mock_db_handler.replace_document_chunks.assert_called_once()
+        assert mock_db_handler.replace_document_chunks.call_args[0][0] == "/path/to/test.md"
+        mock_db_handler.refresh_vector_index.assert_called_once()
 
 @pytest.mark.unit
 async def test_init_documents_multiple_files(mock_document_indexer, mock_db_handler):
@@ -215,17 +243,11 @@ async def test_init_documents_multiple_files(mock_document_indexer, mock_db_hand
          patch("builtins.open", mock_open(read_data="Test markdown content")):
         
         # Create mock file paths
-        mock_file_path1 = Mock()
-        mock_file_path1.__str__ = Mock()
-        mock_file_path1.__str__.return_value = "/path/to/new.md"
+        mock_file_path1 = make_file("/path/to/new.md")
         
-        mock_file_path2 = Mock()
-        mock_file_path2.__str__ = Mock()
-        mock_file_path2.__str__.return_value = "/path/to/unchanged.md"
+        mock_file_path2 = make_file("/path/to/unchanged.md")
         
-        mock_file_path3 = Mock()
-        mock_file_path3.__str__ = Mock()
-        mock_file_path3.__str__.return_value = "/path/to/modified.md"
+        mock_file_path3 = make_file("/path/to/modified.md")
         
         # Setup mock docs_dir
         mock_docs_dir = Mock()
@@ -241,19 +263,293 @@ async def test_init_documents_multiple_files(mock_document_indexer, mock_db_hand
         # Return mock_path when Path is instantiated
         mock_path_new.return_value = mock_path
         
-        # Setup document_exists to return different values for each file
-        mock_db_handler.document_exists.side_effect = [False, True, True]
-        
-        # Setup get_document_hash to return values for the second and third files
-        mock_db_handler.get_document_hash.side_effect = ["test_hash_123", "different_hash_456"]
+        # Setup the manifest: new.md is missing, unchanged.md matches and modified.md differs
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/unchanged.md": manifest_entry("/path/to/unchanged.md"),
+            "/path/to/modified.md": manifest_entry("/path/to/modified.md", content_hash="different_hash_456", mtime=50.0)
+        }
         
         # Call the function
         await init_documents(mock_document_indexer, mock_db_handler)
         
         # Verify correct number of calls
-        assert mock_document_indexer.calculate_content_hash.call_count == 3
-        assert mock_db_handler.document_exists.call_count == 3
-        assert mock_db_handler.get_document_hash.call_count == 2
-        assert mock_db_handler.delete_document_chunks.call_count == 1
-        assert mock_document_indexer.process_markdown.call_count == 2
-        assert mock_db_handler.store_document_chunk.call_count == 2
+        assert mock_document_indexer.calculate_content_hash.call_count == 2
+        mock_db_handler.get_document_manifest.assert_awaited_once()
+        assert mock_db_handler.delete_document_chunks.call_count == 0
+        assert mock_document_indexer.split_markdown.call_count == 2
+        # Chunks from both changed files go through a single pipeline run, and
+        # the chunk text they share is embedded only once
+        mock_document_indexer.embed_chunks.assert_called_once()
+        assert len(mock_document_indexer.embed_chunks.call_args[0][0]) == 1
+        assert mock_db_handler.replace_document_chunks.call_count == 2
+        replaced_sources = {call[0][0] for call in mock_db_handler.replace_document_chunks.call_args_list}
+        assert replaced_sources == {"/path/to/new.md", "/path/to/modified.md"}
+
+@pytest.mark.unit
+async def test_init_documents_invalidates_response_cache_on_change(mock_document_indexer, mock_db_handler):
+    """Test that cached answers are dropped only when the corpus changed"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        response_cache = Mock()
+        response_cache.invalidate = AsyncMock()
+        
+        # Unchanged file keeps the cache
+        mock_db_handler.get_document_manifest.return_value = {"/path/to/test.md": manifest_entry("/path/to/test.md")}
+        await init_documents(mock_document_indexer, mock_db_handler, response_cache)
+        response_cache.invalidate.assert_not_called()
+        
+        # Modified file invalidates it
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md", content_hash="different_hash_456", mtime=50.0)
+        }
+        await init_documents(mock_document_indexer, mock_db_handler, response_cache)
+        response_cache.invalidate.assert_awaited_once()
+
+@pytest.mark.unit
+async def test_init_documents_exports_memory_index(mock_document_indexer, mock_db_handler):
+    """Test that the memory index is exported when the corpus changed or no export exists"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        memory_index = Mock()
+        memory_index.export = AsyncMock()
+        mock_db_handler.get_document_manifest.return_value = {"/path/to/test.md": manifest_entry("/path/to/test.md")}
+        
+        # Unchanged corpus with an existing export
+        memory_index.exists.return_value = True
+        await init_documents(mock_document_indexer, mock_db_handler, memory_index=memory_index)
+        memory_index.export.assert_not_called()
+        
+        # Unchanged corpus but no export yet, e.g. a fresh container
+        memory_index.exists.return_value = False
+        await init_documents(mock_document_indexer, mock_db_handler, memory_index=memory_index)
+        memory_index.export.assert_awaited_once_with(mock_db_handler)
+
+@pytest.mark.unit
+async def test_init_documents_replaces_document_once_all_chunks_embedded(mock_document_indexer, mock_db_handler):
+    """Test that a document split over several batches is written in one replace call"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_document_indexer.split_markdown.side_effect = lambda file_path, content: [
+            {"content": f"Chunk {i}", "chunk_hash": f"hash_{i}", "metadata": {"source": file_path}} for i in range(3)
+        ]
+        await init_documents(mock_document_indexer, mock_db_handler)
+        
+        mock_db_handler.replace_document_chunks.assert_called_once()
+        source, chunks, _ = mock_db_handler.replace_document_chunks.call_args[0]
+        assert source == "/path/to/test.md"
+        assert [chunk["content"] for chunk in chunks] == ["Chunk 0", "Chunk 1", "Chunk 2"]
+
+@pytest.mark.unit
+async def test_init_documents_emptied_file_clears_chunks(mock_document_indexer, mock_db_handler):
+    """Test that a modified file with no chunks left has its old chunks removed"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_document_indexer.split_markdown.side_effect = lambda file_path, content: []
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md", content_hash="different_hash_456", mtime=50.0)
+        }
+        
+        await init_documents(mock_document_indexer, mock_db_handler)
+        
+        mock_db_handler.replace_document_chunks.assert_called_once()
+        source, chunks, document = mock_db_handler.replace_document_chunks.call_args[0]
+        assert (source, chunks) == ("/path/to/test.md", [])
+        assert document["content_hash"] == "test_hash_123"
+
+@pytest.mark.unit
+async def test_init_documents_reuses_stored_embeddings(mock_document_indexer, mock_db_handler):
+    """Test that only chunks with unknown text are embedded after an edit"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_document_indexer.split_markdown.side_effect = lambda file_path, content: [
+            {"content": f"Chunk {i}", "chunk_hash": f"hash_{i}", "metadata": {"source": file_path}} for i in range(3)
+        ]
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md", content_hash="different_hash_456", mtime=50.0)
+        }
+        mock_db_handler.get_embeddings_by_hash.return_value = {"hash_0": [9.0], "hash_2": [8.0]}
+        
+        await init_documents(mock_document_indexer, mock_db_handler)
+        
+        hashes, embedding_model = mock_db_handler.get_embeddings_by_hash.call_args[0]
+        assert sorted(hashes) == ["hash_0", "hash_1", "hash_2"]
+        assert embedding_model == "test-model"
+        
+        # Only the edited chunk goes to the embedding API
+        embedded = mock_document_indexer.embed_chunks.call_args[0][0]
+        assert [chunk["content"] for chunk in embedded] == ["Chunk 1"]
+        mock_db_handler.replace_document_chunks.assert_called_once()
+        _, chunks, _ = mock_db_handler.replace_document_chunks.call_args[0]
+        assert [chunk["embedding"] for chunk in chunks] == [[9.0], [0.1, 0.2, 0.3], [8.0]]
+
+@pytest.mark.unit
+async def test_init_documents_touched_file_updates_stat(mock_document_indexer, mock_db_handler):
+    """Test that a file with a new mtime but the same content is only re-stamped"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md", mtime=200.0)
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_db_handler.get_document_manifest.return_value = {"/path/to/test.md": manifest_entry("/path/to/test.md")}
+        
+        await init_documents(mock_document_indexer, mock_db_handler)
+        
+        mock_document_indexer.calculate_content_hash.assert_called_once_with("Test markdown content")
+        mock_db_handler.update_document_stat.assert_awaited_once_with("/path/to/test.md", 21, 200.0)
+        mock_document_indexer.split_markdown.assert_not_called()
+        mock_db_handler.refresh_vector_index.assert_not_called()
+
+@pytest.mark.unit
+async def test_init_documents_reindexes_on_embedding_model_change(mock_document_indexer, mock_db_handler):
+    """Test that a document indexed with another embedding model is re-indexed"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_file_path = make_file("/path/to/test.md")
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [mock_file_path]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md", embedding_model="old-model")
+        }
+        
+        await init_documents(mock_document_indexer, mock_db_handler)
+        
+        mock_db_handler.replace_document_chunks.assert_called_once()
+        assert mock_db_handler.replace_document_chunks.call_args[0][2]["embedding_model"] == "test-model"
+
+@pytest.mark.unit
+async def test_init_documents_reports_progress(mock_document_indexer, mock_db_handler):
+    """Test that the indexing status tracks changed and indexed documents"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [make_file("/path/to/new.md"), make_file("/path/to/unchanged.md")]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/unchanged.md": manifest_entry("/path/to/unchanged.md")
+        }
+        mock_db_handler.has_chunks.return_value = True
+        status = IndexingStatus()
+        
+        await init_documents(mock_document_indexer, mock_db_handler, status=status)
+        
+        assert status.state == "ready"
+        assert status.has_previous_index is True
+        assert (status.documents_total, status.documents_changed, status.documents_indexed) == (2, 1, 1)
+
+@pytest.mark.unit
+async def test_init_documents_manifest_without_chunks_is_no_previous_index(mock_document_indexer, mock_db_handler):
+    """Test that manifest rows whose chunks are gone do not count as a servable index"""
+    with patch("pathlib.Path.__new__") as mock_path_new, \
+         patch("builtins.open", mock_open(read_data="Test markdown content")):
+        
+        mock_docs_dir = Mock()
+        mock_docs_dir.exists.return_value = True
+        mock_docs_dir.glob.return_value = [make_file("/path/to/test.md")]
+        mock_docs_dir.__truediv__ = Mock(return_value=mock_docs_dir)
+        
+        mock_path = Mock()
+        mock_path.resolve.return_value = Mock()
+        mock_path.resolve.return_value.parents = {3: mock_docs_dir}
+        mock_path_new.return_value = mock_path
+        
+        mock_db_handler.get_document_manifest.return_value = {
+            "/path/to/test.md": manifest_entry("/path/to/test.md")
+        }
+        status = IndexingStatus()
+        
+        await init_documents(mock_document_indexer, mock_db_handler, status=status)
+        
+        assert status.has_previous_index is False